@@ -0,0 +1,248 @@
+import threading
+
+import numpy
+
+import inventory
+
+# Days are counted from 1970-01-01; sales whose SaleDate SQLite cannot parse get NO_DATE
+# and are left out of every rollup
+NO_DATE = numpy.iinfo(numpy.int64).min
+
+# 1970-01-01 was a Thursday, so day 4 starts the first Monday-based week
+WEEK_OFFSET = 4
+
+PERIODS = ['day', 'week', 'month']
+
+
+# Columnar in-memory copy of Sales for time-series analytics. Sales are read in chunks
+# into NumPy arrays (SaleID, ProductID, day number, quantity); refresh() only reads
+# SaleIDs beyond the last one loaded, and reloads from scratch if sales were deleted.
+# Deletions are detected by keeping running totals of the loaded sales and comparing
+# them with the same totals over ProductSalesSummary, so a refresh costs the new sales
+# plus one pass over the summary, however long the history.
+# A reload also reads the archive partitions, so moving sales there changes nothing.
+# Only the sales of the Main location are included; other locations keep theirs in
+# databases of their own.
+# Prices come from Product on every refresh, so revenue and COGS use the current
+# UnitPrice and CostPerUnit, as the sales report does.
+#
+# Rollups bucket the sales by day, ISO week (starting Monday) or month and reduce
+# each bucket with numpy.bincount, optionally per product. They keep reading the
+# previous state while a refresh runs: rows are only ever appended past the
+# published size, and a reload fills a new buffer.
+class SalesSnapshot:
+    def __init__(self, chunk_size=100000):
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.size = 0
+        self.last_sale_id = 0
+        self.columns = numpy.empty((0, 4), dtype=numpy.int64)
+        # sale_totals() of columns[:size]
+        self.totals = (0, 0, 0, 0)
+        self.price_ids = numpy.empty(0, dtype=numpy.int64)
+        self.unit_prices = numpy.empty(0)
+        self.unit_costs = numpy.empty(0)
+
+    # Bring the snapshot up to date with the database; returns the number of sales read
+    def refresh(self, connection):
+        with self.refresh_lock:
+            # The new sales and the summary they are checked against are read in one
+            # transaction, so WAL gives both the same snapshot and a sale committed in
+            # between cannot force a full reload
+            connection.execute("BEGIN")
+            try:
+                prices = numpy.array(connection.execute('''
+                    SELECT ProductID, COALESCE(UnitPrice, 0), COALESCE(CostPerUnit, 0)
+                    FROM Product
+                    WHERE Deleted = 0
+                    ORDER BY ProductID
+                ''').fetchall(), dtype=numpy.float64).reshape(-1, 3)
+
+                # New sales are always added to the hot table; only a full load needs the archives
+                if self.size:
+                    columns, size, last_sale_id = self._append(connection, "main.Sales", self.columns, self.size,
+                                                               self.last_sale_id)
+                    totals = tuple(map(sum, zip(self.totals, sale_totals(columns[self.size:size]))))
+                    current = totals == self._summary_totals(connection)
+            finally:
+                connection.commit()
+
+            if self.size and current:
+                read = size - self.size
+            else:
+                # Outside the transaction, as reading the archives attaches them
+                columns, size, last_sale_id = self._load(connection)
+                totals = sale_totals(columns[:size])
+                read = size
+
+            with self.lock:
+                self.columns, self.size = columns, size
+                self.totals = totals
+                self.last_sale_id = last_sale_id
+                self.price_ids = prices[:, 0].astype(numpy.int64)
+                self.unit_prices = prices[:, 1]
+                self.unit_costs = prices[:, 2]
+
+            return read
+
+    # Read every sale, from the archive partitions one at a time and the hot table, into
+    # a new buffer. Returns the buffer, its filled size and the highest SaleID.
+    def _load(self, connection):
+        columns, size, last_sale_id = numpy.empty((0, 4), dtype=numpy.int64), 0, 0
+        for sales_table in inventory.sales_tables(connection, locations=False):
+            columns, size, table_last_sale_id = self._append(connection, sales_table, columns, size, 0)
+            last_sale_id = max(last_sale_id, table_last_sale_id)
+        return columns, size, last_sale_id
+
+    # Read the sales of source after last_sale_id into columns[:size], growing the buffer
+    # as needed. Returns the (possibly new) buffer, its filled size and the highest SaleID.
+    def _append(self, connection, source, columns, size, last_sale_id):
+        cursor = connection.execute(f'''
+            SELECT SaleID, ProductID, COALESCE(CAST(julianday(SaleDate) - 2440587.5 AS INTEGER), ?),
+                   COALESCE(QuantitySold, 0)
+            FROM {source}
+            WHERE SaleID > ?
+        ''', (int(NO_DATE), last_sale_id))
+
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+
+            chunk = numpy.array(rows, dtype=numpy.int64)
+            if size + len(chunk) > len(columns):
+                grown = numpy.empty((max(size + len(chunk), 2 * len(columns)), 4), dtype=numpy.int64)
+                grown[:size] = columns[:size]
+                columns = grown
+
+            columns[size:size + len(chunk)] = chunk
+            size += len(chunk)
+            last_sale_id = max(last_sale_id, int(chunk[:, 0].max()))
+
+        return columns, size, last_sale_id
+
+    # sale_totals() of all sales, from ProductSalesSummary, which the triggers keep
+    # exact. Any difference from the snapshot's totals means sales were deleted or changed.
+    def _summary_totals(self, connection):
+        return tuple(connection.execute('''
+            SELECT COALESCE(SUM(SaleCount), 0), COALESCE(SUM(TotalQuantity), 0),
+                   COALESCE(SUM(ProductID * SaleCount), 0), COALESCE(SUM(ProductID * TotalQuantity), 0)
+            FROM ProductSalesSummary
+        ''').fetchone())
+
+    # Select the sales of the current products in the date range, returning the day,
+    # product index and quantity arrays along with the price arrays they index into
+    def _select(self, date_from, date_to, product_ids):
+        with self.lock:
+            columns = self.columns[:self.size]
+            price_ids, unit_prices, unit_costs = self.price_ids, self.unit_prices, self.unit_costs
+
+        days = columns[:, 2]
+        mask = days != NO_DATE
+        if date_from:
+            mask &= days >= day_number(date_from)
+        if date_to:
+            mask &= days <= day_number(date_to)
+        if product_ids:
+            mask &= numpy.isin(columns[:, 1], numpy.array([int(product_id) for product_id in product_ids]))
+
+        # Join to Product: sales of products that no longer exist are dropped
+        selected = columns[mask]
+        index = numpy.searchsorted(price_ids, selected[:, 1])
+        index[index == len(price_ids)] = 0
+        found = price_ids[index] == selected[:, 1] if len(price_ids) else numpy.zeros(len(selected), dtype=bool)
+
+        return selected[found, 2], index[found], selected[found, 3], price_ids, unit_prices, unit_costs
+
+    # Totals per period over the range, with empty periods filled with zeros. Returns a
+    # dict of arrays: period (datetime64 start of each period), quantity, revenue, cogs, margin.
+    def rollup(self, period, date_from=None, date_to=None, product_ids=None):
+        days, index, quantities, price_ids, unit_prices, unit_costs = self._select(date_from, date_to, product_ids)
+        buckets = bucket_numbers(days, period)
+
+        first = bucket_numbers(numpy.array([day_number(date_from)]), period)[0] if date_from else (
+            buckets.min() if len(buckets) else 0)
+        last = bucket_numbers(numpy.array([day_number(date_to)]), period)[0] if date_to else (
+            buckets.max() if len(buckets) else -1)
+        length = max(int(last - first) + 1, 0)
+
+        positions = buckets - first
+        quantity = numpy.bincount(positions, weights=quantities, minlength=length)
+        revenue = numpy.bincount(positions, weights=quantities * unit_prices[index], minlength=length)
+        cogs = numpy.bincount(positions, weights=quantities * unit_costs[index], minlength=length)
+
+        return {
+            "period": bucket_starts(numpy.arange(first, first + length), period),
+            "quantity": quantity.astype(numpy.int64),
+            "revenue": revenue,
+            "cogs": cogs,
+            "margin": profit_margin(revenue, cogs),
+        }
+
+    # Totals per period and product, only for the pairs that had sales. Returns a dict of
+    # arrays sorted by period then product: period, product_id, quantity, revenue, cogs, margin.
+    def rollup_by_product(self, period, date_from=None, date_to=None, product_ids=None):
+        days, index, quantities, price_ids, unit_prices, unit_costs = self._select(date_from, date_to, product_ids)
+        buckets = bucket_numbers(days, period)
+
+        keys, inverse = numpy.unique(buckets * len(unit_prices) + index, return_inverse=True)
+        quantity = numpy.bincount(inverse, weights=quantities, minlength=len(keys))
+        revenue = numpy.bincount(inverse, weights=quantities * unit_prices[index], minlength=len(keys))
+        cogs = numpy.bincount(inverse, weights=quantities * unit_costs[index], minlength=len(keys))
+
+        return {
+            "period": bucket_starts(keys // max(len(unit_prices), 1), period),
+            "product_id": price_ids[keys % max(len(unit_prices), 1)] if len(keys) else keys,
+            "quantity": quantity.astype(numpy.int64),
+            "revenue": revenue,
+            "cogs": cogs,
+            "margin": profit_margin(revenue, cogs),
+        }
+
+
+# Number of sales, total quantity, and both weighted by ProductID (so that a sale moved
+# to another product changes them) of rows of snapshot columns, as Python ints
+def sale_totals(columns):
+    product_ids, quantities = columns[:, 1], columns[:, 3]
+    return (len(columns), int(quantities.sum()), int(product_ids.sum()), int((product_ids * quantities).sum()))
+
+
+# Day number since 1970-01-01 of a YYYY-MM-DD date
+def day_number(date_str):
+    return int(numpy.datetime64(inventory.parse_sale_date(date_str), 'D').astype(numpy.int64))
+
+
+# Period numbers (days, Monday-based weeks or months since 1970-01) of an array of day numbers
+def bucket_numbers(days, period):
+    if period == 'day':
+        return days
+    if period == 'week':
+        return (days - WEEK_OFFSET) // 7
+    if period == 'month':
+        return days.astype('datetime64[D]').astype('datetime64[M]').astype(numpy.int64)
+    raise ValueError(f"Unknown period: {period}")
+
+
+# First day of each period number, as datetime64[D]
+def bucket_starts(buckets, period):
+    if period == 'day':
+        return buckets.astype('datetime64[D]')
+    if period == 'week':
+        return (buckets * 7 + WEEK_OFFSET).astype('datetime64[D]')
+    return buckets.astype('datetime64[M]').astype('datetime64[D]')
+
+
+# Profit margin in percent, 0 where there was no revenue
+def profit_margin(revenue, cogs):
+    return numpy.divide((revenue - cogs) * 100, revenue, out=numpy.zeros_like(revenue), where=revenue != 0)
+
+
+# Trailing moving average over window periods; the first window - 1 values are NaN
+def moving_average(values, window):
+    values = numpy.asarray(values, dtype=numpy.float64)
+    averages = numpy.full(len(values), numpy.nan)
+    if window <= len(values):
+        sums = numpy.cumsum(numpy.concatenate(([0.0], values)))
+        averages[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return averages
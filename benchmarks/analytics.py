@@ -0,0 +1,101 @@
+# Vectorized rollups from analytics.SalesSnapshot against the equivalent SQL.
+#
+# Fills a scratch database with synthetic sales (see generate_data.py), then times
+# per-product daily and monthly revenue, COGS and quantity rollups as GROUP BY
+# queries over Sales joined with Product, and the same rollups from the columnar
+# snapshot: the initial load, warm rollups, and an incremental refresh after more
+# sales arrive. The two results are compared so a speedup never comes at the cost
+# of a wrong answer.
+#
+#     python benchmarks/analytics.py --sales 10000000 --products 1000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Work on a scratch database, never on the real inventory
+os.environ.setdefault("INVENTORY_DB", os.path.join(tempfile.mkdtemp(prefix="inventory-analytics-"), "analytics.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy  # noqa: E402
+
+import analytics  # noqa: E402
+import inventory  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+SQL_ROLLUPS = {
+    'day': "SaleDate",
+    'month': "strftime('%Y-%m-01', SaleDate)",
+}
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def sql_rollup(connection, period):
+    rows = connection.execute(f'''
+        SELECT {SQL_ROLLUPS[period]} as Period, Sales.ProductID, SUM(QuantitySold),
+               SUM(QuantitySold * UnitPrice), SUM(QuantitySold * CostPerUnit)
+        FROM Sales
+        INNER JOIN Product ON Sales.ProductID = Product.ProductID
+        GROUP BY Period, Sales.ProductID
+        ORDER BY Period, Sales.ProductID
+    ''').fetchall()
+    return rows
+
+
+# Check a snapshot rollup row for row against the SQL result
+def same_result(rows, rollup):
+    if len(rows) != len(rollup["quantity"]):
+        return False
+    periods, product_ids, quantities, revenues, cogs = zip(*rows) if rows else ([],) * 5
+    return (numpy.array_equal(numpy.array(periods, dtype='datetime64[D]'), rollup["period"])
+            and numpy.array_equal(product_ids, rollup["product_id"])
+            and numpy.array_equal(quantities, rollup["quantity"])
+            and numpy.allclose(revenues, rollup["revenue"]) and numpy.allclose(cogs, rollup["cogs"]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare NumPy sales rollups with SQL GROUP BY')
+    parser.add_argument('--sales', type=int, default=10000000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--new-sales', type=int, default=10000, help='sales added before the incremental refresh')
+    args = parser.parse_args()
+
+    connection = inventory.connect()
+    inventory.migrate_schema(connection)
+
+    existing = connection.execute("SELECT COUNT(*) FROM Sales").fetchone()[0]
+    if existing < args.sales:
+        products = 0 if connection.execute("SELECT COUNT(*) FROM Product").fetchone()[0] else args.products
+        _, elapsed = timed(generate, connection, products, args.sales - existing)
+        print(f"populated {args.sales - existing} sales in {elapsed:.1f}s")
+
+    ok = True
+    snapshot = analytics.SalesSnapshot()
+    read, load_time = timed(snapshot.refresh, connection)
+    print(f"snapshot load:        {read} sales in {load_time:.3f}s")
+
+    for period in SQL_ROLLUPS:
+        rows, sql_time = timed(sql_rollup, connection, period)
+        rollup, numpy_time = timed(snapshot.rollup_by_product, period)
+        _, totals_time = timed(snapshot.rollup, period)
+        matches = same_result(rows, rollup)
+        ok = ok and matches
+        print(f"{period:>5} by product:    sql {sql_time:.3f}s  numpy {numpy_time:.3f}s  "
+              f"({sql_time / numpy_time:.1f}x)  totals {totals_time:.3f}s  {'match' if matches else 'MISMATCH'}")
+
+    generate(connection, 0, args.new_sales, seed=1)
+    read, refresh_time = timed(snapshot.refresh, connection)
+    rows = sql_rollup(connection, 'month')
+    matches = same_result(rows, snapshot.rollup_by_product('month'))
+    ok = ok and matches
+    print(f"incremental refresh:  {read} new sales in {refresh_time:.3f}s  {'match' if matches else 'MISMATCH'}")
+
+    print("OK: snapshot rollups match SQL" if ok else "FAILED: snapshot rollups differ from SQL")
+    sys.exit(0 if ok else 1)
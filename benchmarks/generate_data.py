@@ -0,0 +1,121 @@
+# Reproducible synthetic inventory for benchmarks.
+#
+# Fills Product and Sales at a chosen scale with a realistic shape: product
+# popularity follows a Zipf distribution (a few products take most of the sales),
+# and daily volume grows over the period with weekend and December peaks. Sales are
+# inserted in date order, as a till would record them. The same seed always gives
+# the same data.
+#
+#     python benchmarks/generate_data.py --products 10000 --sales 10000000 --database big.db
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory  # noqa: E402
+
+# Relative sales volume Monday to Sunday
+WEEKDAY_WEIGHTS = [0.9, 0.9, 0.95, 1.0, 1.1, 1.4, 1.2]
+
+# Sales inserted per executemany call
+CHUNK_SIZE = 100000
+
+
+# Relative sales volume of each day of the period: linear growth, a weekly pattern and
+# a yearly peak around Christmas
+def day_weights(days, end, growth):
+    dates = [end - datetime.timedelta(days=days - 1 - day) for day in range(days)]
+    trend = numpy.linspace(1, growth, days)
+    weekly = numpy.array([WEEKDAY_WEIGHTS[date.weekday()] for date in dates])
+    yearly = 1 + 0.3 * numpy.cos(2 * numpy.pi * (numpy.array([date.timetuple().tm_yday for date in dates]) - 358) / 365)
+    weights = trend * weekly * yearly
+    return dates, weights / weights.sum()
+
+
+def insert_products(connection, generator, products):
+    unit_prices = numpy.round(generator.lognormal(2.5, 0.8, products), 2)
+    costs = numpy.round(unit_prices * generator.uniform(0.4, 0.8, products), 2)
+    stock = generator.integers(0, 500, products)
+    reorder_levels = generator.integers(5, 50, products)
+
+    connection.executemany('''
+        INSERT INTO Product (ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit)
+        VALUES (?, ?, ?, ?, ?)
+    ''', ((f"Product {number + 1}", *values) for number, values in
+          enumerate(zip(stock.tolist(), reorder_levels.tolist(), unit_prices.tolist(), costs.tolist()))))
+
+
+# Add products (if any) and sales to the database, sales going to all of its products.
+# The per-row summary triggers are paused and the summaries rebuilt once at the end,
+# as a bulk import does.
+def generate(connection, products, sales, seed=0, end=datetime.date(2024, 12, 31), days=1095, skew=1.1, growth=1.5):
+    generator = numpy.random.default_rng(seed)
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if products:
+            insert_products(connection, generator, products)
+            inventory.open_stock_ledger(connection)
+
+        product_ids = numpy.array([row[0] for row in connection.execute("SELECT ProductID FROM Product WHERE Deleted = 0")])
+        if sales and not len(product_ids):
+            raise ValueError("Cannot generate sales without products")
+
+        # Zipf popularity over a random ranking of the products
+        popularity = 1 / numpy.arange(1, len(product_ids) + 1) ** skew
+        popularity = popularity[generator.permutation(len(product_ids))] / popularity.sum()
+
+        dates, weights = day_weights(days, end, growth)
+        daily_sales = generator.multinomial(sales, weights)
+
+        connection.execute("UPDATE SummaryMaintenance SET Paused = 1")
+        day = 0
+        while day < days:
+            # Take whole days up to about CHUNK_SIZE sales, keeping SaleIDs in date order
+            last = min(int(numpy.searchsorted(numpy.cumsum(daily_sales[day:]), CHUNK_SIZE)) + day + 1, days)
+            counts = daily_sales[day:last]
+            sale_dates = numpy.repeat(numpy.array([date.isoformat() for date in dates[day:last]]), counts)
+            sold = generator.choice(product_ids, size=len(sale_dates), p=popularity)
+            quantities = generator.geometric(0.6, size=len(sale_dates))
+
+            connection.executemany("INSERT INTO Sales (ProductID, QuantitySold, SaleDate) VALUES (?, ?, ?)",
+                                   zip(sold.tolist(), quantities.tolist(), sale_dates.tolist()))
+            day = last
+        connection.execute("UPDATE SummaryMaintenance SET Paused = 0")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    inventory.rebuild_aggregates(connection)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fill a database with synthetic products and sales')
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), "inventory-synthetic.db"),
+                        help='database to create (must not already hold products)')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sales', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--end', default='2024-12-31', help='date of the last sales day (YYYY-MM-DD)')
+    parser.add_argument('--days', type=int, default=1095, help='length of the sales history in days')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of product popularity')
+    args = parser.parse_args()
+
+    connection = inventory.connect(args.database)
+    inventory.migrate_schema(connection)
+    if connection.execute("SELECT COUNT(*) FROM Product").fetchone()[0]:
+        sys.exit(f"{args.database} already holds products; choose a new database file")
+
+    start = time.perf_counter()
+    generate(connection, args.products, args.sales, args.seed, inventory.parse_sale_date(args.end), args.days,
+             args.skew)
+    print(f"Generated {args.products} products and {args.sales} sales in {args.database} "
+          f"in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,82 @@
+# Sales/sec with one commit per sale versus group commits through WriteBatcher.
+#
+# Each client thread records its sales one at a time and waits for each to be
+# durable before the next, like a till. Both modes use synchronous=FULL so every
+# acknowledged sale survives a crash and the comparison is like for like.
+#
+#     python benchmarks/group_commit.py --clients 16 --sales 200
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Work on a scratch database, never on the real inventory
+os.environ.setdefault("INVENTORY_DB", os.path.join(tempfile.mkdtemp(prefix="inventory-bench-"), "bench.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory  # noqa: E402
+
+
+def create_product(stock):
+    connection = inventory.connect()
+    inventory.migrate_schema(connection)
+    product_id = inventory.create_product(connection, "Benchmark Product", stock, 0, 1.0, 2.0)
+    connection.close()
+    return product_id
+
+
+# Run one thread per client, each recording sales_per_client sales; returns elapsed seconds
+def run_clients(clients, sales_per_client, record):
+    threads = [threading.Thread(target=lambda: [record() for _ in range(sales_per_client)]) for _ in range(clients)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def per_commit(clients, sales_per_client):
+    product_id = create_product(clients * sales_per_client)
+    local = threading.local()
+
+    def record():
+        if not hasattr(local, 'connection'):
+            local.connection = inventory.connect(synchronous="FULL")
+        inventory.record_sale(local.connection, product_id, 1, "2024-01-01")
+
+    return run_clients(clients, sales_per_client, record)
+
+
+def grouped(clients, sales_per_client, max_delay, max_batch):
+    product_id = create_product(clients * sales_per_client)
+    batcher = inventory.WriteBatcher(max_delay=max_delay, max_batch=max_batch)
+
+    def record():
+        batcher.submit_sale(product_id, 1, "2024-01-01").result()
+
+    try:
+        return run_clients(clients, sales_per_client, record)
+    finally:
+        batcher.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-sale commits with group commits')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--sales', type=int, default=200, help='sales per client')
+    parser.add_argument('--window-ms', type=float, default=2.0, help='group commit window')
+    parser.add_argument('--batch-size', type=int, default=1000, help='maximum sales per group commit')
+    args = parser.parse_args()
+
+    total = args.clients * args.sales
+
+    elapsed = per_commit(args.clients, args.sales)
+    print(f"per-commit: {total} sales in {elapsed:.3f}s = {total / elapsed:.0f} sales/sec")
+
+    elapsed = grouped(args.clients, args.sales, args.window_ms / 1000, args.batch_size)
+    print(f"grouped:    {total} sales in {elapsed:.3f}s = {total / elapsed:.0f} sales/sec")
@@ -0,0 +1,149 @@
+# Randomized consistency check for the trigger-maintained LowStock set and the stock ledger.
+#
+# Applies a random mix of product inserts, stock and reorder level updates, sales,
+# deletions, purges of deleted products, bulk imports and ledger snapshots,
+# single-threaded and then from concurrent writers, and compares LowStock with a
+# full scan of Product and the ledger with the stock after every step. Any
+# mismatch is printed with the seed and step that caused it.
+#
+#     python benchmarks/low_stock_consistency.py --steps 5000 --seed 42
+
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+
+# Work on a scratch database, never on the real inventory
+os.environ.setdefault("INVENTORY_DB", os.path.join(tempfile.mkdtemp(prefix="inventory-lowstock-"), "lowstock.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory  # noqa: E402
+
+
+def product_ids(connection):
+    return [row[0] for row in connection.execute("SELECT ProductID FROM Product WHERE Deleted = 0")]
+
+
+# Write a small CSV of products or sales and import it
+def bulk_import(connection, generator, kind):
+    directory = os.path.dirname(inventory.DATABASE_PATH)
+    path = os.path.join(directory, f"{kind}.csv")
+
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        ids = product_ids(connection)
+        if kind == 'products':
+            writer.writerow(["ProductName", "QuantityInStock", "ReorderLevel", "CostPerUnit", "UnitPrice"])
+            for _ in range(generator.randint(1, 20)):
+                writer.writerow(["Imported", generator.randint(0, 20), generator.randint(0, 20), 1, 2])
+        else:
+            writer.writerow(["ProductID", "QuantitySold", "SaleDate"])
+            for _ in range(generator.randint(1, 20)):
+                writer.writerow([generator.choice(ids) if ids else 1, generator.randint(1, 5), "2024-01-01"])
+
+    import_rows = inventory.import_products if kind == 'products' else inventory.import_sales
+    import_rows(connection, path, 'csv', os.path.join(directory, f"{kind}.rejects.csv"))
+
+
+# Apply one random change to the inventory
+def random_step(connection, generator):
+    ids = product_ids(connection)
+    action = generator.choice(["create", "create", "stock", "reorder", "sale", "sale", "sale", "delete", "purge",
+                              "import", "snapshot"])
+
+    if action == "create" or not ids:
+        inventory.create_product(connection, "Product", generator.randint(0, 20), generator.randint(0, 20), 1.0, 2.0)
+    elif action == "stock":
+        inventory.modify_product(connection, generator.choice(ids), quantity_in_stock=generator.randint(0, 20))
+    elif action == "reorder":
+        inventory.modify_product(connection, generator.choice(ids), reorder_level=generator.randint(0, 20))
+    elif action == "sale":
+        try:
+            inventory.record_sale(connection, generator.choice(ids), generator.randint(1, 5), "2024-01-01")
+        except ValueError:
+            pass
+    elif action == "delete":
+        inventory.remove_product(connection, generator.choice(ids))
+    elif action == "purge":
+        inventory.purge_deleted_products(connection, generator.randint(1, 10))
+    elif action == "snapshot":
+        inventory.snapshot_stock(connection, generator.randint(1, 5))
+    else:
+        bulk_import(connection, generator, generator.choice(["products", "sales"]))
+
+    return action
+
+
+def report(connection, label, full=False):
+    missing, extra = inventory.check_low_stock(connection)
+    if missing or extra:
+        print(f"FAILED after {label}: missing={missing[:10]} extra={extra[:10]}")
+        return False
+    mismatches = inventory.check_stock_ledger(connection, full)
+    if mismatches:
+        print(f"FAILED after {label}: stock ledger disagrees for {mismatches[:10]}")
+        return False
+    return True
+
+
+def sequential(connection, seed, steps):
+    generator = random.Random(seed)
+
+    for step in range(steps):
+        action = random_step(connection, generator)
+        if not report(connection, f"step {step} ({action}), seed {seed}"):
+            return False
+
+    return True
+
+
+def concurrent(seed, writers, steps):
+    failures = []
+
+    def writer(index):
+        connection = inventory.connect()
+        generator = random.Random(seed * 1000 + index)
+        for _ in range(steps):
+            try:
+                random_step(connection, generator)
+            except sqlite3.OperationalError as error:
+                failures.append(error)
+        connection.close()
+
+    threads = [threading.Thread(target=writer, args=(index,)) for index in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for error in failures[:5]:
+        print(f"writer error: {error}")
+    return not failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check LowStock against a full scan under random changes')
+    parser.add_argument('--steps', type=int, default=2000, help='sequential steps')
+    parser.add_argument('--writers', type=int, default=4, help='concurrent writer threads')
+    parser.add_argument('--concurrent-steps', type=int, default=500, help='steps per concurrent writer')
+    parser.add_argument('--seed', type=int, default=random.randrange(1 << 30))
+    args = parser.parse_args()
+
+    connection = inventory.connect()
+    inventory.migrate_schema(connection)
+
+    ok = sequential(connection, args.seed, args.steps)
+    if ok:
+        ok = concurrent(args.seed, args.writers, args.concurrent_steps)
+        ok = report(connection, f"{args.writers} concurrent writers, seed {args.seed}", full=True) and ok
+
+    count = inventory.count_reorder_alerts(connection)
+    products = connection.execute("SELECT COUNT(*) FROM Product").fetchone()[0]
+    print(f"seed={args.seed} products={products} low_stock={count}")
+    print("OK: LowStock and the stock ledger match the products" if ok
+          else "FAILED: LowStock or the stock ledger disagrees with the products")
+    sys.exit(0 if ok else 1)
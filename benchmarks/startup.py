@@ -0,0 +1,86 @@
+# Cold start time of the GUI module against a time budget.
+#
+# Each run imports main in a fresh interpreter with -X importtime, the way a till
+# starts the application, and records the wall time and the per-module import
+# costs. The slowest modules are listed so a regression can be traced to the import
+# that caused it. Exits non-zero if the median start exceeds the budget, or if a
+# heavy module such as matplotlib is loaded before it is needed.
+#
+#     python benchmarks/startup.py --runs 10 --budget-ms 500
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported on first use, not at startup
+DEFERRED_MODULES = ["matplotlib", "numpy"]
+
+STARTUP_SCRIPT = f'''
+import sys
+import main
+print(",".join(name for name in {DEFERRED_MODULES!r} if name in sys.modules))
+'''
+
+
+# Start the application once; returns (wall seconds, {module: cumulative microseconds}, deferred modules loaded)
+def start(environment):
+    began = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_SCRIPT], cwd=ROOT, env=environment,
+                            capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - began
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        imports[name.strip()] = int(cumulative)
+
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return elapsed, imports, loaded
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure application cold start time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=500, help='maximum median start time')
+    parser.add_argument('--top', type=int, default=10, help='number of slowest imports to list')
+    args = parser.parse_args()
+
+    # Work on a scratch database, never on the real inventory
+    environment = dict(os.environ)
+    environment.setdefault("INVENTORY_DB", os.path.join(tempfile.mkdtemp(prefix="inventory-startup-"), "startup.db"))
+
+    # The first start creates the schema; only starts against a current database are measured
+    start(environment)
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, imports, loaded = start(environment)
+        timings.append(elapsed)
+
+    median = statistics.median(timings)
+    print(f"runs={args.runs} median={median * 1000:.0f}ms min={min(timings) * 1000:.0f}ms "
+          f"max={max(timings) * 1000:.0f}ms budget={args.budget_ms:.0f}ms")
+
+    print("slowest imports (cumulative, last run):")
+    for name, cumulative in sorted(imports.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    ok = True
+    if loaded:
+        print(f"FAILED: imported at startup: {', '.join(loaded)}")
+        ok = False
+    if median * 1000 > args.budget_ms:
+        print("FAILED: median start time is over budget")
+        ok = False
+    if ok:
+        print("OK: start time within budget")
+
+    sys.exit(0 if ok else 1)
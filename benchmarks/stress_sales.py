@@ -0,0 +1,97 @@
+# Concurrent seller stress test for record_sale().
+#
+# Many threads or processes sell the same product one unit at a time until it runs
+# out of stock, each through its own connection. Afterwards the stock, the recorded
+# sales and the number of successful sales must all agree (no oversell, no lost
+# update), and the sales/sec throughput is reported.
+#
+#     python benchmarks/stress_sales.py --workers 16 --mode process --stock 5000
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Work on a scratch database, never on the real inventory
+os.environ.setdefault("INVENTORY_DB", os.path.join(tempfile.mkdtemp(prefix="inventory-stress-"), "stress.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory  # noqa: E402
+
+
+# Sell one unit at a time until the product is out of stock; returns (sold, busy errors)
+def sell_until_empty(product_id, quantity=1):
+    connection = inventory.connect()
+    sold = busy = 0
+
+    while True:
+        try:
+            inventory.record_sale(connection, product_id, quantity, "2024-01-01")
+            sold += quantity
+        except ValueError:
+            break
+        except sqlite3.OperationalError:
+            busy += 1
+
+    connection.close()
+    return sold, busy
+
+
+def run(workers, mode, stock):
+    connection = inventory.connect()
+    inventory.migrate_schema(connection)
+    cursor = connection.cursor()
+    cursor.execute('''
+        INSERT INTO Product (ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit)
+        VALUES ('Stress Test Product', ?, 0, 1.0, 1.0)
+    ''', (stock,))
+    product_id = cursor.lastrowid
+    connection.commit()
+
+    start = time.perf_counter()
+
+    if mode == 'process':
+        with multiprocessing.Pool(workers) as process_pool:
+            results = process_pool.map(sell_until_empty, [product_id] * workers)
+    else:
+        results = [None] * workers
+
+        def worker(index):
+            results[index] = sell_until_empty(product_id)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    elapsed = time.perf_counter() - start
+
+    cursor.execute("SELECT QuantityInStock FROM Product WHERE ProductID = ?", (product_id,))
+    remaining = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(QuantitySold), 0) FROM Sales WHERE ProductID = ?", (product_id,))
+    sale_rows, recorded = cursor.fetchone()
+    sold = sum(result[0] for result in results)
+    busy = sum(result[1] for result in results)
+
+    print(f"workers={workers} mode={mode} stock={stock}")
+    print(f"sold={sold} recorded={recorded} sale_rows={sale_rows} remaining={remaining} busy_errors={busy}")
+    print(f"elapsed={elapsed:.3f}s throughput={sale_rows / elapsed:.0f} sales/sec")
+
+    consistent = remaining == 0 and sold == recorded == stock
+    print("OK: no oversell or lost updates" if consistent else "FAILED: stock and sales disagree")
+    return consistent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stress concurrent sales against a single product')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--mode', choices=['thread', 'process'], default='thread')
+    parser.add_argument('--stock', type=int, default=2000)
+    args = parser.parse_args()
+
+    sys.exit(0 if run(args.workers, args.mode, args.stock) else 1)
@@ -0,0 +1,175 @@
+# End-to-end timings of the application's operations, written as JSON.
+#
+# Runs each operation behind the GUI against a synthetic dataset (generated once
+# with generate_data.py and reused): opening and paging the stock and sales views,
+# a product search, reorder alerts, catalog lookups, the report queries and chart,
+# recording a sale, deleting a product and purging one batch of a deleted product's
+# sales. Every run works on a fresh copy of the dataset, so the write operations
+# never change it and results from different releases stay comparable.
+#
+#     python benchmarks/suite.py --products 10000 --sales 10000000 --output results.json
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The copy of the dataset each run works on. Always a new scratch file, never the
+# INVENTORY_DB of the environment, since the dataset is copied over it.
+WORK_PATH = os.path.join(tempfile.mkdtemp(prefix="inventory-suite-"), "suite.db")
+os.environ["INVENTORY_DB"] = WORK_PATH
+sys.path.insert(0, ROOT)
+
+import inventory  # noqa: E402
+from generate_data import generate  # noqa: E402
+
+
+# Create the dataset if needed and return the number of products and sales in it
+def prepare_dataset(path, products, sales, seed):
+    connection = inventory.connect(path)
+    inventory.migrate_schema(connection)
+    if not connection.execute("SELECT COUNT(*) FROM Product").fetchone()[0]:
+        print(f"generating {products} products and {sales} sales in {path}", file=sys.stderr)
+        generate(connection, products, sales, seed)
+
+    counts = connection.execute("SELECT (SELECT COUNT(*) FROM Product), (SELECT COUNT(*) FROM Sales)").fetchone()
+    connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    connection.close()
+    return counts
+
+
+# Time function() repeat times after one untimed warm-up call; returns the summary in milliseconds
+def measure(function, repeat):
+    function()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(timings[0], 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "max_ms": round(timings[-1], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Operations run in order; the ones that write come last
+def operations(main, generator):
+    connection = main.conn
+    product_ids = [row[0] for row in connection.execute("SELECT ProductID FROM Product WHERE Deleted = 0")]
+
+    # Open a paged view as the GUI does and read its first, middle or last page
+    def open_view(table, key_column, position, **options):
+        def run():
+            query = main.PagedQuery(table, key_column, **options)
+            query.get_page({'first': 0, 'middle': query.page_count // 2, 'last': query.page_count - 1}[position])
+        return run
+
+    report = inventory.get_sales_report(connection)
+    months = [row[0] for row in report["monthly_sales"]]
+    monthly_sales = [row[1] for row in report["monthly_sales"]]
+
+    def record_sale():
+        while True:
+            product_id = generator.choice(product_ids)
+            try:
+                return inventory.record_sale(connection, product_id, 1, "2024-12-31")
+            except ValueError:
+                # Out of stock; restock it so later runs can sell it
+                inventory.modify_product(connection, product_id, quantity_in_stock=1000)
+
+    def delete_product():
+        product_id = product_ids.pop(generator.randrange(len(product_ids)))
+        inventory.remove_product(connection, product_id)
+
+    stock = {"columns": ", ".join(inventory.PRODUCT_COLUMNS), "where": "Deleted = 0"}
+    sales = {"columns": "SaleID, ProductID, QuantitySold, SaleDate", "where": main.sales_view_filter()}
+
+    return [
+        ("stock_view_first_page", open_view('Product', 'ProductID', 'first', **stock)),
+        ("stock_view_last_page", open_view('Product', 'ProductID', 'last', **stock)),
+        ("sales_view_first_page", open_view('Sales', 'SaleID', 'first', **sales)),
+        ("sales_view_middle_page", open_view('Sales', 'SaleID', 'middle', **sales)),
+        ("sales_view_last_page", open_view('Sales', 'SaleID', 'last', **sales)),
+        ("product_search", lambda: inventory.search_products(connection, f"product {generator.randrange(1, 100)}")),
+        ("reorder_alerts", lambda: inventory.get_reorder_alerts(connection)),
+        ("reorder_alert_count", lambda: inventory.count_reorder_alerts(connection)),
+        ("report_queries", lambda: inventory.get_sales_report(connection)),
+        ("report_queries_catalog", lambda: inventory.get_sales_report(connection, main.catalog)),
+        ("catalog_lookup", lambda: main.catalog.get(generator.choice(product_ids))),
+        ("report_chart", lambda: main.render_sales_chart(months, monthly_sales)),
+        ("sale_insert", record_sale),
+        ("product_delete", delete_product),
+        ("product_purge_batch", lambda: inventory.purge_deleted_products(connection)),
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the application operations and write the results as JSON')
+    parser.add_argument('--dataset', default=os.path.join(tempfile.gettempdir(), "inventory-benchmark.db"),
+                        help='synthetic database, generated if it does not exist yet')
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--sales', type=int, default=10000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per operation')
+    parser.add_argument('--only', action='append', help='run only this operation (may be repeated)')
+    parser.add_argument('--output', help='JSON file to write (default: standard output)')
+    args = parser.parse_args()
+
+    products, sales = prepare_dataset(args.dataset, args.products, args.sales, args.seed)
+
+    # main opens its connections to INVENTORY_DB on import, so the copy must be in place first
+    shutil.copyfile(args.dataset, WORK_PATH)
+    import main  # noqa: E402
+
+    generator = random.Random(args.seed)
+    results = {}
+    for name, function in operations(main, generator):
+        if args.only and name not in args.only:
+            continue
+        results[name] = measure(function, args.repeat)
+        print(f"{name:<24} median {results[name]['median_ms']:10.3f} ms  p95 {results[name]['p95_ms']:10.3f} ms",
+              file=sys.stderr)
+
+    document = {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "dataset": {"products": products, "sales": sales, "seed": args.seed},
+        "operations": results,
+    }
+
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+    shutil.rmtree(os.path.dirname(WORK_PATH), ignore_errors=True)
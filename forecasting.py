@@ -0,0 +1,145 @@
+import datetime
+import math
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+import inventory
+
+# Products fitted per worker task
+CHUNK_SIZE = 250
+
+
+# Demand forecasting and reorder point suggestions.
+#
+# Each product's daily demand is fitted with simple exponential smoothing: a smoothed
+# demand rate per day and a smoothed squared forecast error, from which the safety
+# stock follows. The fitted state is kept in ProductForecast together with the last
+# SaleID and day it includes, so a run only reads the sales recorded since the last
+# one and steps each model forward from where it stopped. Products are fitted in
+# chunks on a process pool, each worker reading the sales through its own connection.
+#
+# Sales are read together with the ones moved to the archive partitions, so archiving
+# leaves the forecasts unchanged. Only the Main location's sales are fitted.
+#
+# Sales that arrive for a day the model has already passed (late or backdated
+# entries) count as demand on the next day it fits; sales dated in the future count
+# on the as-of day.
+
+
+# Step a model over a run of days without sales. Closed form of applying the zero-demand
+# update `days` times: the level decays by (1 - alpha) per day and each day's error is
+# the level itself.
+def skip_days(level, variance, days, alpha):
+    if days <= 0:
+        return level, variance
+    decay = 1 - alpha
+    return level * decay ** days, variance * decay ** days + level ** 2 * decay ** (days - 1) * (1 - decay ** days)
+
+
+# Fold one day's demand into a model
+def observe(level, variance, demand, alpha):
+    error = demand - level
+    return level + alpha * error, (1 - alpha) * variance + alpha * error ** 2
+
+
+# Fit a group of products that share the same last SaleID and day (None for products
+# never fitted) on a worker's own connection. states is a list of (ProductID, level,
+# variance). Returns a list of (ProductID, level, variance, last day) up to as_of_day.
+def fit_products(path, states, last_sale_id, last_day, high_sale_id, as_of_day, alpha):
+    connection = inventory.connect(path)
+    try:
+        # Each archive partition is read on its own, so a day's demand is added up across them
+        quantities = {}
+        for sales_table in inventory.sales_tables(connection, locations=False):
+            for product_id, day, quantity in connection.execute(f'''
+                SELECT ProductID, MIN(MAX(CAST(julianday(SaleDate) - 1721424.5 AS INTEGER), ?), ?) AS SaleDay,
+                       SUM(QuantitySold)
+                FROM {sales_table}
+                WHERE ProductID IN ({', '.join('?' * len(states))}) AND SaleID > ? AND SaleID <= ?
+                GROUP BY ProductID, SaleDay
+            ''', (last_day + 1 if last_day is not None else 0, as_of_day, *[state[0] for state in states],
+                  last_sale_id, high_sale_id)):
+                if day is not None:
+                    quantities[product_id, day] = quantities.get((product_id, day), 0) + (quantity or 0)
+    finally:
+        connection.close()
+
+    demand = {}
+    for (product_id, day), quantity in sorted(quantities.items()):
+        demand.setdefault(product_id, []).append((day, quantity))
+
+    fitted = []
+    for product_id, level, variance in states:
+        previous_day = last_day
+        for day, quantity in demand.get(product_id, []):
+            if previous_day is None:
+                # First sale ever: start the model at that day's demand
+                level, variance, previous_day = float(quantity), 0.0, day
+                continue
+            level, variance = skip_days(level, variance, day - previous_day - 1, alpha)
+            level, variance = observe(level, variance, quantity, alpha)
+            previous_day = day
+
+        if previous_day is not None:
+            level, variance = skip_days(level, variance, as_of_day - previous_day, alpha)
+            fitted.append((product_id, level, variance, as_of_day))
+
+    return fitted
+
+
+# Safety stock, reorder point and reorder quantity for a fitted daily demand rate.
+# The reorder point covers the expected demand over the lead time plus safety stock
+# for the service level; the quantity covers order_days of demand.
+def recommend(level, variance, lead_time, service_level, order_days):
+    z = statistics.NormalDist().inv_cdf(service_level)
+    safety_stock = math.ceil(z * math.sqrt(max(variance, 0) * lead_time))
+    reorder_point = math.ceil(level * lead_time) + safety_stock
+    reorder_quantity = max(math.ceil(level * order_days), 1) if level > 0 else 0
+    return safety_stock, reorder_point, reorder_quantity
+
+
+# Bring every product's forecast up to as_of (default today) and store the suggested
+# reorder points. With full=True the models are refitted from the first sale. Returns
+# (products fitted, sales read up to SaleID).
+def update_forecasts(connection, path=inventory.DATABASE_PATH, as_of=None, alpha=0.1, lead_time=7,
+                     service_level=0.95, order_days=30, workers=None, full=False):
+    as_of_day = (inventory.parse_sale_date(as_of) if as_of else datetime.date.today()).toordinal()
+    high_sale_id = max(connection.execute(f"SELECT COALESCE(MAX(SaleID), 0) FROM {sales_table}").fetchall()[0][0]
+                       for sales_table in inventory.sales_tables(connection, locations=False))
+
+    # Group the products by where their models stopped; new products start from scratch
+    groups = {}
+    for product_id, last_sale_id, last_day, level, variance in connection.execute('''
+        SELECT Product.ProductID, ProductForecast.LastSaleID, ProductForecast.LastDay,
+               ProductForecast.DemandRate, ProductForecast.DemandVariance
+        FROM Product
+        LEFT JOIN ProductForecast ON Product.ProductID = ProductForecast.ProductID
+        WHERE Product.Deleted = 0
+    '''):
+        if full or last_sale_id is None or last_day > as_of_day:
+            last_sale_id, last_day, level, variance = 0, None, 0.0, 0.0
+        groups.setdefault((last_sale_id, last_day), []).append((product_id, level, variance))
+
+    with ProcessPoolExecutor(workers) as executor:
+        tasks = [executor.submit(fit_products, path, states[start:start + CHUNK_SIZE], last_sale_id, last_day,
+                                 high_sale_id, as_of_day, alpha)
+                 for (last_sale_id, last_day), states in groups.items()
+                 for start in range(0, len(states), CHUNK_SIZE)]
+        fitted = [row for task in tasks for row in task.result()]
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.executemany('''
+            INSERT OR REPLACE INTO ProductForecast (ProductID, LastSaleID, LastDay, DemandRate, DemandVariance,
+                                                    SafetyStock, ReorderPoint, ReorderQuantity)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(product_id, high_sale_id, last_day, level, variance,
+               *recommend(level, variance, lead_time, service_level, order_days))
+              for product_id, level, variance, last_day in fitted])
+        connection.execute("DELETE FROM ProductForecast WHERE ProductID NOT IN (SELECT ProductID FROM Product WHERE Deleted = 0)")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return len(fitted), high_sale_id
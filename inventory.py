@@ -0,0 +1,2803 @@
+import array
+import concurrent.futures
+import contextlib
+import csv
+import datetime
+import functools
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Database file, overridable for tools and benchmarks that work on a separate copy
+DATABASE_PATH = os.environ.get("INVENTORY_DB", "inventory_management.db")
+
+# Seconds a connection waits on a locked database before raising "database is locked"
+BUSY_TIMEOUT = 10
+
+
+# Open a connection to the database (creating it if it does not exist), tuned for
+# concurrent access: WAL lets readers run alongside a writer, and synchronous=NORMAL
+# only fsyncs the WAL at checkpoints. Pass synchronous="FULL" where every commit
+# must be durable before returning.
+def connect(path=DATABASE_PATH, synchronous="NORMAL"):
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                                 factory=metrics.connection_factory())
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute(f"PRAGMA synchronous = {synchronous}")
+    connection.execute("PRAGMA mmap_size = 268435456")
+    connection.execute("PRAGMA cache_size = -65536")
+    connection.execute("PRAGMA foreign_keys = ON")
+    return connection
+
+
+# Small pool of tuned connections for readers and worker threads, such as reports,
+# exports and the service. Each connection is used by one thread at a time; callers
+# block while all of them are checked out.
+class ConnectionPool:
+    def __init__(self, path=DATABASE_PATH, size=4):
+        self.path = path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def connection(self):
+        connection = self._acquire()
+        try:
+            yield connection
+        finally:
+            # Never hand a connection with an open transaction to the next caller
+            if connection.in_transaction:
+                connection.rollback()
+            self.idle.put(connection)
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.lock:
+            if self.opened < self.size:
+                self.opened += 1
+                return connect(self.path)
+
+        return self.idle.get()
+
+    def close(self):
+        with self.lock:
+            while self.opened:
+                self.idle.get().close()
+                self.opened -= 1
+
+
+# Database-wide change stamp read from PRAGMA data_version on a dedicated connection.
+# Because nothing else writes through that connection, the value changes whenever
+# any connection, in this process or another, commits a change to the database.
+# Each location's database gets a dedicated connection of its own as the location is
+# added, so the stamp also changes when a sale or transfer is committed at any
+# location, however many there are.
+class DataVersion:
+    def __init__(self, path=DATABASE_PATH):
+        self.connection = connect(path)
+        self.lock = threading.Lock()
+        self.main_version = None
+        self.shards = {}
+
+    def current(self):
+        with self.lock:
+            main_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+            if main_version != self.main_version:
+                # A location may have been added
+                for location_id, _, shard_path in get_locations(self.connection):
+                    if shard_path is not None and location_id not in self.shards:
+                        self.shards[location_id] = connect(location_path(self.connection, location_id))
+                self.main_version = main_version
+            return (main_version, *(shard.execute("PRAGMA data_version").fetchone()[0]
+                                    for shard in self.shards.values()))
+
+    def close(self):
+        for shard in self.shards.values():
+            shard.close()
+        self.connection.close()
+
+
+# Recompute the sales summaries from the full Sales table plus the pre-aggregated
+# totals of the sales moved to archive partitions
+REBUILD_AGGREGATES_SQL = '''
+    DELETE FROM ProductSalesSummary;
+    INSERT INTO ProductSalesSummary (ProductID, SaleCount, TotalQuantity)
+    SELECT ProductID, SUM(SaleCount), SUM(TotalQuantity)
+    FROM (
+        SELECT ProductID, COUNT(*) as SaleCount, SUM(QuantitySold) as TotalQuantity
+        FROM Sales
+        GROUP BY ProductID
+        UNION ALL
+        SELECT ProductID, SaleCount, TotalQuantity
+        FROM ArchivedSalesSummary
+    )
+    GROUP BY ProductID;
+
+    DELETE FROM MonthlySalesSummary;
+    INSERT INTO MonthlySalesSummary (SaleMonth, SaleCount, TotalQuantity)
+    SELECT SaleMonth, SUM(SaleCount), SUM(TotalQuantity)
+    FROM (
+        SELECT strftime('%Y-%m', SaleDate) as SaleMonth, COUNT(*) as SaleCount, SUM(QuantitySold) as TotalQuantity
+        FROM Sales
+        GROUP BY SaleMonth
+        UNION ALL
+        SELECT SaleMonth, SaleCount, TotalQuantity
+        FROM ArchivedSalesSummary
+    )
+    GROUP BY SaleMonth;
+'''
+
+# Triggers keeping the sales summaries in step with Sales inside the writing
+# transaction; {when} takes an optional WHEN clause
+SUMMARY_TRIGGERS_SQL = '''
+    CREATE TRIGGER IF NOT EXISTS SalesSummaryInsert AFTER INSERT ON Sales {when}
+    BEGIN
+        INSERT INTO ProductSalesSummary (ProductID, SaleCount, TotalQuantity)
+        VALUES (NEW.ProductID, 1, NEW.QuantitySold)
+        ON CONFLICT (ProductID) DO UPDATE SET
+            SaleCount = SaleCount + 1,
+            TotalQuantity = TotalQuantity + excluded.TotalQuantity;
+
+        INSERT INTO MonthlySalesSummary (SaleMonth, SaleCount, TotalQuantity)
+        VALUES (strftime('%Y-%m', NEW.SaleDate), 1, NEW.QuantitySold)
+        ON CONFLICT (SaleMonth) DO UPDATE SET
+            SaleCount = SaleCount + 1,
+            TotalQuantity = TotalQuantity + excluded.TotalQuantity;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS SalesSummaryDelete AFTER DELETE ON Sales {when}
+    BEGIN
+        UPDATE ProductSalesSummary
+        SET SaleCount = SaleCount - 1, TotalQuantity = TotalQuantity - OLD.QuantitySold
+        WHERE ProductID = OLD.ProductID;
+        DELETE FROM ProductSalesSummary WHERE ProductID = OLD.ProductID AND SaleCount <= 0;
+
+        UPDATE MonthlySalesSummary
+        SET SaleCount = SaleCount - 1, TotalQuantity = TotalQuantity - OLD.QuantitySold
+        WHERE SaleMonth = strftime('%Y-%m', OLD.SaleDate);
+        DELETE FROM MonthlySalesSummary WHERE SaleMonth = strftime('%Y-%m', OLD.SaleDate) AND SaleCount <= 0;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS SalesSummaryUpdate AFTER UPDATE OF ProductID, QuantitySold, SaleDate ON Sales {when}
+    BEGIN
+        UPDATE ProductSalesSummary
+        SET SaleCount = SaleCount - 1, TotalQuantity = TotalQuantity - OLD.QuantitySold
+        WHERE ProductID = OLD.ProductID;
+        DELETE FROM ProductSalesSummary WHERE ProductID = OLD.ProductID AND SaleCount <= 0;
+
+        UPDATE MonthlySalesSummary
+        SET SaleCount = SaleCount - 1, TotalQuantity = TotalQuantity - OLD.QuantitySold
+        WHERE SaleMonth = strftime('%Y-%m', OLD.SaleDate);
+        DELETE FROM MonthlySalesSummary WHERE SaleMonth = strftime('%Y-%m', OLD.SaleDate) AND SaleCount <= 0;
+
+        INSERT INTO ProductSalesSummary (ProductID, SaleCount, TotalQuantity)
+        VALUES (NEW.ProductID, 1, NEW.QuantitySold)
+        ON CONFLICT (ProductID) DO UPDATE SET
+            SaleCount = SaleCount + 1,
+            TotalQuantity = TotalQuantity + excluded.TotalQuantity;
+
+        INSERT INTO MonthlySalesSummary (SaleMonth, SaleCount, TotalQuantity)
+        VALUES (strftime('%Y-%m', NEW.SaleDate), 1, NEW.QuantitySold)
+        ON CONFLICT (SaleMonth) DO UPDATE SET
+            SaleCount = SaleCount + 1,
+            TotalQuantity = TotalQuantity + excluded.TotalQuantity;
+    END;
+'''
+
+# Recompute the low-stock set from the full Product table
+REBUILD_LOW_STOCK_SQL = '''
+    DELETE FROM LowStock;
+    INSERT INTO LowStock (ProductID)
+    SELECT ProductID
+    FROM Product
+    WHERE QuantityInStock <= ReorderLevel AND Deleted = 0;
+'''
+
+# Re-index the names of all current products for search
+REBUILD_PRODUCT_SEARCH_SQL = '''
+    INSERT INTO ProductSearch (ProductSearch) VALUES ('delete-all');
+    INSERT INTO ProductSearch (rowid, ProductName)
+    SELECT ProductID, ProductName
+    FROM Product
+    WHERE Deleted = 0;
+'''
+
+# Legs of stock transfers already applied to a location's database
+APPLIED_TRANSFER_SQL = '''
+    CREATE TABLE IF NOT EXISTS AppliedTransfer (
+        TransferID INTEGER NOT NULL,
+        Leg TEXT NOT NULL,
+        PRIMARY KEY (TransferID, Leg)
+    ) WITHOUT ROWID;
+'''
+
+# Schema of a location's own database: its stock, its sales and their summaries,
+# kept by the same triggers as in the main database
+LOCATION_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS LocationStock (
+        ProductID INTEGER PRIMARY KEY,
+        QuantityInStock INTEGER NOT NULL,
+        ReorderLevel INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS LocationStockNeedsReorder ON LocationStock (ProductID)
+    WHERE QuantityInStock <= ReorderLevel;
+
+    CREATE TABLE IF NOT EXISTS Sales (
+        SaleID INTEGER PRIMARY KEY AUTOINCREMENT,
+        ProductID INTEGER,
+        QuantitySold INTEGER,
+        SaleDate TEXT,
+        LocationID INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS SalesByProductID ON Sales (ProductID);
+    CREATE INDEX IF NOT EXISTS SalesBySaleDate ON Sales (SaleDate);
+
+    CREATE TABLE IF NOT EXISTS ProductSalesSummary (
+        ProductID INTEGER PRIMARY KEY,
+        SaleCount INTEGER NOT NULL,
+        TotalQuantity INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS MonthlySalesSummary (
+        SaleMonth TEXT PRIMARY KEY,
+        SaleCount INTEGER NOT NULL,
+        TotalQuantity INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS SummaryMaintenance (
+        Paused INTEGER NOT NULL
+    );
+    INSERT INTO SummaryMaintenance (Paused)
+    SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM SummaryMaintenance);
+''' + SUMMARY_TRIGGERS_SQL.format(when='WHEN (SELECT Paused FROM SummaryMaintenance) = 0') + APPLIED_TRANSFER_SQL
+
+# Schema migrations, applied in order at startup. PRAGMA user_version holds the
+# number of migrations already applied to the database file.
+SCHEMA_MIGRATIONS = [
+    # 1: Product and Sales tables
+    '''
+    CREATE TABLE IF NOT EXISTS Product (
+        ProductID INTEGER PRIMARY KEY,
+        ProductName TEXT,
+        QuantityInStock INTEGER,
+        ReorderLevel INTEGER,
+        UnitPrice REAL,
+        CostPerUnit REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS Sales (
+        SaleID INTEGER PRIMARY KEY,
+        ProductID INTEGER,
+        QuantitySold INTEGER,
+        SaleDate TEXT,
+        FOREIGN KEY (ProductID) REFERENCES Product(ProductID)
+    );
+    ''',
+
+    # 2: Per-product and per-month sales totals, so reports read one row per
+    # product and per month instead of rescanning Sales
+    '''
+    CREATE TABLE IF NOT EXISTS ProductSalesSummary (
+        ProductID INTEGER PRIMARY KEY,
+        SaleCount INTEGER NOT NULL,
+        TotalQuantity INTEGER
+    );
+
+    CREATE TABLE IF NOT EXISTS MonthlySalesSummary (
+        SaleMonth TEXT PRIMARY KEY,
+        SaleCount INTEGER NOT NULL,
+        TotalQuantity INTEGER
+    );
+
+    ''' + SUMMARY_TRIGGERS_SQL.format(when='') + '''
+    DELETE FROM ProductSalesSummary;
+    INSERT INTO ProductSalesSummary (ProductID, SaleCount, TotalQuantity)
+    SELECT ProductID, COUNT(*), SUM(QuantitySold)
+    FROM Sales
+    GROUP BY ProductID;
+
+    DELETE FROM MonthlySalesSummary;
+    INSERT INTO MonthlySalesSummary (SaleMonth, SaleCount, TotalQuantity)
+    SELECT strftime('%Y-%m', SaleDate) as SaleMonth, COUNT(*), SUM(QuantitySold)
+    FROM Sales
+    GROUP BY SaleMonth;
+    ''',
+
+    # 3: Indexes for the hot queries. The partial index holds only the products
+    # at or below their reorder level, so reorder alerts and the menu's alert
+    # count read just those rows.
+    '''
+    CREATE INDEX IF NOT EXISTS SalesByProductID ON Sales (ProductID);
+    CREATE INDEX IF NOT EXISTS SalesBySaleDate ON Sales (SaleDate);
+    CREATE INDEX IF NOT EXISTS SalesBySaleMonth ON Sales (strftime('%Y-%m', SaleDate));
+    CREATE INDEX IF NOT EXISTS ProductNeedsReorder ON Product (ProductID) WHERE QuantityInStock <= ReorderLevel;
+    ''',
+
+    # 4: Let bulk imports pause the per-row summary triggers and apply the
+    # totals in aggregate. Paused is only ever set inside the importing write
+    # transaction, so other connections always see it as 0.
+    '''
+    CREATE TABLE IF NOT EXISTS SummaryMaintenance (
+        Paused INTEGER NOT NULL
+    );
+    INSERT INTO SummaryMaintenance (Paused)
+    SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM SummaryMaintenance);
+
+    DROP TRIGGER IF EXISTS SalesSummaryInsert;
+    DROP TRIGGER IF EXISTS SalesSummaryDelete;
+    DROP TRIGGER IF EXISTS SalesSummaryUpdate;
+    ''' + SUMMARY_TRIGGERS_SQL.format(when='WHEN (SELECT Paused FROM SummaryMaintenance) = 0'),
+
+    # 5: The set of products at or below their reorder level, kept by triggers on
+    # Product. The update trigger only fires when a row crosses its reorder level,
+    # so an ordinary sale does not touch LowStock at all.
+    '''
+    CREATE TABLE IF NOT EXISTS LowStock (
+        ProductID INTEGER PRIMARY KEY
+    );
+
+    CREATE TRIGGER IF NOT EXISTS LowStockInsert AFTER INSERT ON Product
+    WHEN NEW.QuantityInStock <= NEW.ReorderLevel
+    BEGIN
+        INSERT OR IGNORE INTO LowStock (ProductID) VALUES (NEW.ProductID);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS LowStockDelete AFTER DELETE ON Product
+    WHEN OLD.QuantityInStock <= OLD.ReorderLevel
+    BEGIN
+        DELETE FROM LowStock WHERE ProductID = OLD.ProductID;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS LowStockUpdate AFTER UPDATE OF ProductID, QuantityInStock, ReorderLevel ON Product
+    WHEN OLD.ProductID IS NOT NEW.ProductID
+      OR COALESCE(OLD.QuantityInStock <= OLD.ReorderLevel, 0) != COALESCE(NEW.QuantityInStock <= NEW.ReorderLevel, 0)
+    BEGIN
+        DELETE FROM LowStock WHERE ProductID = OLD.ProductID;
+        INSERT OR IGNORE INTO LowStock (ProductID)
+        SELECT NEW.ProductID WHERE NEW.QuantityInStock <= NEW.ReorderLevel;
+    END;
+
+    INSERT INTO LowStock (ProductID)
+    SELECT ProductID
+    FROM Product
+    WHERE QuantityInStock <= ReorderLevel;
+    ''',
+
+    # 6: Fitted demand model and suggested reorder point per product, updated
+    # incrementally by forecasting.update_forecasts(). LastDay is a date ordinal.
+    '''
+    CREATE TABLE IF NOT EXISTS ProductForecast (
+        ProductID INTEGER PRIMARY KEY,
+        LastSaleID INTEGER NOT NULL,
+        LastDay INTEGER NOT NULL,
+        DemandRate REAL NOT NULL,
+        DemandVariance REAL NOT NULL,
+        SafetyStock INTEGER NOT NULL,
+        ReorderPoint INTEGER NOT NULL,
+        ReorderQuantity INTEGER NOT NULL
+    );
+    ''',
+
+    # 7: Soft delete. A deleted product is hidden at once and its sales are purged in
+    # small batches by purge_deleted_products(). Sales is rebuilt so that its foreign
+    # key cascades deletes from Product, which is only possible by recreating the table.
+    '''
+    ALTER TABLE Product ADD COLUMN Deleted INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS ProductDeleted ON Product (ProductID) WHERE Deleted = 1;
+
+    CREATE TABLE SalesWithCascade (
+        SaleID INTEGER PRIMARY KEY,
+        ProductID INTEGER,
+        QuantitySold INTEGER,
+        SaleDate TEXT,
+        FOREIGN KEY (ProductID) REFERENCES Product(ProductID) ON DELETE CASCADE
+    );
+    INSERT INTO SalesWithCascade (SaleID, ProductID, QuantitySold, SaleDate)
+    SELECT SaleID, ProductID, QuantitySold, SaleDate
+    FROM Sales;
+    DROP TABLE Sales;
+    ALTER TABLE SalesWithCascade RENAME TO Sales;
+
+    CREATE INDEX SalesByProductID ON Sales (ProductID);
+    CREATE INDEX SalesBySaleDate ON Sales (SaleDate);
+    CREATE INDEX SalesBySaleMonth ON Sales (strftime('%Y-%m', SaleDate));
+    ''' + SUMMARY_TRIGGERS_SQL.format(when='WHEN (SELECT Paused FROM SummaryMaintenance) = 0') + '''
+
+    DROP TRIGGER LowStockInsert;
+    DROP TRIGGER LowStockDelete;
+    DROP TRIGGER LowStockUpdate;
+
+    CREATE TRIGGER LowStockInsert AFTER INSERT ON Product
+    WHEN NEW.QuantityInStock <= NEW.ReorderLevel AND NEW.Deleted = 0
+    BEGIN
+        INSERT OR IGNORE INTO LowStock (ProductID) VALUES (NEW.ProductID);
+    END;
+
+    CREATE TRIGGER LowStockDelete AFTER DELETE ON Product
+    BEGIN
+        DELETE FROM LowStock WHERE ProductID = OLD.ProductID;
+    END;
+
+    CREATE TRIGGER LowStockUpdate AFTER UPDATE OF ProductID, QuantityInStock, ReorderLevel, Deleted ON Product
+    WHEN OLD.ProductID IS NOT NEW.ProductID
+      OR COALESCE(OLD.QuantityInStock <= OLD.ReorderLevel AND OLD.Deleted = 0, 0)
+         != COALESCE(NEW.QuantityInStock <= NEW.ReorderLevel AND NEW.Deleted = 0, 0)
+    BEGIN
+        DELETE FROM LowStock WHERE ProductID = OLD.ProductID;
+        INSERT OR IGNORE INTO LowStock (ProductID)
+        SELECT NEW.ProductID WHERE NEW.QuantityInStock <= NEW.ReorderLevel AND NEW.Deleted = 0;
+    END;
+    ''' + REBUILD_LOW_STOCK_SQL,
+
+    # 8: Hot/cold partitioning of Sales. archive_sales() moves old sales into
+    # per-year or per-month archive files listed in SalesArchive and keeps their
+    # totals per product and month in ArchivedSalesSummary, so the all-time
+    # summaries stay exact. Sales is rebuilt with AUTOINCREMENT so that a SaleID
+    # is never reused once its sale has left the table.
+    '''
+    CREATE TABLE IF NOT EXISTS SalesArchive (
+        Partition TEXT PRIMARY KEY,
+        Path TEXT NOT NULL,
+        FirstDate TEXT NOT NULL,
+        LastDate TEXT NOT NULL
+    );
+
+    CREATE TABLE IF NOT EXISTS ArchivedSalesSummary (
+        ProductID INTEGER NOT NULL,
+        SaleMonth TEXT NOT NULL,
+        SaleCount INTEGER NOT NULL,
+        TotalQuantity INTEGER,
+        PRIMARY KEY (ProductID, SaleMonth)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE SalesWithAutoincrement (
+        SaleID INTEGER PRIMARY KEY AUTOINCREMENT,
+        ProductID INTEGER,
+        QuantitySold INTEGER,
+        SaleDate TEXT,
+        FOREIGN KEY (ProductID) REFERENCES Product(ProductID) ON DELETE CASCADE
+    );
+    INSERT INTO SalesWithAutoincrement (SaleID, ProductID, QuantitySold, SaleDate)
+    SELECT SaleID, ProductID, QuantitySold, SaleDate
+    FROM Sales;
+    DROP TABLE Sales;
+    ALTER TABLE SalesWithAutoincrement RENAME TO Sales;
+
+    CREATE INDEX SalesByProductID ON Sales (ProductID);
+    CREATE INDEX SalesBySaleDate ON Sales (SaleDate);
+    CREATE INDEX SalesBySaleMonth ON Sales (strftime('%Y-%m', SaleDate));
+    ''' + SUMMARY_TRIGGERS_SQL.format(when='WHEN (SELECT Paused FROM SummaryMaintenance) = 0'),
+
+    # 9: Locations. This database is the Main location, whose stock stays in
+    # Product.QuantityInStock; every other location keeps its stock and sales in a
+    # database file of its own (see add_location()). Transfers between locations are
+    # logged here and applied to each side once, tracked by AppliedTransfer.
+    '''
+    CREATE TABLE IF NOT EXISTS Location (
+        LocationID INTEGER PRIMARY KEY,
+        LocationName TEXT NOT NULL UNIQUE,
+        ShardPath TEXT
+    );
+    INSERT OR IGNORE INTO Location (LocationID, LocationName, ShardPath) VALUES (1, 'Main', NULL);
+
+    ALTER TABLE Sales ADD COLUMN LocationID INTEGER NOT NULL DEFAULT 1;
+
+    CREATE TABLE IF NOT EXISTS StockTransfer (
+        TransferID INTEGER PRIMARY KEY AUTOINCREMENT,
+        ProductID INTEGER NOT NULL REFERENCES Product(ProductID) ON DELETE CASCADE,
+        FromLocationID INTEGER NOT NULL REFERENCES Location(LocationID),
+        ToLocationID INTEGER NOT NULL REFERENCES Location(LocationID),
+        Quantity INTEGER NOT NULL,
+        TransferDate TEXT NOT NULL,
+        Status TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS StockTransferOpen ON StockTransfer (TransferID) WHERE Status IN ('pending', 'shipped');
+    ''' + APPLIED_TRANSFER_SQL,
+
+    # 10: Stock ledger. Every change to a product's stock at the Main location is
+    # appended to StockMovement, and StockSnapshot holds compacted per-product totals
+    # up to a movement, so a point-in-time query only adds up the movements after the
+    # nearest snapshot (see get_stock_at()). Existing products open the ledger with
+    # their current stock.
+    '''
+    CREATE TABLE IF NOT EXISTS StockMovement (
+        MovementID INTEGER PRIMARY KEY AUTOINCREMENT,
+        ProductID INTEGER NOT NULL REFERENCES Product(ProductID) ON DELETE CASCADE,
+        Change INTEGER NOT NULL,
+        Kind TEXT NOT NULL CHECK (Kind IN ('initial', 'sale', 'restock', 'adjustment', 'delete', 'transfer')),
+        Reference INTEGER,
+        MovedAt TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+    );
+    CREATE INDEX IF NOT EXISTS StockMovementByProduct ON StockMovement (ProductID, MovementID);
+
+    CREATE TRIGGER IF NOT EXISTS StockMovementAppendOnly BEFORE UPDATE ON StockMovement
+    BEGIN
+        SELECT RAISE(ABORT, 'The stock ledger is append-only');
+    END;
+
+    CREATE TABLE IF NOT EXISTS StockSnapshot (
+        ProductID INTEGER NOT NULL REFERENCES Product(ProductID) ON DELETE CASCADE,
+        MovementID INTEGER NOT NULL,
+        QuantityInStock INTEGER NOT NULL,
+        TakenAt TEXT NOT NULL,
+        PRIMARY KEY (ProductID, MovementID)
+    ) WITHOUT ROWID;
+
+    INSERT INTO StockMovement (ProductID, Change, Kind)
+    SELECT ProductID, QuantityInStock, 'initial'
+    FROM Product
+    WHERE Deleted = 0 AND COALESCE(QuantityInStock, 0) != 0
+    ORDER BY ProductID;
+    ''',
+
+    # 11: Full-text index of the names of the current products for search-as-you-type
+    # (see search_products()). It reads the names from Product and triggers keep it
+    # in step; deleted products leave it at once.
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+        ProductName,
+        content = 'Product',
+        content_rowid = 'ProductID',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS ProductSearchInsert AFTER INSERT ON Product
+    WHEN NEW.Deleted = 0
+    BEGIN
+        INSERT INTO ProductSearch (rowid, ProductName) VALUES (NEW.ProductID, NEW.ProductName);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS ProductSearchDelete AFTER DELETE ON Product
+    WHEN OLD.Deleted = 0
+    BEGIN
+        INSERT INTO ProductSearch (ProductSearch, rowid, ProductName) VALUES ('delete', OLD.ProductID, OLD.ProductName);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS ProductSearchUpdate AFTER UPDATE OF ProductName, Deleted ON Product
+    BEGIN
+        INSERT INTO ProductSearch (ProductSearch, rowid, ProductName)
+        SELECT 'delete', OLD.ProductID, OLD.ProductName
+        WHERE OLD.Deleted = 0;
+        INSERT INTO ProductSearch (rowid, ProductName)
+        SELECT NEW.ProductID, NEW.ProductName
+        WHERE NEW.Deleted = 0;
+    END;
+    ''' + REBUILD_PRODUCT_SEARCH_SQL,
+
+    # 12: Catalog versions for the ProductCatalog cache. Every time a product is added
+    # or its name, reorder level, price, cost or deleted flag changes, CatalogClock is
+    # advanced and the row is stamped with the new version, so the cache can re-read
+    # just the rows changed since the newest version it holds. Versions are never
+    # reused, even after a purge removes the newest row.
+    '''
+    CREATE TABLE IF NOT EXISTS CatalogClock (
+        LastVersion INTEGER NOT NULL
+    );
+    INSERT INTO CatalogClock (LastVersion)
+    SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM CatalogClock);
+
+    ALTER TABLE Product ADD COLUMN CatalogVersion INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS ProductByCatalogVersion ON Product (CatalogVersion);
+
+    CREATE TRIGGER IF NOT EXISTS CatalogVersionInsert AFTER INSERT ON Product
+    BEGIN
+        UPDATE CatalogClock SET LastVersion = LastVersion + 1;
+        UPDATE Product SET CatalogVersion = (SELECT LastVersion FROM CatalogClock) WHERE ProductID = NEW.ProductID;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS CatalogVersionUpdate
+    AFTER UPDATE OF ProductName, ReorderLevel, UnitPrice, CostPerUnit, Deleted ON Product
+    WHEN OLD.ProductName IS NOT NEW.ProductName OR OLD.ReorderLevel IS NOT NEW.ReorderLevel
+        OR OLD.UnitPrice IS NOT NEW.UnitPrice OR OLD.CostPerUnit IS NOT NEW.CostPerUnit OR OLD.Deleted != NEW.Deleted
+    BEGIN
+        UPDATE CatalogClock SET LastVersion = LastVersion + 1;
+        UPDATE Product SET CatalogVersion = (SELECT LastVersion FROM CatalogClock) WHERE ProductID = NEW.ProductID;
+    END;
+    ''',
+
+    # 13: The stock ledger outlives the products it records: StockMovement is rebuilt
+    # without the foreign key that cascaded the purge of a deleted product to its
+    # movements, and Product is rebuilt with AUTOINCREMENT, as Sales was, so that a
+    # purged product's ID, and with it its movements, never passes to a new product.
+    # The AUTOINCREMENT counter of StockMovement is carried over. MovedAt (and so
+    # StockSnapshot.TakenAt) is stored in UTC, which never goes back an hour when the
+    # clocks change; existing local times are converted.
+    '''
+    CREATE TABLE StockMovementKept (
+        MovementID INTEGER PRIMARY KEY AUTOINCREMENT,
+        ProductID INTEGER NOT NULL,
+        Change INTEGER NOT NULL,
+        Kind TEXT NOT NULL CHECK (Kind IN ('initial', 'sale', 'restock', 'adjustment', 'delete', 'transfer')),
+        Reference INTEGER,
+        MovedAt TEXT NOT NULL DEFAULT (datetime('now'))
+    );
+    INSERT INTO StockMovementKept (MovementID, ProductID, Change, Kind, Reference, MovedAt)
+    SELECT MovementID, ProductID, Change, Kind, Reference, datetime(MovedAt, 'utc')
+    FROM StockMovement
+    ORDER BY MovementID;
+    DELETE FROM sqlite_sequence WHERE name = 'StockMovementKept';
+    INSERT INTO sqlite_sequence (name, seq)
+    SELECT 'StockMovementKept', seq FROM sqlite_sequence WHERE name = 'StockMovement';
+    DROP TABLE StockMovement;
+    ALTER TABLE StockMovementKept RENAME TO StockMovement;
+
+    CREATE INDEX StockMovementByProduct ON StockMovement (ProductID, MovementID);
+    CREATE TRIGGER StockMovementAppendOnly BEFORE UPDATE ON StockMovement
+    BEGIN
+        SELECT RAISE(ABORT, 'The stock ledger is append-only');
+    END;
+
+    UPDATE StockSnapshot SET TakenAt = datetime(TakenAt, 'utc');
+
+    CREATE TABLE ProductWithAutoincrement (
+        ProductID INTEGER PRIMARY KEY AUTOINCREMENT,
+        ProductName TEXT,
+        QuantityInStock INTEGER,
+        ReorderLevel INTEGER,
+        UnitPrice REAL,
+        CostPerUnit REAL,
+        Deleted INTEGER NOT NULL DEFAULT 0,
+        CatalogVersion INTEGER NOT NULL DEFAULT 0
+    );
+    INSERT INTO ProductWithAutoincrement (ProductID, ProductName, QuantityInStock, ReorderLevel, UnitPrice,
+                                          CostPerUnit, Deleted, CatalogVersion)
+    SELECT ProductID, ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit, Deleted, CatalogVersion
+    FROM Product;
+    DROP TABLE Product;
+    ALTER TABLE ProductWithAutoincrement RENAME TO Product;
+
+    CREATE INDEX ProductNeedsReorder ON Product (ProductID) WHERE QuantityInStock <= ReorderLevel;
+    CREATE INDEX ProductDeleted ON Product (ProductID) WHERE Deleted = 1;
+    CREATE INDEX ProductByCatalogVersion ON Product (CatalogVersion);
+
+    CREATE TRIGGER LowStockInsert AFTER INSERT ON Product
+    WHEN NEW.QuantityInStock <= NEW.ReorderLevel AND NEW.Deleted = 0
+    BEGIN
+        INSERT OR IGNORE INTO LowStock (ProductID) VALUES (NEW.ProductID);
+    END;
+
+    CREATE TRIGGER LowStockDelete AFTER DELETE ON Product
+    BEGIN
+        DELETE FROM LowStock WHERE ProductID = OLD.ProductID;
+    END;
+
+    CREATE TRIGGER LowStockUpdate AFTER UPDATE OF ProductID, QuantityInStock, ReorderLevel, Deleted ON Product
+    WHEN OLD.ProductID IS NOT NEW.ProductID
+      OR COALESCE(OLD.QuantityInStock <= OLD.ReorderLevel AND OLD.Deleted = 0, 0)
+         != COALESCE(NEW.QuantityInStock <= NEW.ReorderLevel AND NEW.Deleted = 0, 0)
+    BEGIN
+        DELETE FROM LowStock WHERE ProductID = OLD.ProductID;
+        INSERT OR IGNORE INTO LowStock (ProductID)
+        SELECT NEW.ProductID WHERE NEW.QuantityInStock <= NEW.ReorderLevel AND NEW.Deleted = 0;
+    END;
+
+    CREATE TRIGGER ProductSearchInsert AFTER INSERT ON Product
+    WHEN NEW.Deleted = 0
+    BEGIN
+        INSERT INTO ProductSearch (rowid, ProductName) VALUES (NEW.ProductID, NEW.ProductName);
+    END;
+
+    CREATE TRIGGER ProductSearchDelete AFTER DELETE ON Product
+    WHEN OLD.Deleted = 0
+    BEGIN
+        INSERT INTO ProductSearch (ProductSearch, rowid, ProductName) VALUES ('delete', OLD.ProductID, OLD.ProductName);
+    END;
+
+    CREATE TRIGGER ProductSearchUpdate AFTER UPDATE OF ProductName, Deleted ON Product
+    BEGIN
+        INSERT INTO ProductSearch (ProductSearch, rowid, ProductName)
+        SELECT 'delete', OLD.ProductID, OLD.ProductName
+        WHERE OLD.Deleted = 0;
+        INSERT INTO ProductSearch (rowid, ProductName)
+        SELECT NEW.ProductID, NEW.ProductName
+        WHERE NEW.Deleted = 0;
+    END;
+
+    CREATE TRIGGER CatalogVersionInsert AFTER INSERT ON Product
+    BEGIN
+        UPDATE CatalogClock SET LastVersion = LastVersion + 1;
+        UPDATE Product SET CatalogVersion = (SELECT LastVersion FROM CatalogClock) WHERE ProductID = NEW.ProductID;
+    END;
+
+    CREATE TRIGGER CatalogVersionUpdate
+    AFTER UPDATE OF ProductName, ReorderLevel, UnitPrice, CostPerUnit, Deleted ON Product
+    WHEN OLD.ProductName IS NOT NEW.ProductName OR OLD.ReorderLevel IS NOT NEW.ReorderLevel
+        OR OLD.UnitPrice IS NOT NEW.UnitPrice OR OLD.CostPerUnit IS NOT NEW.CostPerUnit OR OLD.Deleted != NEW.Deleted
+    BEGIN
+        UPDATE CatalogClock SET LastVersion = LastVersion + 1;
+        UPDATE Product SET CatalogVersion = (SELECT LastVersion FROM CatalogClock) WHERE ProductID = NEW.ProductID;
+    END;
+    ''',
+]
+
+SCHEMA_VERSION = len(SCHEMA_MIGRATIONS)
+
+
+# Bring the database schema up to the current version, one migration per transaction
+def migrate_schema(connection):
+    # A database that is already current costs a single PRAGMA read at startup
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+
+    # Rebuilding a table drops it, which must not cascade or fail on its foreign keys.
+    # The pragma has no effect inside a transaction, so it is switched around the migrations.
+    connection.execute("PRAGMA foreign_keys = OFF")
+    try:
+        for number, migration in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+            connection.executescript(f'''
+                BEGIN;
+                {migration}
+                PRAGMA user_version = {number};
+                COMMIT;
+            ''')
+    finally:
+        connection.execute("PRAGMA foreign_keys = ON")
+
+
+# Recompute the sales summaries, the low-stock set and the product search index from
+# scratch to repair any drift
+def rebuild_aggregates(connection):
+    connection.executescript(f'''
+        BEGIN;
+        {REBUILD_AGGREGATES_SQL}
+        {REBUILD_LOW_STOCK_SQL}
+        {REBUILD_PRODUCT_SEARCH_SQL}
+        COMMIT;
+    ''')
+
+
+# Hot queries and the index each one is expected to use. check_query_plans()
+# reports any of them that has fallen back to a full table scan.
+HOT_QUERIES = [
+    ("Delete sales of a product", "DELETE FROM Sales WHERE ProductID = ?", (1,), "SalesByProductID"),
+    ("Sales in a date range", "SELECT * FROM Sales WHERE SaleDate BETWEEN ? AND ?", ('2023-01-01', '2023-12-31'),
+     "SalesBySaleDate"),
+    ("Per-product sales rollup", "SELECT ProductID, COUNT(*), SUM(QuantitySold) FROM Sales GROUP BY ProductID", (),
+     "SalesByProductID"),
+    ("Monthly sales rollup",
+     "SELECT strftime('%Y-%m', SaleDate) as SaleMonth, COUNT(*), SUM(QuantitySold) FROM Sales GROUP BY SaleMonth", (),
+     "SalesBySaleMonth"),
+    ("Reorder alerts", "SELECT Product.ProductID, ProductName, QuantityInStock, ReorderLevel, "
+                       "ProductForecast.ReorderPoint, ProductForecast.ReorderQuantity FROM Product "
+                       "LEFT JOIN ProductForecast ON Product.ProductID = ProductForecast.ProductID "
+                       "WHERE QuantityInStock <= ReorderLevel AND Deleted = 0", (), "ProductNeedsReorder"),
+    ("Reorder alert count", "SELECT COUNT(*) FROM Product WHERE QuantityInStock <= ReorderLevel AND Deleted = 0", (),
+     "ProductNeedsReorder"),
+    ("Stock movements after a snapshot", "SELECT COALESCE(SUM(Change), 0) FROM StockMovement "
+                                         "WHERE ProductID = ? AND MovementID > ? AND MovementID <= ? AND MovedAt < ?",
+     (1, 0, 100, '2024-01-01'), "StockMovementByProduct"),
+    ("Catalog changes since a version", "SELECT ProductID, ProductName, ReorderLevel, UnitPrice, CostPerUnit, Deleted, "
+                                        "CatalogVersion FROM Product WHERE CatalogVersion > ?", (0,),
+     "ProductByCatalogVersion"),
+]
+
+
+# Return the EXPLAIN QUERY PLAN detail lines for a statement
+def query_plan(connection, sql, params=()):
+    return [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+# Check each hot query's plan and return (name, plan) for those not using their expected index
+def check_query_plans(connection):
+    failures = []
+
+    for name, sql, params, index in HOT_QUERIES:
+        plan = query_plan(connection, sql, params)
+        if not any(index in detail for detail in plan):
+            failures.append((name, plan))
+
+    return failures
+
+
+# Validate the numeric fields of a new product, returning them parsed.
+# Raises ValueError with a message for the user.
+def validate_product(quantity_in_stock, reorder_level, cost_per_unit, unit_price):
+    quantity_in_stock, reorder_level = str(quantity_in_stock).strip(), str(reorder_level).strip()
+
+    if not quantity_in_stock.isdigit():
+        raise ValueError("Invalid input. Please enter a valid integer for the quantity in stock.")
+
+    if not reorder_level.isdigit():
+        raise ValueError("Invalid input. Please enter a valid integer for the reorder level.")
+
+    try:
+        cost_per_unit = float(cost_per_unit)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid input. Please enter a valid float for the cost per unit.") from None
+
+    try:
+        unit_price = float(unit_price)
+    except (TypeError, ValueError):
+        raise ValueError("Invalid input. Please enter a valid float for the unit price.") from None
+
+    return int(quantity_in_stock), int(reorder_level), cost_per_unit, unit_price
+
+
+# Validate a sale against the product's current stock (None if the product does not
+# exist), returning the parsed quantity and date. Raises ValueError with a message for the user.
+def validate_sale(product_id, current_quantity, quantity_sold, sale_date_str):
+    if current_quantity is None:
+        raise ValueError(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+
+    # Validate quantity sold
+    quantity_sold = str(quantity_sold).strip()
+    if not quantity_sold.isdigit():
+        raise ValueError("Invalid input. Please enter a valid integer for the quantity sold.")
+
+    quantity_sold = int(quantity_sold)
+
+    if quantity_sold > current_quantity:
+        raise ValueError(f"Error: Quantity in stock ({current_quantity}) is less than quantity sold ({quantity_sold}).")
+
+    # Validate sale date
+    if sale_date_str:
+        sale_date = parse_sale_date(sale_date_str)
+    else:
+        sale_date = datetime.date.today()
+
+    return quantity_sold, sale_date
+
+
+# Parse a YYYY-MM-DD sale date. Cached because bulk imports repeat the same few dates.
+@functools.lru_cache(maxsize=4096)
+def parse_sale_date(sale_date_str):
+    try:
+        return datetime.datetime.strptime(sale_date_str, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Invalid date format. Please use YYYY-MM-DD.") from None
+
+
+PRODUCT_COLUMNS = ["ProductID", "ProductName", "QuantityInStock", "ReorderLevel", "UnitPrice", "CostPerUnit"]
+
+
+# Fetch a product as a dict, or None if it does not exist or has been deleted
+def get_product(connection, product_id):
+    row = connection.execute(f'''
+        SELECT {', '.join(PRODUCT_COLUMNS)}
+        FROM Product
+        WHERE ProductID = ? AND Deleted = 0
+    ''', (product_id,)).fetchone()
+
+    return None if row is None else dict(zip(PRODUCT_COLUMNS, row))
+
+
+# Current stock of the given products as {ProductID: QuantityInStock}; unknown IDs are left out
+def get_stock_levels(connection, product_ids):
+    product_ids = [int(product_id) for product_id in product_ids]
+    if not product_ids:
+        return {}
+
+    return dict(connection.execute(f'''
+        SELECT ProductID, QuantityInStock
+        FROM Product
+        WHERE ProductID IN ({', '.join('?' * len(product_ids))}) AND Deleted = 0
+    ''', product_ids))
+
+
+# Columns of a product held by ProductCatalog. The stock changes with every sale, so
+# it is not cached and is always read from the database.
+CATALOG_COLUMNS = ["ProductID", "ProductName", "ReorderLevel", "UnitPrice", "CostPerUnit"]
+
+# States of a ProductCatalog slot
+CATALOG_UNKNOWN, CATALOG_CURRENT, CATALOG_MISSING = 0, 1, 2
+
+# Stands in for a NULL reorder level in the catalog's integer array
+NULL_INTEGER = -2 ** 63
+
+
+# Process-wide cache of the product catalogue, for validating Product IDs and looking
+# up names and prices without a query.
+#
+# Each product has a slot in compact arrays (names, reorder levels, prices, costs and
+# a state byte), found through a dict from ProductID to slot. The whole catalogue is
+# loaded in one query on first use. Before every lookup the cache reads PRAGMA
+# data_version on its own connection; only if some connection, in this process or
+# another, has committed since does it re-read the rows whose CatalogVersion is newer
+# than the newest it holds (see migration 12). A sale leaves the versions alone, so
+# after one that costs a single indexed query returning nothing. The add, update and
+# delete paths also call invalidate() with the product they changed, and the next
+# lookup of that product reads it afresh. Lookups answered from the arrays alone count
+# as hits, those that had to read products first as misses.
+class ProductCatalog:
+    __slots__ = ("connection", "lock", "data_version", "version", "slots", "names", "reorder_levels",
+                 "unit_prices", "costs", "states", "listing", "hits", "misses", "loads", "refreshes")
+
+    def __init__(self, path=DATABASE_PATH):
+        self.connection = connect(path)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.refreshes = 0
+        self.clear()
+
+    # Forget every product; the next lookup loads the catalogue again
+    def clear(self):
+        self.data_version = None
+        self.version = None
+        self.slots = {}
+        self.names = []
+        self.reorder_levels = array.array('q')
+        self.unit_prices = array.array('d')
+        self.costs = array.array('d')
+        self.states = bytearray()
+        self.listing = None
+
+    # Forget one product after a write through this process. The next lookup also
+    # re-reads whatever else changed, which covers a product that was just added.
+    def invalidate(self, product_id):
+        with self.lock:
+            slot = self.slots.get(int(product_id))
+            if slot is not None:
+                self.states[slot] = CATALOG_UNKNOWN
+                self.listing = None
+            self.data_version = None
+
+    # The product's catalog columns as a dict, or None if it does not exist or has been deleted
+    def get(self, product_id):
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return None
+
+        with self.lock:
+            read = self._sync()
+            slot = self.slots.get(product_id)
+            if slot is not None and self.states[slot] == CATALOG_UNKNOWN:
+                read = True
+                self._reload(product_id)
+            self._count(read)
+
+            if slot is None or self.states[slot] != CATALOG_CURRENT:
+                return None
+            return dict(zip(CATALOG_COLUMNS, self._row(product_id, slot)))
+
+    # All current products as tuples of CATALOG_COLUMNS, in ProductID order. The list
+    # is shared between callers and must not be modified.
+    def products(self):
+        with self.lock:
+            read = self._sync()
+            if CATALOG_UNKNOWN in self.states:
+                read = True
+                for product_id, slot in list(self.slots.items()):
+                    if self.states[slot] == CATALOG_UNKNOWN:
+                        self._reload(product_id)
+            self._count(read)
+
+            # Built again only after a product changed
+            if self.listing is None:
+                self.listing = [self._row(product_id, slot) for product_id, slot in sorted(self.slots.items())
+                                if self.states[slot] == CATALOG_CURRENT]
+            return self.listing
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "loads": self.loads, "refreshes": self.refreshes,
+                    "products": self.states.count(CATALOG_CURRENT)}
+
+    def close(self):
+        self.connection.close()
+
+    def _count(self, read):
+        if read:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    # Load the catalogue, or re-read the products changed since it was last read.
+    # Returns whether any product was read.
+    def _sync(self):
+        data_version = self.connection.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self.data_version:
+            return False
+
+        if self.version is None:
+            self._load()
+            self.data_version = data_version
+            return True
+
+        rows = self.connection.execute(f'''
+            SELECT {', '.join(CATALOG_COLUMNS)}, Deleted, CatalogVersion
+            FROM Product
+            WHERE CatalogVersion > ?
+        ''', (self.version,)).fetchall()
+        self.refreshes += bool(rows)
+        for row in rows:
+            self._store(*row[:-1])
+            self.version = max(self.version, row[-1])
+        self.data_version = data_version
+        return bool(rows)
+
+    # Fill the arrays from the whole of Product in one pass
+    def _load(self):
+        self.loads += 1
+        rows = self.connection.execute(f'''
+            SELECT {', '.join(CATALOG_COLUMNS)}, Deleted, CatalogVersion
+            FROM Product
+        ''').fetchall()
+        columns = list(zip(*rows)) or [()] * (len(CATALOG_COLUMNS) + 2)
+        product_ids, names, reorder_levels, unit_prices, costs, deleted, versions = columns
+
+        self.slots = dict(zip(product_ids, range(len(product_ids))))
+        self.names = list(names)
+        self.reorder_levels = array.array('q', [NULL_INTEGER if value is None else value for value in reorder_levels])
+        self.unit_prices = array.array('d', [float('nan') if value is None else value for value in unit_prices])
+        self.costs = array.array('d', [float('nan') if value is None else value for value in costs])
+        self.states = bytearray(CATALOG_MISSING if value else CATALOG_CURRENT for value in deleted)
+        self.listing = None
+        self.version = max(versions, default=0)
+
+    def _reload(self, product_id):
+        row = self.connection.execute(f'''
+            SELECT {', '.join(CATALOG_COLUMNS)}, Deleted
+            FROM Product
+            WHERE ProductID = ?
+        ''', (product_id,)).fetchone()
+        if row:
+            self._store(*row)
+        else:
+            self._drop(product_id)
+
+    def _store(self, product_id, product_name, reorder_level, unit_price, cost_per_unit, deleted):
+        slot = self.slots.get(product_id)
+        if slot is None:
+            slot = self.slots[product_id] = len(self.names)
+            self.names.append(None)
+            self.reorder_levels.append(0)
+            self.unit_prices.append(0.0)
+            self.costs.append(0.0)
+            self.states.append(CATALOG_UNKNOWN)
+
+        self.names[slot] = product_name
+        self.reorder_levels[slot] = NULL_INTEGER if reorder_level is None else reorder_level
+        self.unit_prices[slot] = float('nan') if unit_price is None else unit_price
+        self.costs[slot] = float('nan') if cost_per_unit is None else cost_per_unit
+        self.states[slot] = CATALOG_MISSING if deleted else CATALOG_CURRENT
+        self.listing = None
+
+    def _drop(self, product_id):
+        slot = self.slots.get(product_id)
+        if slot is not None:
+            self.states[slot] = CATALOG_MISSING
+            self.listing = None
+
+    def _row(self, product_id, slot):
+        reorder_level = self.reorder_levels[slot]
+        unit_price, cost_per_unit = self.unit_prices[slot], self.costs[slot]
+        # NaN, the stand-in for a NULL price or cost, is the only value unequal to itself
+        return (product_id, self.names[slot], None if reorder_level == NULL_INTEGER else reorder_level,
+                None if unit_price != unit_price else unit_price, None if cost_per_unit != cost_per_unit else cost_per_unit)
+
+
+# Full-text query matching product names with a word starting with each word of the
+# search text, or None if the text has no words
+def product_search_query(text):
+    words = re.findall(r"\w+", text)
+    return " ".join(f'"{word}"*' for word in words) if words else None
+
+
+# Ranking costs a bm25 pass over every match, so a search matching more products than
+# this (a word or two typed so far) lists them in ProductID order instead
+SEARCH_RANK_LIMIT = 1000
+
+
+# Current products whose names match the search text, best matches first, at most
+# limit of them. A number also finds the product with that ProductID, listed first.
+def search_products(connection, text, limit=50):
+    rows = []
+    if text.strip().isdigit():
+        product = get_product(connection, int(text))
+        if product is not None:
+            rows.append(tuple(product.values()))
+
+    query = product_search_query(text)
+    if query is None:
+        return rows
+
+    matches = connection.execute('''
+        SELECT COUNT(*)
+        FROM (SELECT 1 FROM ProductSearch WHERE ProductSearch MATCH ? LIMIT ?)
+    ''', (query, SEARCH_RANK_LIMIT + 1)).fetchone()[0]
+    order = "rank" if matches <= SEARCH_RANK_LIMIT else "rowid"
+
+    # Order inside the index first so only the first `limit` matches are joined with Product
+    rows.extend(connection.execute(f'''
+        SELECT {', '.join(f'Product.{column}' for column in PRODUCT_COLUMNS)}
+        FROM (
+            SELECT rowid, {order} as SortKey
+            FROM ProductSearch
+            WHERE ProductSearch MATCH ?
+            ORDER BY {order}
+            LIMIT ?
+        ) AS Matches
+        INNER JOIN Product ON Product.ProductID = Matches.rowid
+        WHERE Product.ProductID != ?
+        ORDER BY Matches.SortKey
+    ''', (query, limit, rows[0][0] if rows else -1)))
+    return rows[:limit]
+
+
+# Products at or below their reorder level, with the forecast's suggested reorder
+# point and quantity (None until forecasts have been computed)
+def get_reorder_alerts(connection):
+    return connection.execute('''
+        SELECT Product.ProductID, ProductName, QuantityInStock, ReorderLevel,
+               ProductForecast.ReorderPoint, ProductForecast.ReorderQuantity
+        FROM Product
+        LEFT JOIN ProductForecast ON Product.ProductID = ProductForecast.ProductID
+        WHERE QuantityInStock <= ReorderLevel AND Deleted = 0
+    ''').fetchall()
+
+
+# Products at or below the reorder point suggested by their demand forecast:
+# (ProductID, ProductName, QuantityInStock, ReorderLevel, ReorderPoint, ReorderQuantity)
+def get_forecast_alerts(connection):
+    return connection.execute('''
+        SELECT Product.ProductID, ProductName, QuantityInStock, ReorderLevel,
+               ProductForecast.ReorderPoint, ProductForecast.ReorderQuantity
+        FROM Product
+        INNER JOIN ProductForecast ON Product.ProductID = ProductForecast.ProductID
+        WHERE QuantityInStock <= ProductForecast.ReorderPoint AND Deleted = 0
+        ORDER BY Product.ProductID
+    ''').fetchall()
+
+
+# Number of products at or below their reorder level, read from the maintained set
+def count_reorder_alerts(connection):
+    return connection.execute("SELECT COUNT(*) FROM LowStock").fetchone()[0]
+
+
+# Compare the maintained low-stock set with a full scan of Product, in one statement so
+# both sides come from the same snapshot. Returns (missing, extra): ProductIDs absent
+# from LowStock, and ones in LowStock that are not at or below their reorder level.
+def check_low_stock(connection):
+    rows = connection.execute('''
+        SELECT ProductID, 0
+        FROM Product
+        WHERE QuantityInStock <= ReorderLevel AND Deleted = 0 AND ProductID NOT IN (SELECT ProductID FROM LowStock)
+        UNION ALL
+        SELECT ProductID, 1
+        FROM LowStock
+        WHERE ProductID NOT IN (SELECT ProductID FROM Product WHERE QuantityInStock <= ReorderLevel AND Deleted = 0)
+    ''').fetchall()
+    return ([product_id for product_id, extra in rows if not extra],
+            [product_id for product_id, extra in rows if extra])
+
+
+# Insert a new product inside the caller's transaction and return its ProductID
+def insert_product(connection, product_name, quantity_in_stock, reorder_level, cost_per_unit, unit_price):
+    product_id = connection.execute('''
+        INSERT INTO Product (ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (product_name, quantity_in_stock, reorder_level, unit_price, cost_per_unit)).lastrowid
+    log_stock_movement(connection, product_id, quantity_in_stock, 'initial')
+    return product_id
+
+
+# Add a new product and return its ProductID
+def create_product(connection, product_name, quantity_in_stock, reorder_level, cost_per_unit, unit_price):
+    product_id = insert_product(connection, product_name, quantity_in_stock, reorder_level, cost_per_unit, unit_price)
+    connection.commit()
+    return product_id
+
+
+# Update the given fields of a product, leaving those passed as None unchanged.
+# Returns False if the product does not exist.
+def modify_product(connection, product_id, quantity_in_stock=None, reorder_level=None, unit_price=None,
+                   cost_per_unit=None):
+    fields = {
+        "QuantityInStock": quantity_in_stock,
+        "ReorderLevel": reorder_level,
+        "UnitPrice": unit_price,
+        "CostPerUnit": cost_per_unit,
+    }
+    fields = {column: value for column, value in fields.items() if value is not None}
+
+    if not fields:
+        return get_product(connection, product_id) is not None
+
+    # Log the stock change in the same transaction as the update. Setting a higher
+    # quantity counts as a restock, a lower one as an adjustment.
+    if quantity_in_stock is not None:
+        connection.execute('''
+            INSERT INTO StockMovement (ProductID, Change, Kind)
+            SELECT ProductID, ? - COALESCE(QuantityInStock, 0),
+                   CASE WHEN ? > COALESCE(QuantityInStock, 0) THEN 'restock' ELSE 'adjustment' END
+            FROM Product
+            WHERE ProductID = ? AND Deleted = 0 AND COALESCE(QuantityInStock, 0) != ?
+        ''', (quantity_in_stock, quantity_in_stock, product_id, quantity_in_stock))
+
+    updated = connection.execute(f'''
+        UPDATE Product
+        SET {', '.join(f'{column} = ?' for column in fields)}
+        WHERE ProductID = ? AND Deleted = 0
+    ''', (*fields.values(), product_id)).rowcount
+
+    connection.commit()
+    return updated > 0
+
+
+# Delete a product. It is only marked as deleted, which hides it everywhere at once;
+# its sales are removed afterwards in small batches by purge_deleted_products().
+# Returns False if the product does not exist.
+def remove_product(connection, product_id):
+    # The stock leaves the ledger with the product
+    connection.execute('''
+        INSERT INTO StockMovement (ProductID, Change, Kind)
+        SELECT ProductID, -QuantityInStock, 'delete'
+        FROM Product
+        WHERE ProductID = ? AND Deleted = 0 AND COALESCE(QuantityInStock, 0) != 0
+    ''', (product_id,))
+
+    deleted = connection.execute('''
+        UPDATE Product
+        SET Deleted = 1
+        WHERE ProductID = ? AND Deleted = 0
+    ''', (product_id,)).rowcount
+
+    connection.commit()
+    return deleted > 0
+
+
+# Stock ledger. StockMovement is an append-only log of every change to the stock of
+# the Main location: the opening stock of each product ('initial'), sales, restocks
+# and adjustments made through modify_product(), transfers and deletions. Each
+# movement is written in the transaction that changes Product.QuantityInStock, so
+# the two always agree; check_stock_ledger() verifies it. snapshot_stock() compacts
+# each product's movements into a StockSnapshot row from time to time, so the stock
+# at a past date is its nearest snapshot plus the short run of movements after it,
+# however long the history grows. Movements are timestamped in UTC and outlive the
+# purge of their product. The stock of the other locations is not in the ledger.
+
+# Largest rowid SQLite can assign, an upper bound for MovementIDs
+MAX_ROWID = 2 ** 63 - 1
+
+
+# Append a stock movement inside the caller's transaction; a zero change is not logged
+def log_stock_movement(connection, product_id, change, kind, reference=None):
+    if change:
+        connection.execute('''
+            INSERT INTO StockMovement (ProductID, Change, Kind, Reference)
+            VALUES (?, ?, ?, ?)
+        ''', (product_id, change, kind, reference))
+
+
+# Open the ledger of every product that has none yet (bulk-inserted products) with
+# its current stock, inside the caller's transaction
+def open_stock_ledger(connection):
+    connection.execute('''
+        INSERT INTO StockMovement (ProductID, Change, Kind)
+        SELECT ProductID, QuantityInStock, 'initial'
+        FROM Product
+        WHERE Deleted = 0 AND COALESCE(QuantityInStock, 0) != 0
+          AND NOT EXISTS (SELECT 1 FROM StockMovement WHERE StockMovement.ProductID = Product.ProductID)
+        ORDER BY ProductID
+    ''')
+
+
+# Compact the ledger: snapshot the stock of every product with at least min_movements
+# movements since its last snapshot; purged products keep their movements but get no
+# more snapshots. Returns the number of snapshots taken.
+def snapshot_stock(connection, min_movements=1):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        # With a single MAX() in the query, MovedAt comes from the latest movement's row
+        taken = connection.execute('''
+            INSERT INTO StockSnapshot (ProductID, MovementID, QuantityInStock, TakenAt)
+            SELECT StockMovement.ProductID, MAX(StockMovement.MovementID),
+                   COALESCE(Latest.QuantityInStock, 0) + SUM(StockMovement.Change), StockMovement.MovedAt
+            FROM StockMovement
+            LEFT JOIN (
+                SELECT ProductID, MAX(MovementID) as MovementID, QuantityInStock
+                FROM StockSnapshot
+                GROUP BY ProductID
+            ) AS Latest ON StockMovement.ProductID = Latest.ProductID
+            WHERE StockMovement.MovementID > COALESCE(Latest.MovementID, 0)
+              AND EXISTS (SELECT 1 FROM Product WHERE Product.ProductID = StockMovement.ProductID)
+            GROUP BY StockMovement.ProductID
+            HAVING COUNT(*) >= ?
+        ''', (min_movements,)).rowcount
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return taken
+
+
+# A product's stock at the Main location at the end of the day as_of (local time), or
+# None if the product never existed; a purged product is still answered from the
+# movements it left in the ledger. Reads the last snapshot taken by then and adds the
+# movements recorded after it, up to the next snapshot at most.
+def get_stock_at(connection, product_id, as_of):
+    # Local midnight after the day, in UTC like the timestamps
+    end = datetime.datetime.combine(parse_sale_date(as_of) + datetime.timedelta(days=1), datetime.time())
+    end = end.astimezone(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    if connection.execute('''
+        SELECT 1 FROM Product WHERE ProductID = ?
+        UNION ALL
+        SELECT 1 FROM StockMovement WHERE ProductID = ?
+        LIMIT 1
+    ''', (product_id, product_id)).fetchone() is None:
+        return None
+
+    snapshot_id, snapshot_quantity = connection.execute('''
+        SELECT MovementID, QuantityInStock
+        FROM StockSnapshot
+        WHERE ProductID = ? AND TakenAt < ?
+        ORDER BY MovementID DESC
+        LIMIT 1
+    ''', (product_id, end)).fetchone() or (0, 0)
+
+    # The next snapshot was taken after the day, so no later movement can count
+    next_snapshot_id = connection.execute('''
+        SELECT MIN(MovementID)
+        FROM StockSnapshot
+        WHERE ProductID = ? AND MovementID > ?
+    ''', (product_id, snapshot_id)).fetchone()[0]
+
+    return snapshot_quantity + connection.execute('''
+        SELECT COALESCE(SUM(Change), 0)
+        FROM StockMovement
+        WHERE ProductID = ? AND MovementID > ? AND MovementID <= ? AND MovedAt < ?
+    ''', (product_id, snapshot_id, next_snapshot_id or MAX_ROWID, end)).fetchone()[0]
+
+
+# Products whose stock disagrees with their ledger, as (ProductID, ProductName,
+# QuantityInStock, LedgerQuantity). The ledger is read from the latest snapshots,
+# or with full=True added up from the first movement, which also checks the snapshots.
+def check_stock_ledger(connection, full=False):
+    snapshots = '''
+        SELECT ProductID, MAX(MovementID) as MovementID, QuantityInStock
+        FROM StockSnapshot
+        GROUP BY ProductID
+    ''' if not full else "SELECT NULL as ProductID, 0 as MovementID, 0 as QuantityInStock WHERE 0"
+
+    return connection.execute(f'''
+        SELECT Product.ProductID, Product.ProductName, Product.QuantityInStock,
+               COALESCE(Latest.QuantityInStock, 0) + COALESCE((
+                   SELECT SUM(Change)
+                   FROM StockMovement
+                   WHERE StockMovement.ProductID = Product.ProductID
+                     AND StockMovement.MovementID > COALESCE(Latest.MovementID, 0)
+               ), 0) as LedgerQuantity
+        FROM Product
+        LEFT JOIN ({snapshots}) AS Latest ON Product.ProductID = Latest.ProductID
+        WHERE Product.Deleted = 0 AND LedgerQuantity != COALESCE(Product.QuantityInStock, 0)
+        ORDER BY Product.ProductID
+    ''').fetchall()
+
+
+# Append an adjustment for every product whose ledger disagrees with its stock, taking
+# Product.QuantityInStock as correct. Returns the mismatches that were repaired.
+def reconcile_stock_ledger(connection, full=False):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        mismatches = check_stock_ledger(connection, full)
+        for product_id, _, quantity_in_stock, ledger_quantity in mismatches:
+            log_stock_movement(connection, product_id, (quantity_in_stock or 0) - ledger_quantity, 'adjustment')
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return mismatches
+
+
+# Tables of the archive file that purged products and sales can be copied to
+ARCHIVE_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS archive.Product (
+        ProductID INTEGER PRIMARY KEY,
+        ProductName TEXT,
+        QuantityInStock INTEGER,
+        ReorderLevel INTEGER,
+        UnitPrice REAL,
+        CostPerUnit REAL
+    );
+
+    CREATE TABLE IF NOT EXISTS archive.Sales (
+        SaleID INTEGER PRIMARY KEY,
+        ProductID INTEGER,
+        QuantitySold INTEGER,
+        SaleDate TEXT
+    );
+'''
+
+
+# Attach an archive file to the connection as "archive", creating its tables if needed
+def attach_archive(connection, archive_path):
+    connection.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+    connection.executescript(ARCHIVE_SCHEMA_SQL)
+
+
+# Purge one batch of up to chunk_size sales of a deleted product, copying them to the
+# attached archive first if archive is set. Each batch is its own short write
+# transaction, so tills are never held up for long; once a product has no sales left,
+# its row is deleted. Its stock movements stay in the ledger as the record of what
+# happened to its stock. Returns the number of rows removed, 0 when nothing is left.
+def purge_deleted_products(connection, chunk_size=2000, archive=False):
+    row = connection.execute("SELECT ProductID FROM Product WHERE Deleted = 1 LIMIT 1").fetchone()
+    if row is None:
+        return 0
+    product_id = row[0]
+
+    # The batch is the product's sales up to a SaleID; no sales are added to a deleted product
+    last_sale_id = connection.execute('''
+        SELECT MAX(SaleID)
+        FROM (SELECT SaleID FROM Sales WHERE ProductID = ? ORDER BY SaleID LIMIT ?)
+    ''', (product_id, chunk_size)).fetchone()[0]
+
+    # Archive in a transaction of its own, committed before the sales are deleted, so a
+    # crash in between leaves them in both places and the next batch copies them again
+    if archive:
+        connection.execute("BEGIN")
+        try:
+            connection.execute(f'''
+                INSERT OR REPLACE INTO archive.Product ({', '.join(PRODUCT_COLUMNS)})
+                SELECT {', '.join(PRODUCT_COLUMNS)}
+                FROM main.Product
+                WHERE ProductID = ?
+            ''', (product_id,))
+            if last_sale_id is not None:
+                connection.execute('''
+                    INSERT OR IGNORE INTO archive.Sales (SaleID, ProductID, QuantitySold, SaleDate)
+                    SELECT SaleID, ProductID, QuantitySold, SaleDate
+                    FROM main.Sales
+                    WHERE ProductID = ? AND SaleID <= ?
+                ''', (product_id, last_sale_id))
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+    # With no sales left in the hot table, remove its archived sales. Those live in
+    # separate files, so this does not hold up writers to the inventory either.
+    if last_sale_id is None:
+        purge_archived_sales(connection, product_id, archive)
+        purge_location_sales(connection, product_id)
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        if last_sale_id is not None:
+            removed = connection.execute('''
+                DELETE FROM main.Sales
+                WHERE ProductID = ? AND SaleID <= ?
+            ''', (product_id, last_sale_id)).rowcount
+        else:
+            # Take the archived sales out of the summaries, as the triggers did for the
+            # others, then delete the product; the cascade finds nothing left to delete
+            connection.execute('''
+                UPDATE MonthlySalesSummary
+                SET SaleCount = MonthlySalesSummary.SaleCount - Archived.SaleCount,
+                    TotalQuantity = MonthlySalesSummary.TotalQuantity - Archived.TotalQuantity
+                FROM (SELECT SaleMonth, SaleCount, TotalQuantity FROM ArchivedSalesSummary WHERE ProductID = ?) AS Archived
+                WHERE MonthlySalesSummary.SaleMonth = Archived.SaleMonth
+            ''', (product_id,))
+            connection.execute("DELETE FROM MonthlySalesSummary WHERE SaleCount <= 0")
+            connection.execute("DELETE FROM ProductSalesSummary WHERE ProductID = ?", (product_id,))
+            connection.execute("DELETE FROM ArchivedSalesSummary WHERE ProductID = ?", (product_id,))
+
+            removed = connection.execute('''
+                DELETE FROM main.Product
+                WHERE ProductID = ? AND Deleted = 1
+            ''', (product_id,)).rowcount
+            connection.execute("DELETE FROM main.ProductForecast WHERE ProductID = ?", (product_id,))
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return removed
+
+
+# Delete a deleted product's stock and sales from the database of every location other
+# than Main, one transaction per location; the triggers there update its summaries.
+# Their SaleIDs are only unique within each location, so they are not archived.
+def purge_location_sales(connection, product_id):
+    for location_id, _, _ in get_locations(connection)[1:]:
+        with location_connection(connection, location_id) as shard:
+            shard.execute("BEGIN IMMEDIATE")
+            try:
+                shard.execute("DELETE FROM LocationStock WHERE ProductID = ?", (product_id,))
+                shard.execute("DELETE FROM Sales WHERE ProductID = ?", (product_id,))
+                shard.commit()
+            except BaseException:
+                shard.rollback()
+                raise
+
+
+# Delete a deleted product's sales from the archive partitions that hold any of its
+# months, copying them to the attached purge archive first if archive is set
+def purge_archived_sales(connection, product_id, archive=False):
+    first_month, last_month = connection.execute('''
+        SELECT MIN(SaleMonth), MAX(SaleMonth)
+        FROM ArchivedSalesSummary
+        WHERE ProductID = ?
+    ''', (product_id,)).fetchone()
+    if first_month is None:
+        return
+
+    for partition, path in archive_partitions(connection, f"{first_month}-01", f"{last_month}-31"):
+        schema = attach_partition(connection, partition, path)
+        connection.execute("BEGIN")
+        try:
+            if archive:
+                connection.execute(f'''
+                    INSERT OR IGNORE INTO archive.Sales (SaleID, ProductID, QuantitySold, SaleDate)
+                    SELECT SaleID, ProductID, QuantitySold, SaleDate
+                    FROM {schema}.Sales
+                    WHERE ProductID = ?
+                ''', (product_id,))
+            connection.execute(f"DELETE FROM {schema}.Sales WHERE ProductID = ?", (product_id,))
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            connection.execute(f"DETACH DATABASE {schema}")
+
+
+# Background purge of deleted products. A worker thread with its own connection runs
+# purge_deleted_products() batch after batch, pausing between batches so that other
+# writers get the lock, until nothing is left; notify() wakes it after a delete. It
+# also picks up purges left unfinished by an earlier run when it starts.
+class ProductPurger:
+    def __init__(self, path=DATABASE_PATH, archive_path=None, chunk_size=2000, pause=0.05, retry_delay=5):
+        self.chunk_size = chunk_size
+        self.pause = pause
+        self.retry_delay = retry_delay
+        self.archive = archive_path is not None
+        self.connection = connect(path)
+        if self.archive:
+            attach_archive(self.connection, archive_path)
+        self.wake = threading.Event()
+        self.wake.set()
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, name="ProductPurger", daemon=True)
+        self.thread.start()
+
+    def notify(self):
+        self.wake.set()
+
+    # Stop after the current batch
+    def close(self):
+        self.stopping = True
+        self.wake.set()
+        self.thread.join()
+        self.connection.close()
+
+    def _run(self):
+        while not self.stopping:
+            self.wake.wait()
+            self.wake.clear()
+
+            while not self.stopping:
+                try:
+                    removed = purge_deleted_products(self.connection, self.chunk_size, self.archive)
+                except sqlite3.Error:
+                    # Most likely the database stayed busy; try again later
+                    self.wake.wait(self.retry_delay)
+                    continue
+
+                if not removed:
+                    break
+                time.sleep(self.pause)
+
+
+# Sales archival. Sales dated before a horizon are moved out of the hot Sales table
+# into archive partitions, one database file per year or month, so the tables behind
+# the sales view and new sales stay small. Their totals per product and month are
+# kept in ArchivedSalesSummary, so the all-time summaries and reports need no
+# archive at all; only queries over a date range that reaches back into the
+# archives read the partitions they need, through sales_tables().
+
+# Tables of an archive partition, attached under {schema}
+PARTITION_SCHEMA_SQL = '''
+    CREATE TABLE IF NOT EXISTS {schema}.Sales (
+        SaleID INTEGER PRIMARY KEY,
+        ProductID INTEGER,
+        QuantitySold INTEGER,
+        SaleDate TEXT
+    );
+    CREATE INDEX IF NOT EXISTS {schema}.SalesByProductID ON Sales (ProductID);
+    CREATE INDEX IF NOT EXISTS {schema}.SalesBySaleDate ON Sales (SaleDate);
+'''
+
+# Length of the SaleDate prefix that names a partition
+PARTITION_KEY_LENGTHS = {'year': 4, 'month': 7}
+
+
+# Path of the connection's main database file ('' for an in-memory database)
+def database_file(connection):
+    for _, name, path in connection.execute("PRAGMA database_list"):
+        if name == 'main':
+            return path
+
+
+# First day of a partition ('2023' or '2023-04') and of the one after it
+def partition_bounds(partition):
+    if len(partition) == 4:
+        return f"{partition}-01-01", f"{int(partition) + 1:04d}-01-01"
+    year, month = (int(part) for part in partition.split('-'))
+    return f"{partition}-01", f"{year + month // 12:04d}-{month % 12 + 1:02d}-01"
+
+
+# Archive partitions holding sales dated from date_from to date_to (ISO dates, either may be None)
+def archive_partitions(connection, date_from=None, date_to=None):
+    return connection.execute('''
+        SELECT Partition, Path
+        FROM SalesArchive
+        WHERE (? IS NULL OR LastDate >= ?) AND (? IS NULL OR FirstDate <= ?)
+        ORDER BY Partition
+    ''', (date_from, date_from, date_to, date_to)).fetchall()
+
+
+# Attach an archive partition unless it already is, creating its tables if create is
+# set. Relative paths are taken from the directory of the database. Returns the
+# schema name it is attached under.
+def attach_partition(connection, partition, path, create=False):
+    schema = f"Sales_{partition.replace('-', '_')}"
+    if schema in {row[1] for row in connection.execute("PRAGMA database_list")}:
+        return schema
+
+    path = os.path.join(os.path.dirname(database_file(connection)), path)
+    if not create and not os.path.exists(path):
+        raise ValueError(f"Archive partition {partition} is missing: {path}")
+    connection.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    connection.executescript(PARTITION_SCHEMA_SQL.format(schema=schema))
+    return schema
+
+
+# Move the sales dated before `before` into archive partitions of the given period
+# ('year' or 'month'), created in directory (default: next to the database). Each
+# batch is first copied to its partition, then added to ArchivedSalesSummary and
+# deleted from Sales in one short write transaction with the summary triggers
+# paused, so the all-time summaries stay as they are. A crash between the two steps
+# leaves the batch in both places until archive_sales() runs again and finishes it.
+# Returns the number of sales moved.
+def archive_sales(connection, before, period='year', directory=None, batch_size=50000):
+    before = parse_sale_date(before).isoformat()
+    key_length = PARTITION_KEY_LENGTHS[period]
+    database_directory = os.path.dirname(database_file(connection))
+    stem = os.path.splitext(os.path.basename(database_file(connection)))[0] or "inventory"
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection.execute("CREATE TEMP TABLE IF NOT EXISTS ArchiveBatch (SaleID INTEGER PRIMARY KEY)")
+
+    moved = 0
+    while True:
+        # The oldest partition still holding sales before the horizon
+        row = connection.execute('''
+            SELECT substr(SaleDate, 1, ?)
+            FROM main.Sales
+            WHERE SaleDate < ? AND date(SaleDate) = substr(SaleDate, 1, 10)
+            ORDER BY SaleDate
+            LIMIT 1
+        ''', (key_length, before)).fetchone()
+        if row is None:
+            return moved
+
+        partition = row[0]
+        start, end = partition_bounds(partition)
+        registered = connection.execute("SELECT Path FROM SalesArchive WHERE Partition = ?", (partition,)).fetchone()
+        path = registered[0] if registered else os.path.relpath(
+            os.path.join(directory or database_directory, f"{stem}-sales-{partition}.db"), database_directory)
+        schema = attach_partition(connection, partition, path, create=True)
+
+        try:
+            while True:
+                batch = archive_batch(connection, partition, path, schema, start, min(end, before), batch_size)
+                if not batch:
+                    break
+                moved += batch
+        finally:
+            connection.execute(f"DETACH DATABASE {schema}")
+
+
+# Move one batch of the sales dated from start up to end into an attached partition
+def archive_batch(connection, partition, path, schema, start, end, batch_size):
+    connection.execute("BEGIN")
+    try:
+        connection.execute("DELETE FROM temp.ArchiveBatch")
+        count = connection.execute('''
+            INSERT INTO temp.ArchiveBatch (SaleID)
+            SELECT SaleID
+            FROM main.Sales
+            WHERE SaleDate >= ? AND SaleDate < ? AND date(SaleDate) = substr(SaleDate, 1, 10)
+            ORDER BY SaleDate
+            LIMIT ?
+        ''', (start, end, batch_size)).rowcount
+        connection.execute(f'''
+            INSERT OR IGNORE INTO {schema}.Sales (SaleID, ProductID, QuantitySold, SaleDate)
+            SELECT SaleID, ProductID, QuantitySold, SaleDate
+            FROM main.Sales
+            WHERE SaleID IN (SELECT SaleID FROM temp.ArchiveBatch)
+        ''')
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    if not count:
+        return 0
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        connection.execute('''
+            INSERT INTO ArchivedSalesSummary (ProductID, SaleMonth, SaleCount, TotalQuantity)
+            SELECT ProductID, strftime('%Y-%m', SaleDate) as SaleMonth, COUNT(*), SUM(QuantitySold)
+            FROM main.Sales
+            WHERE SaleID IN (SELECT SaleID FROM temp.ArchiveBatch)
+            GROUP BY ProductID, SaleMonth
+            ON CONFLICT (ProductID, SaleMonth) DO UPDATE SET
+                SaleCount = SaleCount + excluded.SaleCount,
+                TotalQuantity = TotalQuantity + excluded.TotalQuantity
+        ''')
+
+        connection.execute("UPDATE SummaryMaintenance SET Paused = 1")
+        moved = connection.execute('''
+            DELETE FROM main.Sales
+            WHERE SaleID IN (SELECT SaleID FROM temp.ArchiveBatch)
+        ''').rowcount
+        connection.execute("UPDATE SummaryMaintenance SET Paused = 0")
+
+        # Registering the partition last keeps a half-copied first batch out of queries
+        connection.execute(f'''
+            INSERT INTO SalesArchive (Partition, Path, FirstDate, LastDate)
+            VALUES (?, ?, (SELECT MIN(SaleDate) FROM {schema}.Sales), (SELECT MAX(SaleDate) FROM {schema}.Sales))
+            ON CONFLICT (Partition) DO UPDATE SET
+                FirstDate = excluded.FirstDate,
+                LastDate = excluded.LastDate
+        ''', (partition, path))
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return moved
+
+
+# The tables holding the sales dated date_from to date_to (either may be None), one
+# at a time: the archive partitions overlapping the range, oldest first, then
+# main.Sales and, if locations is set, the sales of the locations other than Main.
+# Each is yielded as a table or subquery with the columns SaleID, ProductID,
+# QuantitySold, SaleDate and LocationID. A partition is attached only while it is
+# read and detached before the next one, as is each location's database, so any
+# number of them can be read despite SQLite's limit on attached databases; finish
+# reading each table before moving on.
+def sales_tables(connection, date_from=None, date_to=None, locations=True):
+    date_from = parse_sale_date(date_from).isoformat() if date_from else None
+    date_to = parse_sale_date(date_to).isoformat() if date_to else None
+
+    for partition, path in archive_partitions(connection, date_from, date_to):
+        attached = {row[1] for row in connection.execute("PRAGMA database_list")}
+        schema = attach_partition(connection, partition, path)
+        try:
+            # Archived sales all come from the Main location
+            yield (f"(SELECT SaleID, ProductID, QuantitySold, SaleDate, {MAIN_LOCATION_ID} AS LocationID "
+                   f"FROM {schema}.Sales)")
+        finally:
+            if schema not in attached:
+                connection.execute(f"DETACH DATABASE {schema}")
+
+    yield "main.Sales"
+    if not locations:
+        return
+
+    # The location databases likewise, one at a time
+    for location_id, _, shard_path in get_locations(connection):
+        if shard_path is None:
+            continue
+        path = location_path(connection, location_id)
+        schema = f"Location_{location_id}"
+        connection.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+        try:
+            yield f"{schema}.Sales"
+        finally:
+            connection.execute(f"DETACH DATABASE {schema}")
+
+
+# Decrement the stock only if enough is left and insert the sale, inside the caller's
+# transaction. Returns the new SaleID; raises ValueError (writing nothing) if the
+# product does not exist or has too little stock.
+def apply_sale(connection, product_id, quantity_sold, sale_date):
+    updated = connection.execute('''
+        UPDATE Product
+        SET QuantityInStock = QuantityInStock - ?
+        WHERE ProductID = ? AND QuantityInStock >= ? AND Deleted = 0
+    ''', (quantity_sold, product_id, quantity_sold)).rowcount
+
+    if updated == 0:
+        product = connection.execute('''
+            SELECT QuantityInStock
+            FROM Product
+            WHERE ProductID = ? AND Deleted = 0
+        ''', (product_id,)).fetchone()
+        validate_sale(product_id, product[0] if product else None, str(quantity_sold), None)
+        raise ValueError(f"Error: Quantity in stock is less than quantity sold ({quantity_sold}).")
+
+    sale_id = connection.execute('''
+        INSERT INTO Sales (ProductID, QuantitySold, SaleDate)
+        VALUES (?, ?, ?)
+    ''', (product_id, quantity_sold, str(sale_date))).lastrowid
+    log_stock_movement(connection, product_id, -quantity_sold, 'sale', sale_id)
+    return sale_id
+
+
+# Record a sale atomically. The conditional decrement and the insert run in one
+# BEGIN IMMEDIATE transaction, so concurrent tills can neither oversell nor lose an
+# update. Returns the new SaleID; raises ValueError if the product does not exist
+# or has too little stock.
+def record_sale(connection, product_id, quantity_sold, sale_date):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        sale_id = apply_sale(connection, product_id, quantity_sold, sale_date)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return sale_id
+
+
+# Validate a sale record (a dict with ProductID, QuantitySold and an optional SaleDate,
+# blank meaning today) and apply it inside the caller's transaction. Returns the new
+# SaleID; raises ValueError, writing nothing, if the sale is invalid or out of stock.
+def apply_sale_record(connection, sale):
+    product_id = record_field(sale, 'ProductID')
+    if not product_id.isdigit():
+        raise ValueError(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+
+    quantity_sold = record_field(sale, 'QuantitySold')
+    if not quantity_sold.isdigit():
+        raise ValueError("Invalid input. Please enter a valid integer for the quantity sold.")
+
+    sale_date = record_field(sale, 'SaleDate')
+    sale_date = parse_sale_date(sale_date) if sale_date else datetime.date.today()
+
+    return apply_sale(connection, int(product_id), int(quantity_sold), sale_date)
+
+
+# Record a batch of sale records with a single commit. A sale that fails validation
+# or stock checks writes nothing and does not affect the others.
+# Returns one {"SaleID": ...} or {"Error": ...} result per sale, in order.
+def record_sales(connection, sales):
+    results = []
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        for sale in sales:
+            try:
+                results.append({"SaleID": apply_sale_record(connection, sale)})
+            except ValueError as error:
+                results.append({"Error": str(error)})
+
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return results
+
+
+# Write-behind group commit. Writes submitted from any thread are queued and a
+# single writer thread applies everything that arrives within max_delay seconds of
+# the first queued write (or up to max_batch writes) in one transaction, so the
+# cost of a commit is shared by the whole batch. Each write runs in its own
+# savepoint, so one failing write does not undo the others.
+#
+# submit() returns a concurrent.futures.Future that resolves only after the batch
+# has committed. The writer's connection uses synchronous=FULL, so a resolved
+# future means the write is durable.
+class WriteBatcher:
+    def __init__(self, path=DATABASE_PATH, max_delay=0.002, max_batch=1000):
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.connection = connect(path, synchronous="FULL")
+        self.pending = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="WriteBatcher", daemon=True)
+        self.thread.start()
+
+    # Queue function(connection, *args) for the next group commit. The function must
+    # not commit; its return value or exception is delivered through the future.
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        self.pending.put((future, function, args))
+        return future
+
+    def submit_sale(self, product_id, quantity_sold, sale_date):
+        return self.submit(apply_sale, product_id, quantity_sold, sale_date)
+
+    # Commit everything already queued, then stop the writer thread
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+        self.connection.close()
+
+    def _run(self):
+        while True:
+            write = self.pending.get()
+            if write is None:
+                return
+
+            batch = [write]
+            deadline = time.monotonic() + self.max_delay
+            stopping = False
+
+            while len(batch) < self.max_batch:
+                try:
+                    write = self.pending.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if write is None:
+                    stopping = True
+                    break
+                batch.append(write)
+
+            self._commit(batch)
+            if stopping:
+                return
+
+    def _commit(self, batch):
+        outcomes = []
+
+        try:
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            for future, function, args in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                self.connection.execute("SAVEPOINT batched_write")
+                try:
+                    outcomes.append((future, function(self.connection, *args), None))
+                except Exception as error:
+                    self.connection.execute("ROLLBACK TO batched_write")
+                    outcomes.append((future, None, error))
+                self.connection.execute("RELEASE batched_write")
+
+            self.connection.commit()
+        except BaseException as error:
+            if self.connection.in_transaction:
+                self.connection.rollback()
+            for future, function, args in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        # Resolve the futures only once the batch is durable
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+# Locations. The main database is the Main location: its stock is
+# Product.QuantityInStock and its sales are in Sales. Every other location has a
+# database file of its own holding its stock (LocationStock), its sales and their
+# summaries, so each store records sales under its own write lock and never
+# contends with the others. The product catalogue and the list of locations stay in
+# the main database; reports add up the summaries of every location.
+
+MAIN_LOCATION_ID = 1
+
+
+# Create a location with its own database file, by default next to the main
+# database. Returns the new LocationID.
+def add_location(connection, location_name, shard_path=None):
+    if not location_name or not location_name.strip():
+        raise ValueError("Please enter a name for the location.")
+    if connection.execute("SELECT 1 FROM Location WHERE LocationName = ?", (location_name,)).fetchone():
+        raise ValueError(f"A location named {location_name} already exists.")
+
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        location_id = connection.execute("INSERT INTO Location (LocationName) VALUES (?)",
+                                          (location_name,)).lastrowid
+        database_directory = os.path.dirname(database_file(connection))
+        stem = os.path.splitext(os.path.basename(database_file(connection)))[0] or "inventory"
+        path = os.path.relpath(shard_path or os.path.join(database_directory, f"{stem}-location-{location_id}.db"),
+                               database_directory)
+        connection.execute("UPDATE Location SET ShardPath = ? WHERE LocationID = ?", (path, location_id))
+
+        shard = connect(os.path.join(database_directory, path))
+        try:
+            shard.executescript(LOCATION_SCHEMA_SQL)
+        finally:
+            shard.close()
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+
+    return location_id
+
+
+# All locations as (LocationID, LocationName, ShardPath), Main first
+def get_locations(connection):
+    return connection.execute('''
+        SELECT LocationID, LocationName, ShardPath
+        FROM Location
+        ORDER BY LocationID
+    ''').fetchall()
+
+
+# Path of a location's database, or None for the Main location. Raises ValueError if
+# the location does not exist.
+def location_path(connection, location_id):
+    row = connection.execute("SELECT ShardPath FROM Location WHERE LocationID = ?", (location_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"Location with Location ID {location_id} does not exist.")
+    if row[0] is None:
+        return None
+
+    path = os.path.join(os.path.dirname(database_file(connection)), row[0])
+    if not os.path.exists(path):
+        raise ValueError(f"The database of location {location_id} is missing: {path}")
+    return path
+
+
+# Connection to a location's database: the given main connection for Main, otherwise
+# a new connection to the location's file, closed on exit
+@contextlib.contextmanager
+def location_connection(connection, location_id):
+    path = location_path(connection, location_id)
+    if path is None:
+        yield connection
+        return
+
+    shard = connect(path)
+    try:
+        yield shard
+    finally:
+        shard.close()
+
+
+# Tables holding the per-product and per-month sales totals of every location: the
+# main summaries while there is only Main, otherwise temporary tables refilled with
+# the summaries of the main database and of each location database added up. Each
+# location is read on its own connection, as attaching them all would stop at
+# SQLite's limit on attached databases.
+def summary_sources(connection):
+    location_ids = [location_id for location_id, _, shard_path in get_locations(connection) if shard_path is not None]
+    if not location_ids:
+        return "main.ProductSalesSummary", "main.MonthlySalesSummary"
+
+    summaries = (("ProductSalesSummary", "ProductID INTEGER"), ("MonthlySalesSummary", "SaleMonth TEXT"))
+    totals = {table: {} for table, _ in summaries}
+    for location_id in [MAIN_LOCATION_ID, *location_ids]:
+        with location_connection(connection, location_id) as database:
+            for table, _ in summaries:
+                add_sales_totals(totals[table], database.execute(f"SELECT * FROM {table}"))
+
+    return tuple(store_sales_totals(connection, f"All{table}", key, totals[table]) for table, key in summaries)
+
+
+# Add (key, SaleCount, TotalQuantity) rows into totals, a dict of key -> (SaleCount,
+# TotalQuantity)
+def add_sales_totals(totals, rows):
+    for key, sale_count, total_quantity in rows:
+        count, quantity = totals.get(key, (0, None))
+        # NULL quantities are left out of the totals, as SUM() does
+        if total_quantity is not None:
+            quantity = total_quantity if quantity is None else quantity + total_quantity
+        totals[key] = (count + sale_count, quantity)
+
+
+# Replace the rows of the temporary table `table`, shaped like the sales summaries with
+# the given key column, with totals. Returns the table's qualified name.
+def store_sales_totals(connection, table, key, totals):
+    started = not connection.in_transaction
+    connection.execute(f'''
+        CREATE TEMP TABLE IF NOT EXISTS {table} (
+            {key} PRIMARY KEY,
+            SaleCount INTEGER NOT NULL,
+            TotalQuantity INTEGER
+        )
+    ''')
+    connection.execute(f"DELETE FROM temp.{table}")
+    connection.executemany(f"INSERT INTO temp.{table} VALUES (?, ?, ?)",
+                           ((value, count, quantity) for value, (count, quantity) in totals.items()))
+    if started:
+        connection.commit()
+    return f"temp.{table}"
+
+
+# A product's stock at a location (0 where it was never stocked), or None if the
+# product does not exist. Given a ProductCatalog, a product is looked up there rather
+# than in Product, except at Main where the stock itself is read from Product.
+def get_location_stock(connection, location_id, product_id, catalog=None):
+    if int(location_id) == MAIN_LOCATION_ID:
+        product = get_product(connection, product_id)
+        return product["QuantityInStock"] if product else None
+
+    if (catalog.get(product_id) if catalog is not None else get_product(connection, product_id)) is None:
+        return None
+    with location_connection(connection, location_id) as shard:
+        row = shard.execute("SELECT QuantityInStock FROM LocationStock WHERE ProductID = ?", (product_id,)).fetchone()
+    return row[0] if row else 0
+
+
+# Set a product's stock and/or reorder level at a location, stocking it there if it
+# was not. Returns False if the product does not exist.
+def set_location_stock(connection, location_id, product_id, quantity_in_stock=None, reorder_level=None):
+    if int(location_id) == MAIN_LOCATION_ID:
+        return modify_product(connection, product_id, quantity_in_stock=quantity_in_stock, reorder_level=reorder_level)
+
+    if get_product(connection, product_id) is None:
+        return False
+    with location_connection(connection, location_id) as shard:
+        shard.execute('''
+            INSERT INTO LocationStock (ProductID, QuantityInStock, ReorderLevel)
+            VALUES (?, COALESCE(?, 0), COALESCE(?, 0))
+            ON CONFLICT (ProductID) DO UPDATE SET
+                QuantityInStock = COALESCE(?, QuantityInStock),
+                ReorderLevel = COALESCE(?, ReorderLevel)
+        ''', (product_id, quantity_in_stock, reorder_level, quantity_in_stock, reorder_level))
+        shard.commit()
+    return True
+
+
+# Decrement a location's stock and insert the sale into the location's own database,
+# inside the caller's transaction on that database. Returns the new SaleID (unique
+# within the location); raises ValueError if the product has too little stock there.
+def apply_location_sale(shard, location_id, product_id, quantity_sold, sale_date):
+    updated = shard.execute('''
+        UPDATE LocationStock
+        SET QuantityInStock = QuantityInStock - ?
+        WHERE ProductID = ? AND QuantityInStock >= ?
+    ''', (quantity_sold, product_id, quantity_sold)).rowcount
+
+    if updated == 0:
+        stock = shard.execute("SELECT QuantityInStock FROM LocationStock WHERE ProductID = ?", (product_id,)).fetchone()
+        validate_sale(product_id, stock[0] if stock else 0, str(quantity_sold), None)
+        raise ValueError(f"Error: Quantity in stock is less than quantity sold ({quantity_sold}).")
+
+    return shard.execute('''
+        INSERT INTO Sales (ProductID, QuantitySold, SaleDate, LocationID)
+        VALUES (?, ?, ?, ?)
+    ''', (product_id, quantity_sold, str(sale_date), location_id)).lastrowid
+
+
+# Record a sale at a location atomically, locking only that location's database.
+# Returns the new SaleID; raises ValueError if the product does not exist or has too
+# little stock there.
+def record_location_sale(connection, location_id, product_id, quantity_sold, sale_date):
+    if int(location_id) == MAIN_LOCATION_ID:
+        return record_sale(connection, product_id, quantity_sold, sale_date)
+
+    if get_product(connection, product_id) is None:
+        raise ValueError(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+    with location_connection(connection, location_id) as shard:
+        shard.execute("BEGIN IMMEDIATE")
+        try:
+            sale_id = apply_location_sale(shard, int(location_id), product_id, quantity_sold, sale_date)
+            shard.commit()
+        except BaseException:
+            shard.rollback()
+            raise
+    return sale_id
+
+
+# Validate a sale record for a location other than Main (see apply_sale_record()) and
+# apply it inside the caller's transaction on the location's database
+def apply_location_sale_record(shard, sale):
+    product_id = record_field(sale, 'ProductID')
+    if not product_id.isdigit():
+        raise ValueError(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+
+    quantity_sold = record_field(sale, 'QuantitySold')
+    if not quantity_sold.isdigit():
+        raise ValueError("Invalid input. Please enter a valid integer for the quantity sold.")
+
+    sale_date = record_field(sale, 'SaleDate')
+    sale_date = parse_sale_date(sale_date) if sale_date else datetime.date.today()
+
+    return apply_location_sale(shard, int(record_field(sale, 'LocationID')), int(product_id), int(quantity_sold),
+                               sale_date)
+
+
+# Move stock of a product from one location to another. The transfer is logged in the
+# main database, then taken out of the source and added to the destination, each in
+# a transaction on that location's database that also records the leg as applied, so
+# a transfer interrupted half way is finished by resume_transfers() without applying
+# either side twice. Returns the TransferID; raises ValueError, cancelling the
+# transfer, if the source has too little stock.
+def transfer_stock(connection, product_id, from_location_id, to_location_id, quantity, transfer_date=None):
+    if get_product(connection, product_id) is None:
+        raise ValueError(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+    if int(from_location_id) == int(to_location_id):
+        raise ValueError("A transfer needs two different locations.")
+    if int(quantity) <= 0:
+        raise ValueError("Invalid input. The quantity to transfer must be greater than zero.")
+    for location_id in (from_location_id, to_location_id):
+        location_path(connection, location_id)
+
+    transfer_date = parse_sale_date(transfer_date) if transfer_date else datetime.date.today()
+    transfer_id = connection.execute('''
+        INSERT INTO StockTransfer (ProductID, FromLocationID, ToLocationID, Quantity, TransferDate, Status)
+        VALUES (?, ?, ?, ?, ?, 'pending')
+    ''', (product_id, from_location_id, to_location_id, quantity, transfer_date.isoformat())).lastrowid
+    connection.commit()
+
+    complete_transfer(connection, transfer_id)
+    return transfer_id
+
+
+# Apply the legs of a logged transfer that are not applied yet
+def complete_transfer(connection, transfer_id):
+    product_id, from_location_id, to_location_id, quantity, status = connection.execute('''
+        SELECT ProductID, FromLocationID, ToLocationID, Quantity, Status
+        FROM StockTransfer
+        WHERE TransferID = ?
+    ''', (transfer_id,)).fetchone()
+
+    if status == 'pending':
+        try:
+            apply_transfer_leg(connection, from_location_id, transfer_id, 'out', product_id, -quantity)
+        except ValueError:
+            connection.execute("UPDATE StockTransfer SET Status = 'cancelled' WHERE TransferID = ?", (transfer_id,))
+            connection.commit()
+            raise
+        connection.execute("UPDATE StockTransfer SET Status = 'shipped' WHERE TransferID = ?", (transfer_id,))
+        connection.commit()
+        status = 'shipped'
+
+    if status == 'shipped':
+        apply_transfer_leg(connection, to_location_id, transfer_id, 'in', product_id, quantity)
+        connection.execute("UPDATE StockTransfer SET Status = 'done' WHERE TransferID = ?", (transfer_id,))
+        connection.commit()
+
+
+# Change a location's stock by one leg of a transfer, unless that leg was applied already
+def apply_transfer_leg(connection, location_id, transfer_id, leg, product_id, change):
+    with location_connection(connection, location_id) as database:
+        database.execute("BEGIN IMMEDIATE")
+        try:
+            first_time = database.execute('''
+                INSERT OR IGNORE INTO AppliedTransfer (TransferID, Leg)
+                VALUES (?, ?)
+            ''', (transfer_id, leg)).rowcount
+
+            if first_time and location_id == MAIN_LOCATION_ID:
+                updated = database.execute('''
+                    UPDATE Product
+                    SET QuantityInStock = QuantityInStock + ?
+                    WHERE ProductID = ? AND QuantityInStock + ? >= 0
+                ''', (change, product_id, change)).rowcount
+                if updated:
+                    log_stock_movement(database, product_id, change, 'transfer', transfer_id)
+            elif first_time and change > 0:
+                updated = database.execute('''
+                    INSERT INTO LocationStock (ProductID, QuantityInStock, ReorderLevel)
+                    VALUES (?, ?, 0)
+                    ON CONFLICT (ProductID) DO UPDATE SET QuantityInStock = QuantityInStock + excluded.QuantityInStock
+                ''', (product_id, change)).rowcount
+            elif first_time:
+                updated = database.execute('''
+                    UPDATE LocationStock
+                    SET QuantityInStock = QuantityInStock + ?
+                    WHERE ProductID = ? AND QuantityInStock + ? >= 0
+                ''', (change, product_id, change)).rowcount
+            else:
+                updated = 1
+
+            if not updated:
+                raise ValueError(f"Error: Not enough stock at location {location_id} to transfer {-change}.")
+            database.commit()
+        except BaseException:
+            database.rollback()
+            raise
+
+
+# Finish the transfers left half done by an interruption. Returns how many were resumed.
+def resume_transfers(connection):
+    transfer_ids = [row[0] for row in connection.execute('''
+        SELECT TransferID
+        FROM StockTransfer
+        WHERE Status IN ('pending', 'shipped')
+        ORDER BY TransferID
+    ''').fetchall()]
+
+    for transfer_id in transfer_ids:
+        try:
+            complete_transfer(connection, transfer_id)
+        except ValueError:
+            pass
+    return len(transfer_ids)
+
+
+# Products at or below their reorder level at the locations other than Main, or only
+# at location_id, as (LocationID, LocationName, ProductID, ProductName,
+# QuantityInStock, ReorderLevel)
+def get_location_reorder_alerts(connection, location_id=None):
+    locations = get_locations(connection)[1:]
+    if location_id is not None:
+        locations = [location for location in locations if location[0] == int(location_id)]
+
+    alerts = []
+    for location_id, location_name, _ in locations:
+        with location_connection(connection, location_id) as shard:
+            rows = shard.execute('''
+                SELECT ProductID, QuantityInStock, ReorderLevel
+                FROM LocationStock
+                WHERE QuantityInStock <= ReorderLevel
+                ORDER BY ProductID
+            ''').fetchall()
+        if not rows:
+            continue
+
+        names = dict(connection.execute(f'''
+            SELECT ProductID, ProductName
+            FROM Product
+            WHERE ProductID IN ({', '.join('?' * len(rows))}) AND Deleted = 0
+        ''', [row[0] for row in rows]))
+        alerts.extend((location_id, location_name, product_id, names[product_id], stock, reorder_level)
+                      for product_id, stock, reorder_level in rows if product_id in names)
+
+    return alerts
+
+
+# Report data: per-product total sales, total revenue, cost of goods sold, overall
+# profit margin and monthly sales of all locations, all read from the sales summaries.
+# Given a ProductCatalog, the names, prices and costs come from it instead of a join
+# with Product.
+def get_sales_report(connection, catalog=None):
+    product_summary, monthly_summary = summary_sources(connection)
+
+    if catalog is not None:
+        products, total_revenue, total_cogs = catalog_sales_totals(connection, catalog, product_summary)
+    else:
+        products = connection.execute(f'''
+            SELECT Product.ProductID, Product.ProductName, ProductSalesSummary.TotalQuantity as TotalSales
+            FROM Product
+            LEFT JOIN {product_summary} AS ProductSalesSummary ON Product.ProductID = ProductSalesSummary.ProductID
+            WHERE Product.Deleted = 0
+            ORDER BY Product.ProductID
+        ''').fetchall()
+
+        # Calculate total revenue and cost of goods sold from the per-product totals
+        total_revenue, total_cogs = connection.execute(f'''
+            SELECT SUM(TotalQuantity * UnitPrice) AS TotalRevenue, SUM(TotalQuantity * CostPerUnit) AS TotalCOGS
+            FROM {product_summary} AS ProductSalesSummary
+            INNER JOIN Product ON ProductSalesSummary.ProductID = Product.ProductID
+            WHERE Product.Deleted = 0
+        ''').fetchone()
+        total_revenue = total_revenue or 0
+        total_cogs = total_cogs or 0
+
+    # Calculate overall profit margin
+    profit_margin = 0 if total_revenue == 0 else ((total_revenue - total_cogs) / total_revenue) * 100
+
+    monthly_sales = connection.execute(f'''
+        SELECT SaleMonth, TotalQuantity as MonthlySales
+        FROM {monthly_summary}
+        ORDER BY SaleMonth
+    ''').fetchall()
+
+    return {
+        "products": products,
+        "total_revenue": total_revenue,
+        "total_cogs": total_cogs,
+        "profit_margin": profit_margin,
+        "monthly_sales": monthly_sales,
+    }
+
+
+# Per-product total sales, total revenue and cost of goods sold with the products,
+# prices and costs taken from the catalog; only the sales totals are read
+def catalog_sales_totals(connection, catalog, product_summary):
+    totals = dict(connection.execute(f'''
+        SELECT ProductID, TotalQuantity
+        FROM {product_summary} AS ProductSalesSummary
+    ''').fetchall())
+
+    products, total_revenue, total_cogs = [], 0, 0
+    for product_id, product_name, _, unit_price, cost_per_unit in catalog.products():
+        quantity = totals.get(product_id)
+        products.append((product_id, product_name, quantity))
+        # NULL quantities, prices and costs are left out of the totals, as SUM() does
+        if quantity is not None and unit_price is not None:
+            total_revenue += quantity * unit_price
+        if quantity is not None and cost_per_unit is not None:
+            total_cogs += quantity * cost_per_unit
+
+    return products, total_revenue, total_cogs
+
+
+# Stream records from a CSV or JSONL file as dicts, with a parse error (or None) for each
+def read_records(path, file_format):
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            for record in csv.DictReader(file):
+                yield record, None
+        else:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as error:
+                    yield {'Line': line.rstrip('\n')}, f"Invalid JSON: {error}"
+                    continue
+                if not isinstance(record, dict):
+                    yield {'Line': line.rstrip('\n')}, "Invalid JSON: expected an object"
+                    continue
+                yield record, None
+
+
+# Writes rejected records with their error message in the same format as the input
+class RejectWriter:
+    def __init__(self, path, file_format):
+        self.path = path
+        self.file_format = file_format
+        self.file = None
+        self.writer = None
+        self.count = 0
+
+    def write(self, record, error):
+        if self.file is None:
+            self.file = open(self.path, 'w', newline='', encoding='utf-8')
+            if self.file_format == 'csv':
+                self.writer = csv.DictWriter(self.file, fieldnames=list(record) + ['Error'], extrasaction='ignore')
+                self.writer.writeheader()
+
+        if self.file_format == 'csv':
+            self.writer.writerow({**record, 'Error': error})
+        else:
+            self.file.write(json.dumps({**record, 'Error': error}) + '\n')
+        self.count += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+# Read a field from a record, treating a missing or null value as an empty string
+def record_field(record, name):
+    value = record.get(name)
+    return '' if value is None else str(value).strip()
+
+
+# Bulk import products from a CSV/JSONL file with ProductName, QuantityInStock,
+# ReorderLevel, CostPerUnit, UnitPrice and an optional ProductID column.
+# Valid rows are inserted in batches inside a single transaction; invalid rows go to the reject file.
+def import_products(connection, path, file_format, rejects_path, batch_size=50000):
+    cursor = connection.cursor()
+    rejects = RejectWriter(rejects_path, file_format)
+    imported = 0
+    batch = []
+
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("SELECT ProductID FROM Product")
+        existing_ids = {row[0] for row in cursor}
+
+        for record, error in read_records(path, file_format):
+            if error is None:
+                product_id = record_field(record, 'ProductID')
+                try:
+                    if product_id and not product_id.isdigit():
+                        raise ValueError("Invalid input. Please enter a valid integer for the Product ID.")
+                    if product_id and int(product_id) in existing_ids:
+                        raise ValueError(f"Product with Product ID {product_id} already exists.")
+                    fields = validate_product(record_field(record, 'QuantityInStock'),
+                                              record_field(record, 'ReorderLevel'),
+                                              record_field(record, 'CostPerUnit'),
+                                              record_field(record, 'UnitPrice'))
+                except ValueError as exc:
+                    error = str(exc)
+
+            if error is not None:
+                rejects.write(record, error)
+                continue
+
+            product_id = int(product_id) if product_id else None
+            if product_id is not None:
+                existing_ids.add(product_id)
+
+            quantity_in_stock, reorder_level, cost_per_unit, unit_price = fields
+            batch.append((product_id, record_field(record, 'ProductName'), quantity_in_stock, reorder_level,
+                          unit_price, cost_per_unit))
+
+            if len(batch) >= batch_size:
+                cursor.executemany('''
+                    INSERT INTO Product (ProductID, ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', batch)
+                imported += len(batch)
+                batch = []
+
+        if batch:
+            cursor.executemany('''
+                INSERT INTO Product (ProductID, ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', batch)
+            imported += len(batch)
+
+        open_stock_ledger(connection)
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        rejects.close()
+
+    return imported, rejects.count
+
+
+# Bulk import sales from a CSV/JSONL file with ProductID, QuantitySold and SaleDate columns
+# (a blank SaleDate means today). Rows are validated with the same rules as add_sales(),
+# with stock tracked across the file. Sales are inserted in batches while the summary
+# triggers are paused; the stock decrements, with one ledger movement per product, and
+# the summary totals are then applied once per product and month, all inside a single
+# transaction.
+def import_sales(connection, path, file_format, rejects_path, batch_size=50000):
+    cursor = connection.cursor()
+    rejects = RejectWriter(rejects_path, file_format)
+    imported = 0
+    batch = []
+    product_totals = {}
+    month_totals = {}
+
+    # A larger page cache keeps index maintenance for big files in memory
+    cursor.execute("PRAGMA cache_size")
+    cache_size = cursor.fetchone()[0]
+    cursor.execute("PRAGMA cache_size = -262144")
+
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("UPDATE SummaryMaintenance SET Paused = 1")
+        cursor.execute("SELECT ProductID, QuantityInStock FROM Product WHERE Deleted = 0")
+        stock = dict(cursor.fetchall())
+
+        for record, error in read_records(path, file_format):
+            if error is None:
+                product_id = record_field(record, 'ProductID')
+                product_key = int(product_id) if product_id.isdigit() else None
+                try:
+                    quantity_sold, sale_date = validate_sale(product_id, stock.get(product_key),
+                                                             record_field(record, 'QuantitySold'),
+                                                             record_field(record, 'SaleDate'))
+                except ValueError as exc:
+                    error = str(exc)
+
+            if error is not None:
+                rejects.write(record, error)
+                continue
+
+            sale_date = sale_date.isoformat()
+            stock[product_key] -= quantity_sold
+
+            count, total = product_totals.get(product_key, (0, 0))
+            product_totals[product_key] = (count + 1, total + quantity_sold)
+            count, total = month_totals.get(sale_date[:7], (0, 0))
+            month_totals[sale_date[:7]] = (count + 1, total + quantity_sold)
+
+            batch.append((product_key, quantity_sold, sale_date))
+
+            if len(batch) >= batch_size:
+                cursor.executemany('''
+                    INSERT INTO Sales (ProductID, QuantitySold, SaleDate)
+                    VALUES (?, ?, ?)
+                ''', batch)
+                imported += len(batch)
+                batch = []
+
+        if batch:
+            cursor.executemany('''
+                INSERT INTO Sales (ProductID, QuantitySold, SaleDate)
+                VALUES (?, ?, ?)
+            ''', batch)
+            imported += len(batch)
+
+        # Apply and log the stock decrements and the summary totals once per product and month
+        cursor.executemany('''
+            UPDATE Product
+            SET QuantityInStock = QuantityInStock - ?
+            WHERE ProductID = ?
+        ''', [(total, product_id) for product_id, (count, total) in product_totals.items()])
+        cursor.executemany('''
+            INSERT INTO StockMovement (ProductID, Change, Kind)
+            VALUES (?, ?, 'sale')
+        ''', [(product_id, -total) for product_id, (count, total) in product_totals.items() if total])
+
+        cursor.executemany('''
+            INSERT INTO ProductSalesSummary (ProductID, SaleCount, TotalQuantity)
+            VALUES (?, ?, ?)
+            ON CONFLICT (ProductID) DO UPDATE SET
+                SaleCount = SaleCount + excluded.SaleCount,
+                TotalQuantity = TotalQuantity + excluded.TotalQuantity
+        ''', [(product_id, count, total) for product_id, (count, total) in product_totals.items()])
+
+        cursor.executemany('''
+            INSERT INTO MonthlySalesSummary (SaleMonth, SaleCount, TotalQuantity)
+            VALUES (?, ?, ?)
+            ON CONFLICT (SaleMonth) DO UPDATE SET
+                SaleCount = SaleCount + excluded.SaleCount,
+                TotalQuantity = TotalQuantity + excluded.TotalQuantity
+        ''', [(month, count, total) for month, (count, total) in month_totals.items()])
+
+        cursor.execute("UPDATE SummaryMaintenance SET Paused = 0")
+        connection.commit()
+    except BaseException:
+        connection.rollback()
+        raise
+    finally:
+        rejects.close()
+        cursor.execute(f"PRAGMA cache_size = {cache_size}")
+
+    return imported, rejects.count
+
+
+# Column types used for columnar (Parquet) exports
+EXPORT_COLUMN_TYPES = {
+    "ProductID": "int64", "ProductName": "string", "QuantityInStock": "int64", "ReorderLevel": "int64",
+    "UnitPrice": "double", "CostPerUnit": "double", "SaleID": "int64", "QuantitySold": "int64",
+    "SaleDate": "string", "SaleMonth": "string", "SaleCount": "int64", "TotalSales": "int64",
+    "Revenue": "double", "COGS": "double", "LocationID": "int64",
+}
+
+
+# Filters on Sales for the date range and products of an export, as (conditions, params).
+# The sales of deleted products still waiting to be purged are left out unless
+# include_deleted is set.
+def export_sale_filters(date_from=None, date_to=None, product_ids=None, include_deleted=False):
+    filters, params = [], []
+    if date_from:
+        filters.append("Sales.SaleDate >= ?")
+        params.append(parse_sale_date(date_from).isoformat())
+    if date_to:
+        filters.append("Sales.SaleDate <= ?")
+        params.append(parse_sale_date(date_to).isoformat())
+    if product_ids:
+        filters.append(f"Sales.ProductID IN ({', '.join('?' * len(product_ids))})")
+        params.extend(int(product_id) for product_id in product_ids)
+
+    if not include_deleted:
+        filters.append("Sales.ProductID NOT IN (SELECT ProductID FROM main.Product WHERE Deleted = 1)")
+    return filters, params
+
+
+# Build the query for an export, pushing the filters into SQL. Returns (sql, params,
+# column names). Sales exports read sales_table (one of sales_tables()) through its
+# indexes; report and monthly exports read summary tables: the all-time summaries
+# (see summary_sources()) or the totals of the filtered sales (see export_sales_totals()),
+# so the date range is not applied here.
+def build_export_query(kind, date_from=None, date_to=None, product_ids=None, sales_table="main.Sales",
+                       summary_tables=None):
+    product_summary, monthly_summary = summary_tables or ("main.ProductSalesSummary", "main.MonthlySalesSummary")
+    product_filter, product_params = "", []
+    if product_ids:
+        product_filter = f"ProductID IN ({', '.join('?' * len(product_ids))})"
+        product_params = [int(product_id) for product_id in product_ids]
+
+    if kind == 'products':
+        where = "WHERE Deleted = 0" + (f" AND {product_filter}" if product_filter else "")
+        return (f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM Product {where} ORDER BY ProductID", product_params,
+                PRODUCT_COLUMNS)
+
+    if kind == 'sales':
+        filters, params = export_sale_filters(date_from, date_to, product_ids)
+        columns = ["SaleID", "ProductID", "QuantitySold", "SaleDate", "LocationID"]
+        return (f"SELECT {', '.join(columns)} FROM {sales_table} AS Sales WHERE {' AND '.join(filters)} "
+                f"ORDER BY LocationID, SaleID", params, columns)
+
+    if kind == 'report':
+        columns = ["ProductID", "ProductName", "TotalSales", "Revenue", "COGS"]
+        where = "WHERE Product.Deleted = 0" + (f" AND Product.{product_filter}" if product_filter else "")
+        return (f'''
+            SELECT Product.ProductID, Product.ProductName, ProductSalesSummary.TotalQuantity,
+                   ProductSalesSummary.TotalQuantity * Product.UnitPrice,
+                   ProductSalesSummary.TotalQuantity * Product.CostPerUnit
+            FROM Product
+            LEFT JOIN {product_summary} AS ProductSalesSummary ON Product.ProductID = ProductSalesSummary.ProductID
+            {where}
+            ORDER BY Product.ProductID
+        ''', product_params, columns)
+
+    if kind == 'monthly':
+        return (f"SELECT SaleMonth, SaleCount, TotalQuantity FROM {monthly_summary} ORDER BY SaleMonth", [],
+                ["SaleMonth", "SaleCount", "TotalSales"])
+
+    raise ValueError(f"Unknown export: {kind}")
+
+
+# Totals per product and per month of the sales in the range (of the given products
+# only, if any), added up one sales table at a time into temporary tables shaped like
+# the sales summaries. Returns their names, for build_export_query(). Like the
+# summaries, they count the sales of deleted products until the purge removes them;
+# the report leaves those products out through its join with Product.
+def export_sales_totals(connection, date_from=None, date_to=None, product_ids=None):
+    filters, params = export_sale_filters(date_from, date_to, product_ids, include_deleted=True)
+    summaries = (("ProductSalesSummary", "ProductID INTEGER", "Sales.ProductID"),
+                 ("MonthlySalesSummary", "SaleMonth TEXT", "strftime('%Y-%m', Sales.SaleDate)"))
+    totals = {table: {} for table, _, _ in summaries}
+    for sales_table in sales_tables(connection, date_from, date_to):
+        for table, _, key in summaries:
+            add_sales_totals(totals[table], connection.execute(f'''
+                SELECT {key}, COUNT(*), SUM(Sales.QuantitySold)
+                FROM {sales_table} AS Sales
+                WHERE {' AND '.join(filters)}
+                GROUP BY 1
+            ''', params).fetchall())
+
+    return tuple(store_sales_totals(connection, f"Export{table}", key, totals[table]) for table, key, _ in summaries)
+
+
+# Stream an export to CSV, JSONL or Parquet, reading the cursor in chunks so memory
+# stays constant regardless of table size. Sales are written one table at a time (see
+# sales_tables()). Pass a pooled connection so a long export never holds up the
+# caller's own connection. Returns the number of rows written.
+def export_data(connection, kind, path, file_format, date_from=None, date_to=None, product_ids=None, chunk_size=10000):
+    summary_tables = None
+    if kind == 'report' and (date_from or date_to):
+        summary_tables = export_sales_totals(connection, date_from, date_to)
+    elif kind == 'monthly' and (date_from or date_to or product_ids):
+        summary_tables = export_sales_totals(connection, date_from, date_to, product_ids)
+    elif kind in ('report', 'monthly'):
+        summary_tables = summary_sources(connection)
+    _, _, columns = build_export_query(kind, date_from, date_to, product_ids, summary_tables=summary_tables)
+
+    if file_format == 'parquet':
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow. Install it using: pip install pyarrow") from None
+
+    exported = 0
+    export_cursor = connection.cursor()
+
+    if file_format == 'parquet':
+        file = open(path, 'wb')
+        schema = pyarrow.schema([(column, pyarrow.type_for_alias(EXPORT_COLUMN_TYPES[column])) for column in columns])
+        writer = pyarrow.parquet.ParquetWriter(file, schema)
+    else:
+        file = open(path, 'w', newline='', encoding='utf-8')
+        if file_format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(columns)
+
+    with file:
+        for sales_table in (sales_tables(connection, date_from, date_to) if kind == 'sales' else ["main.Sales"]):
+            sql, params, _ = build_export_query(kind, date_from, date_to, product_ids, sales_table, summary_tables)
+            export_cursor.execute(sql, params)
+
+            while True:
+                rows = export_cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                if file_format == 'csv':
+                    writer.writerows(rows)
+                elif file_format == 'jsonl':
+                    file.writelines(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+                else:
+                    # Each chunk becomes one row group of the columnar file
+                    writer.write_table(pyarrow.Table.from_arrays(
+                        [pyarrow.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                        schema=schema))
+
+                exported += len(rows)
+
+        if file_format == 'parquet':
+            writer.close()
+
+    export_cursor.close()
+    return exported
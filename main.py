@@ -1,127 +1,371 @@
+import argparse
+import datetime
+import os
+import queue
 import sqlite3
+import sys
+import threading
+import time
 import PySimpleGUI as sg
-import datetime
-import matplotlib.pyplot as plt
+import metrics
+from collections import OrderedDict
 from io import BytesIO
 
-# Connect to SQLite database or create it if not exists
-conn = sqlite3.connect("inventory_management.db")
+from inventory import (DATABASE_PATH, HOT_QUERIES, MAIN_LOCATION_ID, PRODUCT_COLUMNS, ConnectionPool, DataVersion,
+                       ProductCatalog, ProductPurger, add_location, archive_partitions, archive_sales, attach_archive,
+                       check_query_plans, connect, count_reorder_alerts, create_product, export_data,
+                       check_stock_ledger, get_forecast_alerts, get_location_reorder_alerts, get_location_stock,
+                       get_locations, get_reorder_alerts, get_sales_report, get_stock_at,
+                       import_products, import_sales, migrate_schema, modify_product, purge_deleted_products,
+                       rebuild_aggregates, reconcile_stock_ledger, record_location_sale, remove_product,
+                       resume_transfers, search_products, set_location_stock, snapshot_stock, transfer_stock,
+                       validate_product, validate_sale)
+
+# Connection used by the GUI thread, and the pool for everything else
+conn = connect()
+migrate_schema(conn)
+# Finish any stock transfer an earlier run left half done
+resume_transfers(conn)
 cursor = conn.cursor()
+pool = ConnectionPool()
+data_version = DataVersion()
+# Product names, prices and reorder levels for validation and reports
+catalog = ProductCatalog()
+metrics.register_counters("catalog", catalog.stats)
+
+# Size in inches of the report's monthly sales chart
+CHART_SIZE = (5, 3)
+
+
+# Windowed view over a table, read one page at a time with keyset pagination.
+# Only the requested page plus a prefetch margin is fetched from the database and
+# recently seen pages are kept in a bounded LRU cache, so opening a view costs the
+# same whether the table holds a hundred rows or a few million.
+class PagedQuery:
+    def __init__(self, table, key_column, page_size=15, prefetch_pages=2, cache_pages=32, columns="*", where=None):
+        self.table = table
+        self.key_column = key_column
+        self.columns = columns
+        # Condition the rows must meet, combined with the keyset condition
+        self.where = where
+        self.page_size = page_size
+        self.prefetch_pages = prefetch_pages
+        self.cache_pages = cache_pages
+        self.refresh()
+
+    # Drop cached pages and page boundaries, e.g. after the table was modified
+    def refresh(self):
+        self.pages = OrderedDict()
+        # Page number -> key of the last row before that page (None for the first page)
+        self.boundaries = {0: None}
+        cursor.execute(f"SELECT COUNT(*) FROM {self.table}{self._where()}")
+        self.row_count = cursor.fetchone()[0]
+
+    @property
+    def page_count(self):
+        return max(1, -(-self.row_count // self.page_size))
+
+    def get_page(self, page):
+        page = min(max(page, 0), self.page_count - 1)
+
+        if page in self.pages:
+            self.pages.move_to_end(page)
+            return self.pages[page]
+
+        with metrics.timer(f"view.{self.table}.page_load"):
+            after_key = self._boundary(page)
+            limit = self.page_size * (1 + self.prefetch_pages)
+
+            if after_key is None:
+                cursor.execute(f'''
+                    SELECT {self.columns} FROM {self.table}{self._where()}
+                    ORDER BY {self.key_column}
+                    LIMIT ?
+                ''', (limit,))
+            else:
+                cursor.execute(f'''
+                    SELECT {self.columns} FROM {self.table}
+                    {self._where(f"{self.key_column} > ?")}
+                    ORDER BY {self.key_column}
+                    LIMIT ?
+                ''', (after_key, limit))
+            rows = cursor.fetchall()
+
+        # Split the fetched window into pages and remember where each one starts
+        for offset in range(0, max(len(rows), 1), self.page_size):
+            chunk = [list(row) for row in rows[offset:offset + self.page_size]]
+            number = page + offset // self.page_size
+            self.pages[number] = chunk
+            self.pages.move_to_end(number)
+            if chunk:
+                self.boundaries[number + 1] = chunk[-1][0]
+
+        # Keep the requested page as the most recent entry so eviction never drops it
+        self.pages.move_to_end(page)
+        while len(self.pages) > self.cache_pages:
+            self.pages.popitem(last=False)
+
+        return self.pages[page]
+
+    # Find the key preceding the first row of a page, skipping forward from the nearest known boundary
+    def _boundary(self, page):
+        if page in self.boundaries:
+            return self.boundaries[page]
+
+        known = max(number for number in self.boundaries if number < page)
+        after_key = self.boundaries[known]
+        skip = (page - known) * self.page_size - 1
+
+        if after_key is None:
+            cursor.execute(f'''
+                SELECT {self.key_column} FROM {self.table}{self._where()}
+                ORDER BY {self.key_column}
+                LIMIT 1 OFFSET ?
+            ''', (skip,))
+        else:
+            cursor.execute(f'''
+                SELECT {self.key_column} FROM {self.table}
+                {self._where(f"{self.key_column} > ?")}
+                ORDER BY {self.key_column}
+                LIMIT 1 OFFSET ?
+            ''', (after_key, skip))
+        row = cursor.fetchone()
+
+        self.boundaries[page] = row[0] if row else after_key
+        return self.boundaries[page]
+
+    # WHERE clause of the view's condition and an optional keyset condition
+    def _where(self, key_condition=None):
+        conditions = [condition for condition in (self.where, key_condition) if condition]
+        return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+# Looks up products as the operator types, on a worker thread. search() is called
+# with the text after every keystroke; once no keystroke has come for `delay`
+# seconds, the latest text is searched on a pooled connection and the results are
+# posted to the window as '-SEARCH-RESULTS-' (text, rows), at most `limit` rows.
+class ProductSearcher:
+    def __init__(self, window, delay=0.15, limit=50):
+        self.window = window
+        self.delay = delay
+        self.limit = limit
+        self.pending = queue.Queue()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="ProductSearcher", daemon=True)
+        self.thread.start()
+
+    def search(self, text):
+        self.pending.put(text)
+
+    # Stop the worker; nothing is posted after this returns
+    def close(self):
+        self.closed.set()
+        self.pending.put(None)
+
+    def _run(self):
+        while True:
+            text = self.pending.get()
+
+            # Wait for the typing to pause, keeping only the latest text
+            while text is not None:
+                try:
+                    text = self.pending.get(timeout=self.delay)
+                except queue.Empty:
+                    break
+            if text is None or self.closed.is_set():
+                return
+            if not text.strip():
+                continue
 
-# Create Product and Sales tables if not exists
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Product (
-        ProductID INTEGER PRIMARY KEY,
-        ProductName TEXT,
-        QuantityInStock INTEGER,
-        ReorderLevel INTEGER,
-        UnitPrice REAL,
-        CostPerUnit REAL
-    )
-''')
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS Sales (
-        SaleID INTEGER PRIMARY KEY,
-        ProductID INTEGER,
-        QuantitySold INTEGER,
-        SaleDate TEXT,
-        FOREIGN KEY (ProductID) REFERENCES Product(ProductID)
-    )
-''')
-
-
-# Display stock levels
-def view_stock_levels():
-    cursor.execute("SELECT * FROM Product")
-    rows = cursor.fetchall()
-
-    if not rows:
-        sg.popup("No products in the inventory.")
-        return
+            try:
+                with pool.connection() as connection, metrics.timer("search.products"):
+                    rows = search_products(connection, text, self.limit)
+            except Exception as error:
+                rows = []
+                print(f"Product search failed: {error}", file=sys.stderr)
+            if not self.closed.is_set():
+                self.window.write_event_value('-SEARCH-RESULTS-', (text, [list(row) for row in rows]))
 
-    max_table_height = 15
 
-    # Determine the number of rows to display in the table
-    num_rows_to_display = min(len(rows), max_table_height)
+# Display a paged table window with navigation controls. With search set, a search
+# box above the table finds products by name (or ProductID) instead of paging.
+def show_paged_table(title, source, headings, size=None, search=False):
+    page = 0
 
     layout = [
-        [sg.Table(values=rows, headings=["Product ID", "Name", "Stock", "Reorder Level", "Price", "Cost Per Unit"],
+        [sg.Text('Search:'), sg.InputText(size=(30, 1), key='-SEARCH-', enable_events=True),
+         sg.Text('', key='-MATCHES-', size=(20, 1))] if search else [],
+        [sg.Table(values=source.get_page(page), headings=headings,
                   auto_size_columns=False, justification='right', display_row_numbers=False,
-                  num_rows=num_rows_to_display, enable_events=True, key='-TABLE-')],
-        [sg.Button('OK')]
+                  num_rows=source.page_size, enable_events=True, key='-TABLE-')],
+        [sg.Button('<< First'), sg.Button('< Prev'),
+         sg.Text(f'Page 1 of {source.page_count}', key='-PAGE-'),
+         sg.Button('Next >'), sg.Button('Last >>')],
+        [sg.Text('Go to page:'), sg.InputText(size=(8, 1), key='-GOTO-'), sg.Button('Go'), sg.Button('OK')]
     ]
 
-    window = sg.Window('Stock Levels', layout, grab_anywhere=False, resizable=True, element_justification="center")
+    window = sg.Window(title, layout, grab_anywhere=False, resizable=True, size=size, element_justification="center",
+                       finalize=True)
+
+    # Page Up / Page Down scroll through the pages
+    window.bind('<Prior>', '< Prev')
+    window.bind('<Next>', 'Next >')
+
+    searcher = ProductSearcher(window) if search else None
 
     while True:
         event, values = window.read()
 
         if event == sg.WIN_CLOSED or event == 'OK':
             break
+        elif event == '-SEARCH-':
+            searcher.search(values['-SEARCH-'])
+            if values['-SEARCH-'].strip():
+                continue
+            # Cleared: back to the current page
+            window['-MATCHES-'].update('')
+        elif event == '-SEARCH-RESULTS-':
+            text, rows = values[event]
+            # Results for text that has since been edited are stale
+            if text == values['-SEARCH-']:
+                window['-TABLE-'].update(values=rows)
+                window['-MATCHES-'].update(f"{len(rows)} match{'es' if len(rows) != 1 else ''}")
+            continue
+        elif event == '<< First':
+            page = 0
+        elif event == '< Prev':
+            page = max(page - 1, 0)
+        elif event == 'Next >':
+            page = min(page + 1, source.page_count - 1)
+        elif event == 'Last >>':
+            page = source.page_count - 1
+        elif event == 'Go':
+            if not values['-GOTO-'].isdigit():
+                sg.popup("Invalid input. Please enter a valid page number.")
+                continue
+            page = min(max(int(values['-GOTO-']) - 1, 0), source.page_count - 1)
+        else:
+            continue
+
+        # Paging leaves the search
+        if search and values['-SEARCH-']:
+            window['-SEARCH-'].update('')
+            window['-MATCHES-'].update('')
+            searcher.search('')
+
+        window['-TABLE-'].update(values=source.get_page(page))
+        window['-PAGE-'].update(f'Page {page + 1} of {source.page_count}')
 
+    if searcher is not None:
+        searcher.close()
     window.close()
 
 
-# Display sales data
-def view_sales_data():
-    cursor.execute("SELECT * FROM Sales")
-    rows = cursor.fetchall()
+# Display stock levels
+def view_stock_levels():
+    source = PagedQuery("Product", "ProductID", columns=", ".join(PRODUCT_COLUMNS), where="Deleted = 0")
 
-    if not rows:
-        sg.popup("No sales data available.")
+    if source.row_count == 0:
+        sg.popup("No products in the inventory.")
         return
 
-    max_table_height = 15
+    show_paged_table('Stock Levels', source,
+                     ["Product ID", "Name", "Stock", "Reorder Level", "Price", "Cost Per Unit"], search=True)
 
-    # Determine the number of rows to display in the table
-    num_rows_to_display = min(len(rows), max_table_height)
 
+# Let the operator find a product by name; returns its Product ID as text, or None
+def choose_product():
     layout = [
-        [sg.Table(values=rows, headings=["Sale ID", "Product ID", "Quantity Sold", "Sale Date"],
-                  auto_size_columns=False, justification='right', display_row_numbers=False,
-                  num_rows=num_rows_to_display, enable_events=True, key='-TABLE-')],
-        [sg.Button('OK')]
+        [sg.Text('Search:'), sg.InputText(size=(30, 1), key='-SEARCH-', enable_events=True)],
+        [sg.Table(values=[], headings=["Product ID", "Name", "Stock"], auto_size_columns=False,
+                  col_widths=[10, 30, 8], justification='left', display_row_numbers=False, num_rows=10,
+                  select_mode=sg.TABLE_SELECT_MODE_BROWSE, bind_return_key=True, key='-RESULTS-')],
+        [sg.Button('Cancel', size=(10, 1), pad=(10, 5), expand_x=True), sg.Button('Select', size=(10, 1), pad=(0, 5), expand_x=True)]
     ]
 
-    window = sg.Window('Sales Data', layout, grab_anywhere=False, resizable=True, size=(600, 300), element_justification="center")
+    window = sg.Window('Find Product', layout, grab_anywhere=False, resizable=True, size=(500, 320),
+                       element_justification="center", finalize=True)
+    searcher = ProductSearcher(window)
+    rows = []
+    product_id = None
 
     while True:
         event, values = window.read()
 
-        if event == sg.WIN_CLOSED or event == 'OK':
+        if event == sg.WIN_CLOSED or event == 'Cancel':
+            break
+        elif event == '-SEARCH-':
+            searcher.search(values['-SEARCH-'])
+            if not values['-SEARCH-'].strip():
+                rows = []
+                window['-RESULTS-'].update(values=rows)
+        elif event == '-SEARCH-RESULTS-':
+            text, results = values[event]
+            if text == values['-SEARCH-']:
+                rows = [row[:3] for row in results]
+                window['-RESULTS-'].update(values=rows)
+        elif event in ('Select', '-RESULTS-'):
+            if not values['-RESULTS-']:
+                sg.popup("Please select a product.")
+                continue
+            product_id = str(rows[values['-RESULTS-'][0]][0])
             break
 
+    searcher.close()
     window.close()
+    return product_id
 
 
-# Generate reorder alerts
-def generate_reorder_alerts():
-    cursor.execute('''
-        SELECT ProductID, ProductName, QuantityInStock, ReorderLevel
-        FROM Product
-        WHERE QuantityInStock <= ReorderLevel
-    ''')
+# Condition hiding the sales of deleted products that still wait for the purger, or
+# None when there are none, so the usual case keeps its plain COUNT(*)
+def sales_view_filter():
+    cursor.execute("SELECT 1 FROM Product WHERE Deleted = 1 LIMIT 1")
+    if cursor.fetchone():
+        return "ProductID NOT IN (SELECT ProductID FROM Product WHERE Deleted = 1)"
+    return None
+
+
+# Display sales data
+def view_sales_data():
+    source = PagedQuery("Sales", "SaleID", columns="SaleID, ProductID, QuantitySold, SaleDate",
+                        where=sales_view_filter())
+
+    if source.row_count == 0:
+        sg.popup("No sales data available.")
+        return
+
+    show_paged_table('Sales Data', source, ["Sale ID", "Product ID", "Quantity Sold", "Sale Date"], size=(600, 300))
 
-    rows = cursor.fetchall()
 
-    if not rows:
+# Generate reorder alerts for every location
+def generate_reorder_alerts():
+    rows = get_reorder_alerts(conn)
+    location_rows = get_location_reorder_alerts(conn)
+
+    if not rows and not location_rows:
         sg.popup("No products need to be reordered.")
         return
 
     max_table_height = 15
 
+    # Suggested reorder point and quantity come from the last forecast run, if any;
+    # forecasts cover the Main location only
+    main_location = get_locations(conn)[0][1]
+    rows = ([[main_location] + list(row[:4]) + ["" if value is None else value for value in row[4:]] for row in rows]
+            + [[location_name, *row, "", ""] for _, location_name, *row in location_rows])
+
     # Determine the number of rows to display in the table
     num_rows_to_display = min(len(rows), max_table_height)
 
     layout = [
-        [sg.Table(values=rows, headings=["Product ID", "Name", "Stock", "Reorder Level"],
+        [sg.Table(values=rows, headings=["Location", "Product ID", "Name", "Stock", "Reorder Level", "Suggested Point",
+                                         "Suggested Qty"],
                   auto_size_columns=False, justification='right', display_row_numbers=False,
                   num_rows=num_rows_to_display, enable_events=True, key='-TABLE-')],
         [sg.Button('OK')]
     ]
 
-    window = sg.Window('Reorder Alerts', layout, grab_anywhere=False, resizable=True, size=(600, 300), element_justification="center")
+    window = sg.Window('Reorder Alerts', layout, grab_anywhere=False, resizable=True, size=(850, 300), element_justification="center")
 
     while True:
         event, values = window.read()
@@ -153,17 +397,17 @@ def add_product():
             break
         elif event == 'Add':
             product_name = values['product_name']
-            quantity_in_stock = int(values['quantity_in_stock'])
-            reorder_level = int(values['reorder_level'])
-            cost_per_unit = float(values['cost_per_unit'])
-            unit_price = float(values['unit_price'])
 
-            cursor.execute('''
-                INSERT INTO Product (ProductName, QuantityInStock, ReorderLevel, UnitPrice, CostPerUnit)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (product_name, quantity_in_stock, reorder_level, unit_price, cost_per_unit))
+            try:
+                quantity_in_stock, reorder_level, cost_per_unit, unit_price = validate_product(
+                    values['quantity_in_stock'], values['reorder_level'], values['cost_per_unit'], values['unit_price'])
+            except ValueError as error:
+                sg.popup(str(error))
+                continue
+
+            product_id = create_product(conn, product_name, quantity_in_stock, reorder_level, cost_per_unit, unit_price)
+            catalog.invalidate(product_id)
 
-            conn.commit()
             sg.popup(
                 f'Product Added:\n'
                 f'Name: {product_name}\n'
@@ -179,7 +423,8 @@ def add_product():
 # Update a product
 def update_product():
     layout = [
-        [sg.Text('Product ID:', s=17, justification="r"), sg.InputText(key='product_id')],
+        [sg.Text('Product ID:', s=17, justification="r"), sg.InputText(key='product_id', size=(35, 1)),
+         sg.Button('Find...', key='-FIND-')],
         [sg.Text('New Quantity in Stock:', s=17, justification="r"), sg.InputText(key='new_quantity')],
         [sg.Text('New Reorder Level:', s=17, justification="r"), sg.InputText(key='new_reorder_level')],
         [sg.Text('New Unit Price:', s=17, justification="r"), sg.InputText(key='new_unit_price')],
@@ -194,6 +439,10 @@ def update_product():
 
         if event == sg.WIN_CLOSED or event == 'Cancel':
             break
+        elif event == '-FIND-':
+            product_id = choose_product()
+            if product_id is not None:
+                update_product_window['product_id'].update(product_id)
         elif event == 'Update':
             product_id = values['product_id']
             new_quantity = values['new_quantity']
@@ -202,12 +451,7 @@ def update_product():
             new_cost_per_unit = values['new_cost_per_unit']
 
             # Validate product ID
-            cursor.execute('''
-                SELECT *
-                FROM Product
-                WHERE ProductID = ?
-            ''', (product_id,))
-            product = cursor.fetchone()
+            product = catalog.get(product_id)
 
             if not product:
                 sg.popup(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
@@ -239,37 +483,14 @@ def update_product():
                     sg.popup("Invalid input. Please enter a valid float for the new cost per unit.")
                     continue
 
-            # Generate SQL update statement based on non-null fields
-            update_statement = "UPDATE Product SET"
-            update_values = []
-
-            if new_quantity:
-                update_statement += " QuantityInStock = ?,"
-                update_values.append(int(new_quantity))
-
-            if new_reorder_level:
-                update_statement += " ReorderLevel = ?,"
-                update_values.append(int(new_reorder_level))
+            # Update the product details in the database, leaving blank fields unchanged
+            modify_product(conn, product_id,
+                           quantity_in_stock=int(new_quantity) if new_quantity else None,
+                           reorder_level=int(new_reorder_level) if new_reorder_level else None,
+                           unit_price=float(new_unit_price) if new_unit_price else None,
+                           cost_per_unit=float(new_cost_per_unit) if new_cost_per_unit else None)
+            catalog.invalidate(product_id)
 
-            if new_unit_price:
-                update_statement += " UnitPrice = ?,"
-                update_values.append(float(new_unit_price))
-
-            if new_cost_per_unit:
-                update_statement += " CostPerUnit = ?,"
-                update_values.append(float(new_cost_per_unit))
-
-            # Remove the trailing comma
-            update_statement = update_statement.rstrip(',')
-
-            # Add WHERE clause for the specific product ID
-            update_statement += " WHERE ProductID = ?"
-            update_values.append(int(product_id))
-
-            # Update the product details in the database
-            cursor.execute(update_statement, tuple(update_values))
-
-            conn.commit()
             sg.popup(f'Product updated successfully:\nProduct ID: {product_id}\n'
                      f'New Quantity in Stock: {new_quantity if new_quantity else "Unchanged"}\n'
                      f'New Reorder Level: {new_reorder_level if new_reorder_level else "Unchanged"}\n'
@@ -283,7 +504,7 @@ def update_product():
 # Delete a product
 def delete_product():
     layout = [
-        [sg.Text('Product ID to Delete:'), sg.InputText(key='product_id')],
+        [sg.Text('Product ID to Delete:'), sg.InputText(key='product_id', size=(35, 1)), sg.Button('Find...', key='-FIND-')],
         [sg.Button('Cancel', size=(10, 1), pad=(10, 5), expand_x=True), sg.Button('Delete', size=(10, 1), pad=(0, 5), expand_x=True)]
     ]
 
@@ -294,34 +515,25 @@ def delete_product():
 
         if event == sg.WIN_CLOSED or event == 'Cancel':
             break
+        elif event == '-FIND-':
+            product_id = choose_product()
+            if product_id is not None:
+                delete_product_window['product_id'].update(product_id)
         elif event == 'Delete':
             product_id = values['product_id']
 
             # Validate product ID
-            cursor.execute('''
-                SELECT *
-                FROM Product
-                WHERE ProductID = ?
-            ''', (product_id,))
-            product = cursor.fetchone()
+            product = catalog.get(product_id)
 
             if not product:
                 sg.popup(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
                 continue
 
-            # Delete associated sales data
-            cursor.execute('''
-                DELETE FROM Sales
-                WHERE ProductID = ?
-            ''', (product_id,))
-
-            # Delete the product from the database
-            cursor.execute('''
-                DELETE FROM Product
-                WHERE ProductID = ?
-            ''', (product_id,))
+            # Delete the product; the purger removes its sales data in the background
+            remove_product(conn, product_id)
+            catalog.invalidate(product_id)
+            purger.notify()
 
-            conn.commit()
             sg.popup(f'Product and associated sales data deleted successfully:\nProduct ID: {product_id}')
             break
 
@@ -331,10 +543,13 @@ def delete_product():
 # Add sales data
 def add_sales():
     layout = [
-        [sg.Text('Product ID:', s=20, justification="r"), sg.InputText(key='product_id')],
+        [sg.Text('Product ID:', s=20, justification="r"), sg.InputText(key='product_id', size=(35, 1)),
+         sg.Button('Find...', key='-FIND-')],
         [sg.Text('Quantity Sold:', s=20, justification="r"), sg.InputText(key='quantity_sold')],
         [sg.Text('Sale Date (YYYY-MM-DD):', s=20, justification="r"), sg.InputText(key='sale_date')],
-        [sg.Text('Leave Sale Date blank for current date', text_color='gray')],
+        [sg.Text('Location ID:', s=20, justification="r"), sg.InputText(key='location_id')],
+        [sg.Text('Leave Sale Date blank for current date and Location ID blank for the main store',
+                 text_color='gray')],
         [sg.Button('Cancel', size=(10, 1), pad=(10, 5), expand_x=True), sg.Button('Add', size=(10, 1), pad=(0, 5), expand_x=True)]
     ]
 
@@ -345,166 +560,486 @@ def add_sales():
 
         if event == sg.WIN_CLOSED or event == 'Cancel':
             break
+        elif event == '-FIND-':
+            product_id = choose_product()
+            if product_id is not None:
+                add_sales_window['product_id'].update(product_id)
         elif event == 'Add':
             product_id = values['product_id']
             quantity_sold = values['quantity_sold']
             sale_date_str = values['sale_date']
+            location_id = values['location_id'] or str(MAIN_LOCATION_ID)
 
-            # Validate product ID
-            cursor.execute('''
-                SELECT QuantityInStock
-                FROM Product
-                WHERE ProductID = ?
-            ''', (product_id,))
-            product = cursor.fetchone()
-
-            if not product:
-                sg.popup(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+            # Validate location ID
+            if not location_id.isdigit():
+                sg.popup("Invalid input. Please enter a valid integer for the location ID.")
                 continue
 
-            current_quantity = product[0]
-
-            # Validate quantity sold
-            if not quantity_sold.isdigit():
-                sg.popup("Invalid input. Please enter a valid integer for the quantity sold.")
+            # Validate product ID and its stock at the location
+            try:
+                stock = get_location_stock(conn, location_id, product_id, catalog)
+                quantity_sold, sale_date = validate_sale(product_id, stock, quantity_sold, sale_date_str)
+            except ValueError as error:
+                sg.popup(str(error))
                 continue
 
-            quantity_sold = int(quantity_sold)
-
-            if quantity_sold > current_quantity:
-                sg.popup(f"Error: Quantity in stock ({current_quantity}) is less than quantity sold ({quantity_sold}).")
+            # Decrement the stock and record the sale atomically; the stock check above
+            # may be stale if another till sold the same product in the meantime
+            try:
+                record_location_sale(conn, location_id, product_id, quantity_sold, sale_date)
+            except ValueError as error:
+                sg.popup(str(error))
                 continue
 
-            # Validate sale date
-            if sale_date_str:
-                try:
-                    sale_date = datetime.datetime.strptime(sale_date_str, "%Y-%m-%d").date()
-                except ValueError:
-                    sg.popup("Invalid date format. Please use YYYY-MM-DD.")
-                    continue
-            else:
-                sale_date = datetime.date.today()
-
-            # Update the quantity in stock
-            new_quantity = current_quantity - quantity_sold
-            cursor.execute('''
-                UPDATE Product
-                SET QuantityInStock = ?
-                WHERE ProductID = ?
-            ''', (new_quantity, product_id))
-
-            # Insert the sales data into the database
-            cursor.execute('''
-                INSERT INTO Sales (ProductID, QuantitySold, SaleDate)
-                VALUES (?, ?, ?)
-            ''', (product_id, quantity_sold, sale_date))
-
-            conn.commit()
             sg.popup(f'Sales data added successfully:\nProduct ID: {product_id}\nQuantity Sold: {quantity_sold}\nSale '
-                     f'Date: {sale_date}')
+                     f'Date: {sale_date}\nLocation ID: {location_id}')
             break
 
     add_sales_window.close()
 
 
-# Generate reports
-def generate_reports():
-    cursor.execute('''
-        SELECT Product.ProductID, Product.ProductName, SUM(Sales.QuantitySold) as TotalSales
-        FROM Product
-        LEFT JOIN Sales ON Product.ProductID = Sales.ProductID
-        GROUP BY Product.ProductID
-    ''')
+# Cache of the last rendered report chart, keyed by the database's data version and
+# the chart size. A chart is reused only while no commit has happened since it was
+# rendered, and an older version is never asked for again, so one entry is enough.
+class ChartCache:
+    def __init__(self):
+        self.key = None
+        self.chart = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
 
-    rows = cursor.fetchall()
+    # Return the cached chart for key, calling render() to create it on a miss
+    def get(self, key, render):
+        with self.lock:
+            if key == self.key:
+                self.hits += 1
+                return self.chart
+            self.misses += 1
 
-    if not rows:
-        sg.popup("No sales data available for generating reports.")
-        return
+        chart = render()
 
-    header = ["Product ID", "Name", "Total Sales"]
-    table_data = [list(row) for row in rows]
+        with self.lock:
+            self.key, self.chart = key, chart
 
-    max_table_height = 18
+        return chart
 
-    # Determine the number of rows to display in the table
-    num_rows_to_display = min(len(rows), max_table_height)
 
-    # Calculate total revenue
-    cursor.execute('''
-        SELECT SUM(QuantitySold * UnitPrice) AS TotalRevenue
-        FROM Sales
-        INNER JOIN Product ON Sales.ProductID = Product.ProductID
-    ''')
-    total_revenue = cursor.fetchone()[0] or 0
-
-    # Calculate total cost of goods sold
-    cursor.execute('''
-        SELECT SUM(QuantitySold * CostPerUnit) AS TotalCOGS
-        FROM Sales
-        INNER JOIN Product ON Sales.ProductID = Product.ProductID
-    ''')
-    total_cogs = cursor.fetchone()[0] or 0
-
-    # Calculate overall profit margin
-    overall_profit_margin = 0 if total_revenue == 0 else ((total_revenue - total_cogs) / total_revenue) * 100
-
-    # Create a line graph of sales over time
-    cursor.execute('''
-        SELECT strftime('%Y-%m', SaleDate) as SaleMonth, SUM(QuantitySold) as MonthlySales
-        FROM Sales
-        GROUP BY SaleMonth
-        ORDER BY SaleMonth
-    ''')
-
-    sales_over_time = cursor.fetchall()
-    months = [row[0] for row in sales_over_time]
-    monthly_sales = [row[1] for row in sales_over_time]
-
-    # Adjust the size of the graph
-    plt.figure(figsize=(5, 3))
-    plt.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.3)
-
-    plt.plot(months, monthly_sales, marker='o')
-    plt.title('Monthly Sales Over Time')
-    plt.xlabel('Month')
-    plt.ylabel('Total Sales')
-    plt.xticks(rotation=45, ha='right')
-    plt.grid(True)
+chart_cache = ChartCache()
+
+
+# Render the monthly sales line chart as PNG bytes. Uses a standalone Figure rather
+# than pyplot so it is safe to call from a worker thread. matplotlib is imported here,
+# on first use, because loading it takes most of a cold start.
+def render_sales_chart(months, monthly_sales, size=CHART_SIZE):
+    with metrics.timer("chart.import"):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+    figure = Figure(figsize=size)
+    FigureCanvasAgg(figure)
+    figure.subplots_adjust(left=0.1, right=0.9, top=0.9, bottom=0.3)
+
+    axes = figure.add_subplot()
+    axes.plot(months, monthly_sales, marker='o')
+    axes.set_title('Monthly Sales Over Time')
+    axes.set_xlabel('Month')
+    axes.set_ylabel('Total Sales')
+    axes.tick_params(axis='x', labelrotation=45)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment('right')
+    axes.grid(True)
 
     # Save the plot to a BytesIO object
     buffer = BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
+    with metrics.timer("chart.savefig"):
+        figure.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+# Loads the report data and renders its chart on a worker thread, posting progress
+# and the result to the report window with write_event_value. cancel() stops the
+# work, interrupting a running query, and nothing is posted after it is called.
+# The lock keeps cancel() from interrupting the pooled connection once the job has
+# handed it back, when another thread may already be using it.
+class ReportJob:
+    def __init__(self, window):
+        self.window = window
+        self.cancelled = threading.Event()
+        self.lock = threading.Lock()
+        self.connection = None
+        self.thread = threading.Thread(target=self._run, name="ReportJob", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            if self.connection is not None:
+                self.connection.interrupt()
+
+    def _post(self, event, value):
+        if not self.cancelled.is_set():
+            self.window.write_event_value(event, value)
+
+    def _run(self):
+        try:
+            # Read the version before the data so a concurrent commit can only make the key older, never stale
+            version = data_version.current()
+
+            with pool.connection() as connection:
+                with self.lock:
+                    # An interrupt only stops statements already running, so a job
+                    # cancelled before this point must not start its queries
+                    if self.cancelled.is_set():
+                        return
+                    self.connection = connection
+                try:
+                    with metrics.timer("report.load"):
+                        report = get_sales_report(connection, catalog)
+                finally:
+                    # Cleared before the pool takes the connection back
+                    with self.lock:
+                        self.connection = None
+
+            if self.cancelled.is_set():
+                return
+            self._post('-REPORT-PROGRESS-', 1)
+
+            months = [row[0] for row in report["monthly_sales"]]
+            monthly_sales = [row[1] for row in report["monthly_sales"]]
+            if report["products"]:
+                with metrics.timer("report.chart"):
+                    report["chart"] = chart_cache.get((version, CHART_SIZE),
+                                                      lambda: render_sales_chart(months, monthly_sales))
+
+            self._post('-REPORT-PROGRESS-', 2)
+            self._post('-REPORT-READY-', report)
+        except Exception as error:
+            self._post('-REPORT-FAILED-', str(error))
+
 
-    # Define the layout with two columns
+# Generate reports
+def generate_reports():
+    header = ["Product ID", "Name", "Total Sales"]
+    max_table_height = 18
+
+    # Define the layout with two columns; it is filled in once the report job finishes
     layout = [
+        [sg.Text('Generating report...', key='-STATUS-'),
+         sg.ProgressBar(2, orientation='h', size=(20, 15), key='-PROGRESS-')],
         [sg.Column([
-            [sg.Image(data=buffer.getvalue())]
+            [sg.Image(key='-CHART-')]
         ], element_justification='center'),
         sg.Column([
-            [sg.Table(values=table_data, headings=header, auto_size_columns=False,
-                      justification='left', display_row_numbers=False, num_rows=num_rows_to_display, enable_events=True, key='-TABLE-')],
+            [sg.Table(values=[], headings=header, auto_size_columns=False,
+                      justification='left', display_row_numbers=False, num_rows=max_table_height, enable_events=True, key='-TABLE-')],
         ], element_justification='center')],
-        [sg.Text(f"Total Revenue: ${total_revenue:.2f}")],
-        [sg.Text(f"Total Cost of Goods Sold: ${total_cogs:.2f}")],
-        [sg.Text(f"Overall Profit Margin: {overall_profit_margin:.2f}%")],
+        [sg.Text("Total Revenue:", key='-REVENUE-')],
+        [sg.Text("Total Cost of Goods Sold:", key='-COGS-')],
+        [sg.Text("Overall Profit Margin:", key='-MARGIN-')],
         [sg.Button('Close', size=(10, 1), pad=(10, 5), expand_x=True)]
     ]
 
-    window = sg.Window('Report', layout, grab_anywhere=False, resizable=True, size=(800, 500), element_justification="c")
+    window = sg.Window('Report', layout, grab_anywhere=False, resizable=True, size=(800, 500), element_justification="c",
+                       finalize=True)
+
+    job = ReportJob(window)
+    job.start()
 
     while True:
         event, values = window.read()
 
         if event == sg.WIN_CLOSED or event == 'Close':
             break
-
+        elif event == '-REPORT-PROGRESS-':
+            window['-PROGRESS-'].update(values[event])
+        elif event == '-REPORT-FAILED-':
+            sg.popup(f"Report generation failed: {values[event]}")
+            break
+        elif event == '-REPORT-READY-':
+            report = values[event]
+
+            if not report["products"]:
+                sg.popup("No sales data available for generating reports.")
+                break
+
+            window['-STATUS-'].update(visible=False)
+            window['-PROGRESS-'].update(visible=False)
+            window['-CHART-'].update(data=report["chart"])
+            window['-TABLE-'].update(values=[list(row) for row in report["products"]],
+                                     num_rows=min(len(report["products"]), max_table_height))
+            window['-REVENUE-'].update(f"Total Revenue: ${report['total_revenue']:.2f}")
+            window['-COGS-'].update(f"Total Cost of Goods Sold: ${report['total_cogs']:.2f}")
+            window['-MARGIN-'].update(f"Overall Profit Margin: {report['profit_margin']:.2f}%")
+
+    # Stop the job if the window was closed before the report was ready
+    job.cancel()
     window.close()
-    plt.close()
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory Management System')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('check-query-plans', help='report hot queries that fall back to full table scans')
+    import_parser = subparsers.add_parser('import', help='bulk import products or sales from a CSV or JSONL file')
+    import_parser.add_argument('kind', choices=['products', 'sales'])
+    import_parser.add_argument('path')
+    import_parser.add_argument('--format', choices=['csv', 'jsonl'],
+                               help='file format (default: from the file extension)')
+    import_parser.add_argument('--rejects', help='where to write invalid rows (default: <path>.rejects.<format>)')
+    import_parser.add_argument('--batch-size', type=int, default=50000)
+    export_parser = subparsers.add_parser('export', help='stream products, sales or report data to a file')
+    export_parser.add_argument('kind', choices=['products', 'sales', 'report', 'monthly'])
+    export_parser.add_argument('path')
+    export_parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'],
+                               help='file format (default: from the file extension)')
+    export_parser.add_argument('--from', dest='date_from', help='first sale date to include (YYYY-MM-DD)')
+    export_parser.add_argument('--to', dest='date_to', help='last sale date to include (YYYY-MM-DD)')
+    export_parser.add_argument('--product', dest='product_ids', type=int, action='append',
+                               help='only include this Product ID (may be repeated)')
+    analytics_parser = subparsers.add_parser('analytics', help='revenue, COGS and margin per day, week or month')
+    analytics_parser.add_argument('period', choices=['day', 'week', 'month'])
+    analytics_parser.add_argument('--from', dest='date_from', help='first sale date to include (YYYY-MM-DD)')
+    analytics_parser.add_argument('--to', dest='date_to', help='last sale date to include (YYYY-MM-DD)')
+    analytics_parser.add_argument('--product', dest='product_ids', type=int, action='append',
+                                  help='only include this Product ID (may be repeated)')
+    analytics_parser.add_argument('--by-product', action='store_true', help='one row per period and product')
+    analytics_parser.add_argument('--moving-average', type=int, metavar='PERIODS',
+                                  help='add a trailing moving average of revenue over this many periods')
+    forecast_parser = subparsers.add_parser('forecast', help='fit demand forecasts and suggest reorder points')
+    forecast_parser.add_argument('--as-of', help='last day to fit (YYYY-MM-DD, default today)')
+    forecast_parser.add_argument('--alpha', type=float, default=0.1, help='exponential smoothing factor')
+    forecast_parser.add_argument('--lead-time', type=float, default=7, help='supplier lead time in days')
+    forecast_parser.add_argument('--service-level', type=float, default=0.95,
+                                 help='probability of not running out during the lead time')
+    forecast_parser.add_argument('--order-days', type=float, default=30, help='days of demand to order at once')
+    forecast_parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    forecast_parser.add_argument('--full', action='store_true', help='refit every product from its first sale')
+    purge_parser = subparsers.add_parser('purge', help='remove the sales data of deleted products')
+    purge_parser.add_argument('--archive', help='copy the purged products and sales to this database file first')
+    purge_parser.add_argument('--chunk-size', type=int, default=2000, help='sales removed per transaction')
+    archive_parser = subparsers.add_parser('archive', help='move old sales into per-year or per-month archive files')
+    archive_parser.add_argument('--older-than', type=int, default=365, metavar='DAYS',
+                                help='archive the sales dated more than this many days ago')
+    archive_parser.add_argument('--before', help='archive the sales dated before this day instead (YYYY-MM-DD)')
+    archive_parser.add_argument('--period', choices=['year', 'month'], default='year', help='one archive file per')
+    archive_parser.add_argument('--directory', help='where to create archive files (default: next to the database)')
+    archive_parser.add_argument('--batch-size', type=int, default=50000, help='sales moved per transaction')
+    location_parser = subparsers.add_parser('location', help='add and list locations, set and check their stock')
+    location_commands = location_parser.add_subparsers(dest='location_command', required=True)
+    location_add_parser = location_commands.add_parser('add', help='add a location with its own database file')
+    location_add_parser.add_argument('name')
+    location_add_parser.add_argument('--shard', help='database file of the location (default: next to the database)')
+    location_commands.add_parser('list', help='list the locations and their database files')
+    location_stock_parser = location_commands.add_parser('stock', help="show or set a product's stock at a location")
+    location_stock_parser.add_argument('location_id', type=int)
+    location_stock_parser.add_argument('product_id', type=int)
+    location_stock_parser.add_argument('--quantity', type=int, help='new quantity in stock')
+    location_stock_parser.add_argument('--reorder-level', type=int, help='new reorder level')
+    location_commands.add_parser('alerts', help='products at or below their reorder level at every location')
+    transfer_parser = subparsers.add_parser('transfer', help='move stock of a product between locations')
+    transfer_parser.add_argument('product_id', type=int)
+    transfer_parser.add_argument('from_location_id', type=int)
+    transfer_parser.add_argument('to_location_id', type=int)
+    transfer_parser.add_argument('quantity', type=int)
+    transfer_parser.add_argument('--date', help='transfer date (YYYY-MM-DD, default today)')
+    search_parser = subparsers.add_parser('search', help='find products by name, best matches first')
+    search_parser.add_argument('text', help='words of the name, or word prefixes; a number also matches its Product ID')
+    search_parser.add_argument('--limit', type=int, default=20)
+    ledger_parser = subparsers.add_parser('ledger', help='stock history: past stock levels, snapshots and checks')
+    ledger_commands = ledger_parser.add_subparsers(dest='ledger_command', required=True)
+    ledger_stock_parser = ledger_commands.add_parser('stock', help='stock of products at the end of a past day')
+    ledger_stock_parser.add_argument('product_ids', type=int, nargs='+', metavar='product_id')
+    ledger_stock_parser.add_argument('--as-of', required=True, help='day to report (YYYY-MM-DD)')
+    ledger_snapshot_parser = ledger_commands.add_parser('snapshot', help='compact the ledger into stock snapshots')
+    ledger_snapshot_parser.add_argument('--min-movements', type=int, default=100,
+                                        help='only snapshot products with this many movements since the last one')
+    ledger_check_parser = ledger_commands.add_parser('check', help='compare the ledger with the current stock')
+    ledger_check_parser.add_argument('--full', action='store_true',
+                                     help='add up the whole ledger instead of starting from the snapshots')
+    ledger_check_parser.add_argument('--repair', action='store_true',
+                                     help='append adjustments so the ledger matches the current stock')
+    args = parser.parse_args()
+
+    if args.command == 'check-query-plans':
+        failures = check_query_plans(conn)
+        for name, plan in failures:
+            print(f"{name}: {'; '.join(plan)}")
+        print(f"{len(HOT_QUERIES) - len(failures)} of {len(HOT_QUERIES)} hot queries use their indexes.")
+        sys.exit(1 if failures else 0)
+
+    if args.command == 'import':
+        file_format = args.format or ('jsonl' if args.path.lower().endswith(('.jsonl', '.json')) else 'csv')
+        rejects_path = args.rejects or f"{os.path.splitext(args.path)[0]}.rejects.{file_format}"
+        import_rows = import_products if args.kind == 'products' else import_sales
+        imported, rejected = import_rows(conn, args.path, file_format, rejects_path, args.batch_size)
+        print(f"Imported {imported} {args.kind}, rejected {rejected}.")
+        if rejected:
+            print(f"Rejected rows written to {rejects_path}")
+        sys.exit(0)
+
+    if args.command == 'export':
+        extension = os.path.splitext(args.path)[1].lower().lstrip('.')
+        file_format = args.format or {'jsonl': 'jsonl', 'json': 'jsonl', 'parquet': 'parquet'}.get(extension, 'csv')
+        try:
+            with pool.connection() as connection:
+                exported = export_data(connection, args.kind, args.path, file_format, args.date_from, args.date_to,
+                                       args.product_ids)
+        except (ValueError, RuntimeError) as error:
+            sys.exit(str(error))
+        print(f"Exported {exported} rows to {args.path}")
+        sys.exit(0)
+
+    if args.command == 'analytics':
+        try:
+            import analytics
+        except ImportError:
+            sys.exit("Analytics requires numpy. Install it using: pip install numpy")
+
+        snapshot = analytics.SalesSnapshot()
+        try:
+            with pool.connection() as connection:
+                snapshot.refresh(connection)
+            if args.by_product:
+                rollup = snapshot.rollup_by_product(args.period, args.date_from, args.date_to, args.product_ids)
+            else:
+                rollup = snapshot.rollup(args.period, args.date_from, args.date_to, args.product_ids)
+        except ValueError as error:
+            sys.exit(str(error))
+
+        columns = ["period"] + (["product_id"] if args.by_product else []) + ["quantity", "revenue", "cogs", "margin"]
+        if args.moving_average and not args.by_product:
+            rollup["revenue_average"] = analytics.moving_average(rollup["revenue"], args.moving_average)
+            columns.append("revenue_average")
+
+        print("\t".join(columns))
+        for values in zip(*(rollup[column] for column in columns)):
+            print("\t".join(f"{value:.2f}" if isinstance(value, float) else str(value) for value in values))
+        sys.exit(0)
+
+    if args.command == 'forecast':
+        from forecasting import update_forecasts
+
+        if not 0 < args.alpha <= 1 or not 0 < args.service_level < 1:
+            sys.exit("The smoothing factor must be in (0, 1] and the service level in (0, 1).")
+        started = time.perf_counter()
+        try:
+            fitted, last_sale_id = update_forecasts(conn, DATABASE_PATH, args.as_of, args.alpha, args.lead_time,
+                                                    args.service_level, args.order_days, args.workers, args.full)
+        except ValueError as error:
+            sys.exit(str(error))
+        print(f"Fitted {fitted} products through SaleID {last_sale_id} in {time.perf_counter() - started:.1f}s.")
+
+        alerts = get_forecast_alerts(conn)
+        for product_id, name, stock, reorder_level, reorder_point, reorder_quantity in alerts:
+            print(f"{product_id}\t{name}\tstock {stock}\treorder point {reorder_point} (set {reorder_level})"
+                  f"\torder {reorder_quantity}")
+        print(f"{len(alerts)} product(s) at or below their suggested reorder point.")
+        sys.exit(0)
+
+    if args.command == 'purge':
+        if args.chunk_size < 1:
+            sys.exit("The chunk size must be at least 1.")
+        if args.archive:
+            attach_archive(conn, args.archive)
+        purged = 0
+        while True:
+            removed = purge_deleted_products(conn, args.chunk_size, bool(args.archive))
+            if not removed:
+                break
+            purged += removed
+        print(f"Purged {purged} rows of deleted products" + (f", archived to {args.archive}." if args.archive else "."))
+        sys.exit(0)
+
+    if args.command == 'archive':
+        if args.batch_size < 1:
+            sys.exit("The batch size must be at least 1.")
+        before = args.before or (datetime.date.today() - datetime.timedelta(days=args.older_than)).isoformat()
+        started = time.perf_counter()
+        try:
+            moved = archive_sales(conn, before, args.period, args.directory, args.batch_size)
+        except ValueError as error:
+            sys.exit(str(error))
+        print(f"Moved {moved} sales dated before {before} to the archive in {time.perf_counter() - started:.1f}s.")
+        for partition, path in archive_partitions(conn):
+            print(f"{partition}\t{path}")
+        sys.exit(0)
+
+    if args.command == 'location':
+        try:
+            if args.location_command == 'add':
+                location_id = add_location(conn, args.name, args.shard)
+                print(f"Added location {location_id}: {args.name}")
+            elif args.location_command == 'list':
+                for location_id, location_name, shard_path in get_locations(conn):
+                    print(f"{location_id}\t{location_name}\t{shard_path or DATABASE_PATH}")
+            elif args.location_command == 'stock':
+                if args.quantity is not None or args.reorder_level is not None:
+                    if (args.quantity or 0) < 0 or (args.reorder_level or 0) < 0:
+                        sys.exit("The quantity and reorder level cannot be negative.")
+                    set_location_stock(conn, args.location_id, args.product_id, args.quantity, args.reorder_level)
+                stock = get_location_stock(conn, args.location_id, args.product_id)
+                if stock is None:
+                    sys.exit(f"Product with Product ID {args.product_id} does not exist.")
+                print(f"Product {args.product_id} at location {args.location_id}: {stock} in stock")
+            else:
+                alerts = [(MAIN_LOCATION_ID, get_locations(conn)[0][1], *row[:4]) for row in get_reorder_alerts(conn)]
+                alerts += get_location_reorder_alerts(conn)
+                for location_id, location_name, product_id, name, stock, reorder_level in alerts:
+                    print(f"{location_name}\t{product_id}\t{name}\tstock {stock}\treorder level {reorder_level}")
+                print(f"{len(alerts)} product(s) to reorder.")
+        except ValueError as error:
+            sys.exit(str(error))
+        sys.exit(0)
+
+    if args.command == 'transfer':
+        try:
+            transfer_id = transfer_stock(conn, args.product_id, args.from_location_id, args.to_location_id,
+                                         args.quantity, args.date)
+        except ValueError as error:
+            sys.exit(str(error))
+        print(f"Transfer {transfer_id}: moved {args.quantity} of product {args.product_id} "
+              f"from location {args.from_location_id} to location {args.to_location_id}.")
+        sys.exit(0)
+
+    if args.command == 'search':
+        if args.limit < 1:
+            sys.exit("The limit must be at least 1.")
+        rows = search_products(conn, args.text, args.limit)
+        for product_id, name, stock, *_ in rows:
+            print(f"{product_id}\t{name}\tstock {stock}")
+        print(f"{len(rows)} product(s) found.")
+        sys.exit(0)
+
+    if args.command == 'ledger':
+        if args.ledger_command == 'stock':
+            try:
+                for product_id in args.product_ids:
+                    stock = get_stock_at(conn, product_id, args.as_of)
+                    print(f"{product_id}\t{'unknown product' if stock is None else stock}")
+            except ValueError as error:
+                sys.exit(str(error))
+        elif args.ledger_command == 'snapshot':
+            if args.min_movements < 1:
+                sys.exit("The minimum number of movements must be at least 1.")
+            print(f"Took {snapshot_stock(conn, args.min_movements)} stock snapshots.")
+        else:
+            mismatches = reconcile_stock_ledger(conn, args.full) if args.repair else check_stock_ledger(conn, args.full)
+            for product_id, name, stock, ledger_stock in mismatches:
+                print(f"{product_id}\t{name}\tstock {stock}\tledger {ledger_stock}")
+            if args.repair:
+                print(f"Repaired the ledger of {len(mismatches)} product(s).")
+            else:
+                print(f"{len(mismatches)} product(s) whose stock disagrees with the ledger.")
+                sys.exit(1 if mismatches else 0)
+        sys.exit(0)
+
+    # Removes the sales of deleted products in the background, including any left over
+    # from the last run. Set INVENTORY_PURGE_ARCHIVE to keep a copy of them.
+    purger = ProductPurger(archive_path=os.environ.get("INVENTORY_PURGE_ARCHIVE"))
+
     # Define UI theme
     sg.theme('DarkGreen1')
 
@@ -513,31 +1048,43 @@ if __name__ == '__main__':
         [sg.Text('Inventory Management System', font=('Helvetica', 25), justification='center', pad=((0, 0), (5, 5)))],
         [sg.Button('View Stock Levels', size=(20, 2)), sg.Button('Add Product', size=(20, 2))],
         [sg.Button('View Sales Data', size=(20, 2)), sg.Button('Update Product', size=(20, 2))],
-        [sg.Button('Reorder Alerts', size=(20, 2)), sg.Button('Delete Product', size=(20, 2))],
+        [sg.Button('Reorder Alerts', size=(20, 2), key='Reorder Alerts'), sg.Button('Delete Product', size=(20, 2))],
         [sg.Button('Generate Reports', size=(20, 2)), sg.Button('Add Sales', size=(20, 2))],
-        [sg.Button('Exit', size=(20, 2))]
+        [sg.Button('Rebuild Aggregates', size=(20, 2)), sg.Button('Exit', size=(20, 2))]
     ]
 
     # Create the main menu window
-    menu_window = sg.Window('Main Menu', menu_layout, element_justification="c", resizable=True, size=(600, 300))
+    menu_window = sg.Window('Main Menu', menu_layout, element_justification="c", resizable=True, size=(600, 300),
+                            finalize=True)
+    alerts_version = None
 
     # Event loop for the main menu
     while True:
 
-        # Check for reorder alerts
-        cursor.execute('''
-                    SELECT COUNT(*)
-                    FROM Product
-                    WHERE QuantityInStock <= ReorderLevel
-                ''')
-        alert_count = cursor.fetchone()[0]
-
-        if alert_count > 0:
-            sg.popup(f"{alert_count} product(s) need to be reordered. Check reorder alerts for details.", title="Reorder Alerts")
-
-        event, values = menu_window.read()
-
-        if event == sg.WIN_CLOSED or event == 'Exit':
+        # Show the reorder alert count on its button. The count comes from the
+        # trigger-maintained LowStock set plus the low stock of the other locations,
+        # and is only re-read after a commit, whether from this window, the service or
+        # another till at any location.
+        # A location database that cannot be read (e.g. a missing file) leaves the
+        # badge off and is reported once rather than closing the menu.
+        try:
+            version = data_version.current()
+            if version != alerts_version:
+                alerts_version = version
+                alert_count = count_reorder_alerts(conn) + len(get_location_reorder_alerts(conn))
+                menu_window['Reorder Alerts'].update(f"Reorder Alerts ({alert_count})" if alert_count else "Reorder Alerts")
+        except (ValueError, sqlite3.Error) as error:
+            if alerts_version != str(error):
+                alerts_version = str(error)
+                menu_window['Reorder Alerts'].update("Reorder Alerts")
+                sg.popup(str(error))
+
+        # Wake up periodically so changes made outside this window reach the badge
+        event, values = menu_window.read(timeout=2000)
+
+        if event == sg.TIMEOUT_KEY:
+            continue
+        elif event == sg.WIN_CLOSED or event == 'Exit':
             break
         elif event == 'View Stock Levels':
             menu_window.hide()
@@ -572,6 +1119,10 @@ if __name__ == '__main__':
             menu_window.hide()
             add_sales()
             menu_window.un_hide()
+        elif event == 'Rebuild Aggregates':
+            rebuild_aggregates(conn)
+            sg.popup("Sales aggregates rebuilt successfully.")
 
     # Close the main menu window
     menu_window.close()
+    purger.close()
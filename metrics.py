@@ -0,0 +1,284 @@
+import atexit
+import bisect
+import collections
+import datetime
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("inventory.metrics")
+
+# Upper bounds in milliseconds of the latency histogram buckets; the last bucket is unbounded
+BUCKET_BOUNDS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+# Statements that EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REPLACE")
+
+
+# Opt-in instrumentation of database access and render steps.
+#
+# Metrics are off unless INVENTORY_METRICS is set in the environment or enable() is
+# called before the connections are opened. When they are off, inventory.connect()
+# returns plain sqlite3 connections and timer() returns a shared no-op context, so
+# nothing is measured and nothing is paid. When they are on, every statement run
+# through an instrumented connection is timed into a latency histogram along with
+# the rows it returned or changed, statements slower than slow_query_ms are logged
+# with their EXPLAIN QUERY PLAN, and named timers cover non-SQL steps such as
+# rendering the report chart. Counters kept elsewhere, such as the product catalog's
+# hits and misses, are added with register_counters(). The collected metrics are
+# exported as JSON through export(), write(), the INVENTORY_METRICS_FILE written at
+# exit, or the service's GET /metrics.
+
+
+# Count, rows, total and maximum time and a latency histogram for one statement or timer
+class Stats:
+    def __init__(self):
+        self.count = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.fetch_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def export(self):
+        return {
+            "count": self.count,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 3),
+            "fetch_ms": round(self.fetch_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else 0,
+            "max_ms": round(self.max_ms, 3),
+            "histogram": {f"le_{bound}": count for bound, count in zip(BUCKET_BOUNDS + ["inf"], self.buckets)},
+        }
+
+
+# Collected statement and timer statistics plus the most recent slow queries
+class Metrics:
+    def __init__(self, slow_query_ms=100, slow_query_log_size=100):
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_log_size = slow_query_log_size
+        self.lock = threading.Lock()
+        # Name -> function returning a dict of counters kept elsewhere, such as the product catalog's
+        self.counters = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.since = datetime.datetime.now(datetime.timezone.utc)
+            self.statements = collections.defaultdict(Stats)
+            self.timers = collections.defaultdict(Stats)
+            self.slow_queries = collections.deque(maxlen=self.slow_query_log_size)
+            self.explained = {}
+
+    def record(self, table, name, elapsed_ms, rows=0):
+        with self.lock:
+            stats = table[name]
+            stats.count += 1
+            stats.rows += max(rows, 0)
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.buckets[bisect.bisect_left(BUCKET_BOUNDS, elapsed_ms)] += 1
+
+    # Add the time and rows of fetching a statement's results to its totals
+    def record_fetch(self, name, elapsed_ms, rows):
+        with self.lock:
+            stats = self.statements[name]
+            stats.rows += rows
+            stats.total_ms += elapsed_ms
+            stats.fetch_ms += elapsed_ms
+
+    # Log a slow statement with its query plan, explained once per distinct statement
+    def record_slow(self, connection, sql, parameters, elapsed_ms):
+        name = statement_name(sql)
+        with self.lock:
+            plan = self.explained.get(name)
+        # EXPLAIN runs outside the lock; two threads may both explain a statement, which is harmless
+        if plan is None and sql.lstrip().upper().startswith(EXPLAINABLE):
+            try:
+                plan = [row[3] for row in sqlite3.Connection.execute(connection, f"EXPLAIN QUERY PLAN {sql}",
+                                                                     parameters)]
+            except sqlite3.Error as error:
+                plan = [f"EXPLAIN failed: {error}"]
+            with self.lock:
+                self.explained[name] = plan
+
+        logger.warning("slow query (%.1f ms): %s | plan: %s", elapsed_ms, name, "; ".join(plan or []))
+        with self.lock:
+            self.slow_queries.append({
+                "at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='milliseconds'),
+                "ms": round(elapsed_ms, 3),
+                "sql": name,
+                "plan": plan,
+            })
+
+    def export(self):
+        # Read outside the lock: a counter source may run statements that record into it
+        counters = {name: source() for name, source in list(self.counters.items())}
+        with self.lock:
+            return {
+                "enabled": True,
+                "since": self.since.isoformat(timespec='seconds'),
+                "slow_query_ms": self.slow_query_ms,
+                "statements": {name: stats.export() for name, stats in self.statements.items()},
+                "timers": {name: stats.export() for name, stats in self.timers.items()},
+                "slow_queries": list(self.slow_queries),
+                "counters": counters,
+            }
+
+
+# The statement's text with its whitespace collapsed, used as its metrics key
+@functools.lru_cache(maxsize=1024)
+def statement_name(sql):
+    return " ".join(sql.split())
+
+
+# Cursor that times each statement and counts the rows it returns or changes
+class InstrumentedCursor(sqlite3.Cursor):
+    statement = None
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(sql, parameters, (time.perf_counter() - start) * 1000)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(sql, None, (time.perf_counter() - start) * 1000)
+
+    def executescript(self, sql_script):
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._record(sql_script, None, (time.perf_counter() - start) * 1000)
+
+    def _record(self, sql, parameters, elapsed_ms):
+        self.statement = statement_name(sql)
+        registry.record(registry.statements, self.statement, elapsed_ms, self.rowcount)
+        if elapsed_ms >= registry.slow_query_ms and parameters is not None:
+            registry.record_slow(self.connection, sql, parameters, elapsed_ms)
+
+    def _fetched(self, start, rows):
+        if self.statement is not None:
+            registry.record_fetch(self.statement, (time.perf_counter() - start) * 1000, rows)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0)
+            raise
+        self._fetched(start, 1)
+        return row
+
+
+# Connection whose cursors, including those behind execute() and friends, are instrumented
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+# Times the block it wraps into the named timer
+class Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        registry.record(registry.timers, self.name, (time.perf_counter() - self.start) * 1000)
+
+
+# Stands in for Timer while metrics are off
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+registry = Metrics()
+enabled = False
+
+
+# Turn metrics on for connections opened from now on. If path is given the metrics
+# are written there as JSON when the process exits.
+def enable(slow_query_ms=None, path=None):
+    global enabled
+    enabled = True
+    if slow_query_ms is not None:
+        registry.slow_query_ms = slow_query_ms
+    if path:
+        atexit.register(write, path)
+
+
+# Timer for a named step, or a no-op while metrics are off
+def timer(name):
+    return Timer(name) if enabled else NULL_TIMER
+
+
+# Export the counters returned by source() under name, e.g. a cache's hits and misses
+def register_counters(name, source):
+    registry.counters[name] = source
+
+
+# The sqlite3 connection class for inventory.connect() to use
+def connection_factory():
+    return InstrumentedConnection if enabled else sqlite3.Connection
+
+
+def export():
+    return registry.export() if enabled else {"enabled": False}
+
+
+def write(path):
+    with open(path, 'w') as file:
+        json.dump(export(), file, indent=2)
+        file.write('\n')
+
+
+if os.environ.get("INVENTORY_METRICS"):
+    enable(float(os.environ.get("INVENTORY_SLOW_QUERY_MS", registry.slow_query_ms)),
+           os.environ.get("INVENTORY_METRICS_FILE"))
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import json
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import inventory
+import metrics
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Content Too Large", 500: "Internal Server Error"}
+
+# Largest request body accepted, in bytes; a batch of a thousand sales is well under it
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+
+# Local HTTP/JSON service over the inventory operations for POS clients.
+#
+#   GET  /products/<id>          product details
+#   GET  /products?search=TEXT   products whose name matches, best first (&limit=N, at most 100)
+#   GET  /stock?ids=1,2,3        stock levels
+#   GET  /reorder-alerts         products at or below their reorder level (?location=ID for
+#                                another location)
+#   GET  /report                 sales report totals
+#   GET  /metrics                statement and request timings (with --metrics)
+#   POST /products               add a product
+#   POST /sales                  record a batch of sales: {"sales": [{"ProductID": ..., "QuantitySold": ...,
+#                                "SaleDate": ..., "LocationID": ...}, ...]}
+#
+# Reads run in parallel on pooled connections. All writes go through a WriteBatcher,
+# which group-commits the sales and products posted by every client within its
+# window, so under load throughput is bounded by commits per batch rather than per sale.
+# Sales at a location other than Main go to a WriteBatcher of that location's own
+# database, started on its first sale, so the stores never wait on each other's commits.
+class InventoryService:
+    def __init__(self, path=inventory.DATABASE_PATH, readers=4, max_delay=0.002, max_batch=1000):
+        self.path = path
+        self.pool = inventory.ConnectionPool(path, size=readers)
+        self.read_executor = ThreadPoolExecutor(readers)
+        with self.pool.connection() as connection:
+            inventory.migrate_schema(connection)
+        self.batcher = inventory.WriteBatcher(path, max_delay=max_delay, max_batch=max_batch)
+        self.location_batchers = {}
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        self.batcher.close()
+        for batcher in self.location_batchers.values():
+            batcher.close()
+        self.read_executor.shutdown()
+        self.pool.close()
+
+    # Run a read-only inventory function on a pooled connection in a worker thread
+    async def read(self, function, *args):
+        def run():
+            with self.pool.connection() as connection:
+                return function(connection, *args)
+
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, run)
+
+    # Queue function(connection, *args) for the next group commit and wait for it to be durable
+    async def write(self, function, *args):
+        return await asyncio.wrap_future(self.batcher.submit(function, *args))
+
+    # WriteBatcher of a location other than Main, started on first use. Raises
+    # ValueError if the location does not exist.
+    async def location_batcher(self, location_id):
+        if location_id not in self.location_batchers:
+            path = await self.read(inventory.location_path, location_id)
+            if location_id not in self.location_batchers:
+                self.location_batchers[location_id] = inventory.WriteBatcher(path, max_delay=self.batcher.max_delay,
+                                                                             max_batch=self.batcher.max_batch)
+        return self.location_batchers[location_id]
+
+    # Queue a sale for the next group commit of its location and wait for it to be durable
+    async def submit_sale(self, sale):
+        location_id = inventory.record_field(sale, 'LocationID') or str(inventory.MAIN_LOCATION_ID)
+        if not location_id.isdigit():
+            raise ValueError("Invalid input. Please enter a valid integer for the location ID.")
+        if int(location_id) == inventory.MAIN_LOCATION_ID:
+            return await self.write(inventory.apply_sale_record, sale)
+
+        # The catalogue lives in the main database, so the product is checked there
+        # before the sale is queued on the location's database
+        product_id = inventory.record_field(sale, 'ProductID')
+        if product_id.isdigit() and await self.read(inventory.get_product, int(product_id)) is None:
+            raise ValueError(f"Product with Product ID {product_id} does not exist. Please enter a valid Product ID.")
+
+        batcher = await self.location_batcher(int(location_id))
+        return await asyncio.wrap_future(batcher.submit(inventory.apply_location_sale_record, sale))
+
+    # Queue a list of sales for the next group commits and wait for their results
+    async def submit_sales(self, sales):
+        futures = [self.submit_sale(sale) for sale in sales]
+        results = []
+
+        for outcome in await asyncio.gather(*futures, return_exceptions=True):
+            if isinstance(outcome, ValueError):
+                results.append({"Error": str(outcome)})
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                results.append({"SaleID": outcome})
+
+        return results
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request line"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # The body cannot be skipped without a valid length, so the connection is closed after the error
+                length = headers.get('content-length', '0')
+                if not length.isdigit():
+                    await self.respond(writer, 400, {"error": "Invalid Content-Length"}, keep_alive=False)
+                    break
+                if int(length) > MAX_BODY_SIZE:
+                    await self.respond(writer, 413, {"error": f"Request body larger than {MAX_BODY_SIZE} bytes"},
+                                       keep_alive=False)
+                    break
+
+                body = await reader.readexactly(int(length))
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                try:
+                    with metrics.timer(f"http.{method} /{target.lstrip('/').split('/')[0].split('?')[0]}"):
+                        status, payload = await self.dispatch(method, target, body)
+                except Exception as error:
+                    status, payload = 500, {"error": str(error)}
+
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n"
+                     f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+        await writer.drain()
+
+    async def dispatch(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        path = url.path.rstrip('/')
+        query = urllib.parse.parse_qs(url.query)
+
+        if method == 'POST':
+            try:
+                data = json.loads(body or b'{}')
+            except ValueError:
+                return 400, {"error": "Request body is not valid JSON"}
+
+            if path == '/sales':
+                sales = data.get("sales", [data]) if isinstance(data, dict) else data
+                if not isinstance(sales, list) or not all(isinstance(sale, dict) for sale in sales):
+                    return 400, {"error": "Expected a list of sales"}
+                return 200, {"results": await self.submit_sales(sales)}
+
+            if path == '/products':
+                try:
+                    fields = inventory.validate_product(data.get("QuantityInStock"), data.get("ReorderLevel"),
+                                                        data.get("CostPerUnit"), data.get("UnitPrice"))
+                except ValueError as error:
+                    return 400, {"error": str(error)}
+                product_id = await self.write(inventory.insert_product, data.get("ProductName"), *fields)
+                return 201, {"ProductID": product_id}
+
+            return 404, {"error": f"Not found: {path}"}
+
+        if method != 'GET':
+            return 405, {"error": f"Method not allowed: {method}"}
+
+        if path == '/metrics':
+            return 200, metrics.export()
+
+        if path.startswith('/products/'):
+            product_id = path.rsplit('/', 1)[1]
+            product = await self.read(inventory.get_product, product_id) if product_id.isdigit() else None
+            if product is None:
+                return 404, {"error": f"Product with Product ID {product_id} does not exist."}
+            return 200, product
+
+        if path == '/products':
+            text = query.get('search', [''])[0]
+            limit = query.get('limit', ['20'])[0]
+            if not text.strip():
+                return 400, {"error": "Missing search text"}
+            if not limit.isdigit() or not 1 <= int(limit) <= 100:
+                return 400, {"error": "Limit must be an integer from 1 to 100"}
+            rows = await self.read(inventory.search_products, text, int(limit))
+            return 200, {"products": [dict(zip(inventory.PRODUCT_COLUMNS, row)) for row in rows]}
+
+        if path == '/stock':
+            ids = [product_id for value in query.get('ids', []) for product_id in value.split(',') if product_id]
+            if not all(product_id.isdigit() for product_id in ids):
+                return 400, {"error": "Product IDs must be integers"}
+            stock = await self.read(inventory.get_stock_levels, ids)
+            return 200, {"stock": {str(product_id): quantity for product_id, quantity in stock.items()}}
+
+        if path == '/reorder-alerts':
+            location_id = query.get('location', [str(inventory.MAIN_LOCATION_ID)])[0]
+            if not location_id.isdigit():
+                return 400, {"error": "Location ID must be an integer"}
+            if int(location_id) != inventory.MAIN_LOCATION_ID:
+                try:
+                    await self.read(inventory.location_path, location_id)
+                except ValueError as error:
+                    return 404, {"error": str(error)}
+                rows = [row[2:] for row in await self.read(inventory.get_location_reorder_alerts, location_id)]
+                return 200, {"alerts": [dict(zip(["ProductID", "ProductName", "QuantityInStock", "ReorderLevel"], row))
+                                        for row in rows]}
+
+            rows = await self.read(inventory.get_reorder_alerts)
+            return 200, {"alerts": [dict(zip(["ProductID", "ProductName", "QuantityInStock", "ReorderLevel",
+                                              "SuggestedReorderPoint", "SuggestedReorderQuantity"], row))
+                                    for row in rows]}
+
+        if path == '/report':
+            report = await self.read(inventory.get_sales_report)
+            return 200, {
+                "products": [dict(zip(["ProductID", "ProductName", "TotalSales"], row)) for row in report["products"]],
+                "total_revenue": report["total_revenue"],
+                "total_cogs": report["total_cogs"],
+                "profit_margin": report["profit_margin"],
+                "monthly_sales": [dict(zip(["SaleMonth", "TotalSales"], row)) for row in report["monthly_sales"]],
+            }
+
+        return 404, {"error": f"Not found: {path}"}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inventory Management HTTP/JSON service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--database', default=inventory.DATABASE_PATH)
+    parser.add_argument('--readers', type=int, default=4, help='number of parallel read connections')
+    parser.add_argument('--batch-window-ms', type=float, default=2.0,
+                        help='how long a group commit waits for more writes after the first')
+    parser.add_argument('--batch-size', type=int, default=1000, help='maximum writes per group commit')
+    parser.add_argument('--metrics', action='store_true', help='collect timings and serve them at GET /metrics')
+    parser.add_argument('--slow-query-ms', type=float, default=100, help='log statements slower than this')
+    args = parser.parse_args()
+
+    if args.metrics:
+        metrics.enable(args.slow_query_ms)
+
+    service = InventoryService(args.database, readers=args.readers, max_delay=args.batch_window_ms / 1000,
+                               max_batch=args.batch_size)
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
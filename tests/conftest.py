@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import inventory  # noqa: E402
+
+
+# Path of a fresh database with every migration applied
+@pytest.fixture
+def database_path(tmp_path):
+    path = str(tmp_path / "inventory.db")
+    connection = inventory.connect(path)
+    inventory.migrate_schema(connection)
+    connection.close()
+    return path
+
+
+@pytest.fixture
+def connection(database_path):
+    connection = inventory.connect(database_path)
+    yield connection
+    connection.close()
@@ -0,0 +1,83 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+import analytics  # noqa: E402
+import inventory  # noqa: E402
+
+
+@pytest.fixture
+def sales(connection):
+    product_ids = [inventory.create_product(connection, f"Product {number}", 1000, 0, 1.0, 2.0)
+                   for number in range(3)]
+    for day in range(1, 11):
+        for product_id in product_ids:
+            inventory.record_sale(connection, product_id, day % 3 + 1, f"2024-01-{day:02d}")
+    return product_ids
+
+
+def rollup_quantity(snapshot):
+    return int(snapshot.rollup('month')["quantity"].sum())
+
+
+def total_quantity(connection):
+    return connection.execute("SELECT SUM(QuantitySold) FROM Sales").fetchone()[0]
+
+
+def test_refresh_reads_only_new_sales(connection, sales):
+    snapshot = analytics.SalesSnapshot()
+    assert snapshot.refresh(connection) == 30
+
+    inventory.record_sale(connection, sales[0], 2, "2024-02-01")
+    assert snapshot.refresh(connection) == 1
+    assert snapshot.refresh(connection) == 0
+    assert rollup_quantity(snapshot) == total_quantity(connection)
+
+
+def test_deleted_sale_triggers_a_reload(connection, sales):
+    snapshot = analytics.SalesSnapshot()
+    snapshot.refresh(connection)
+
+    connection.execute("DELETE FROM Sales WHERE SaleID = 5")
+    connection.commit()
+    assert snapshot.refresh(connection) == 29
+    assert rollup_quantity(snapshot) == total_quantity(connection)
+
+
+def test_sale_moved_to_another_product_triggers_a_reload(connection, sales):
+    snapshot = analytics.SalesSnapshot()
+    snapshot.refresh(connection)
+
+    connection.execute("UPDATE Sales SET ProductID = ? WHERE SaleID = 1", (sales[2],))
+    connection.commit()
+    assert snapshot.refresh(connection) == 30
+
+    by_product = snapshot.rollup_by_product('month')
+    moved = by_product["quantity"][by_product["product_id"] == sales[2]].sum()
+    assert moved == connection.execute("SELECT SUM(QuantitySold) FROM Sales WHERE ProductID = ?",
+                                       (sales[2],)).fetchone()[0]
+
+
+def test_sale_committed_during_a_refresh_does_not_force_a_reload(connection, database_path, sales):
+    snapshot = analytics.SalesSnapshot()
+    snapshot.refresh(connection)
+    inventory.record_sale(connection, sales[0], 1, "2024-02-01")
+
+    # Another till commits a sale between reading the new sales and the summary
+    append = snapshot._append
+    till = inventory.connect(database_path)
+
+    def append_then_sell(*args):
+        result = append(*args)
+        inventory.record_sale(till, sales[1], 1, "2024-02-02")
+        return result
+
+    snapshot._append = append_then_sell
+    try:
+        assert snapshot.refresh(connection) == 1
+    finally:
+        snapshot._append = append
+        till.close()
+
+    assert snapshot.refresh(connection) == 1
+    assert rollup_quantity(snapshot) == total_quantity(connection)
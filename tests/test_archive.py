@@ -0,0 +1,74 @@
+import datetime
+
+import pytest
+
+import inventory
+from forecasting import update_forecasts
+
+# Months of sales, all but the last archived by month: more partitions than SQLite
+# can attach to one connection at once (10 by default)
+MONTHS = 17
+
+
+@pytest.fixture
+def sales(connection):
+    product_ids = [inventory.create_product(connection, f"Product {number}", 100000, 0, 1.0, 2.0)
+                   for number in range(3)]
+    day = datetime.date(2023, 1, 1)
+    while day < datetime.date(2023 + MONTHS // 12, MONTHS % 12 + 1, 1):
+        for product_id in product_ids:
+            inventory.record_sale(connection, product_id, day.day % 4 + product_id, day.isoformat())
+        day += datetime.timedelta(days=3)
+    return product_ids
+
+
+def archive(connection, tmp_path):
+    last_month = datetime.date(2023 + (MONTHS - 1) // 12, (MONTHS - 1) % 12 + 1, 1)
+    inventory.archive_sales(connection, last_month.isoformat(), 'month', str(tmp_path))
+    assert len(inventory.archive_partitions(connection)) == MONTHS - 1
+
+
+def attached(connection):
+    return [name for _, name, _ in connection.execute("PRAGMA database_list")]
+
+
+def exports(connection, tmp_path):
+    contents = []
+    for number, (kind, date_from, date_to, product_ids) in enumerate([
+            ('sales', None, None, None), ('sales', "2023-03-05", "2024-02-10", [2]),
+            ('report', "2023-02-01", None, None), ('monthly', None, "2023-12-31", [1, 3])]):
+        path = tmp_path / f"export-{number}.csv"
+        inventory.export_data(connection, kind, str(path), 'csv', date_from, date_to, product_ids, chunk_size=7)
+        contents.append(path.read_text())
+    return contents
+
+
+def test_exports_read_every_partition(connection, sales, tmp_path):
+    before = exports(connection, tmp_path)
+    archive(connection, tmp_path)
+
+    assert exports(connection, tmp_path) == before
+    assert connection.execute("SELECT COUNT(*) FROM Sales").fetchone()[0] < before[0].count('\n') - 1
+    assert attached(connection) == ["main", "temp"]
+
+
+def test_forecasts_read_every_partition(connection, database_path, sales, tmp_path):
+    update_forecasts(connection, database_path, as_of="2024-05-31", workers=1, full=True)
+    before = connection.execute("SELECT * FROM ProductForecast ORDER BY ProductID").fetchall()
+    archive(connection, tmp_path)
+
+    update_forecasts(connection, database_path, as_of="2024-05-31", workers=1, full=True)
+
+    assert connection.execute("SELECT * FROM ProductForecast ORDER BY ProductID").fetchall() == before
+    assert attached(connection) == ["main", "temp"]
+
+
+def test_snapshot_reads_every_partition(connection, sales, tmp_path):
+    analytics = pytest.importorskip("analytics")
+    expected = connection.execute("SELECT COUNT(*), SUM(QuantitySold) FROM Sales").fetchone()
+    archive(connection, tmp_path)
+
+    snapshot = analytics.SalesSnapshot()
+    assert snapshot.refresh(connection) == expected[0]
+    assert int(snapshot.rollup('month')["quantity"].sum()) == expected[1]
+    assert attached(connection) == ["main", "temp"]
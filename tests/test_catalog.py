@@ -0,0 +1,93 @@
+import pytest
+
+import inventory
+
+
+@pytest.fixture
+def catalog(database_path):
+    catalog = inventory.ProductCatalog(database_path)
+    yield catalog
+    catalog.close()
+
+
+def counts(catalog):
+    stats = catalog.stats()
+    return stats["hits"], stats["misses"], stats["loads"], stats["refreshes"]
+
+
+def test_change_on_another_connection_is_picked_up(connection, catalog):
+    product_id = inventory.create_product(connection, "Widget", 10, 2, 1.0, 2.0)
+    assert catalog.get(product_id)["UnitPrice"] == 2.0
+
+    inventory.modify_product(connection, product_id, unit_price=5.0, reorder_level=3)
+    added_id = inventory.create_product(connection, "Gadget", 4, 1, 1.5, 3.0)
+
+    assert catalog.get(product_id) == {"ProductID": product_id, "ProductName": "Widget", "ReorderLevel": 3,
+                                       "UnitPrice": 5.0, "CostPerUnit": 1.0}
+    assert catalog.products() == [(product_id, "Widget", 3, 5.0, 1.0), (added_id, "Gadget", 1, 3.0, 1.5)]
+
+
+def test_stock_change_is_not_reread(connection, catalog):
+    product_id = inventory.create_product(connection, "Widget", 10, 2, 1.0, 2.0)
+    catalog.get(product_id)
+    hits, misses, loads, refreshes = counts(catalog)
+
+    inventory.modify_product(connection, product_id, quantity_in_stock=7)
+    inventory.record_sale(connection, product_id, 1, "2024-03-01")
+
+    assert catalog.get(product_id)["ProductName"] == "Widget"
+    assert counts(catalog) == (hits + 1, misses, loads, refreshes)
+
+
+def test_soft_delete_hides_the_product(connection, catalog):
+    product_id = inventory.create_product(connection, "Widget", 10, 2, 1.0, 2.0)
+    other_id = inventory.create_product(connection, "Gadget", 4, 1, 1.5, 3.0)
+    assert [row[0] for row in catalog.products()] == [product_id, other_id]
+
+    inventory.remove_product(connection, product_id)
+    catalog.invalidate(product_id)
+
+    assert catalog.get(product_id) is None
+    assert [row[0] for row in catalog.products()] == [other_id]
+
+    # The same holds once the purge has removed the row
+    while inventory.purge_deleted_products(connection):
+        pass
+    catalog.invalidate(product_id)
+    assert catalog.get(product_id) is None
+
+
+@pytest.mark.parametrize("loaded_first", [False, True])
+def test_null_columns_come_back_as_none(connection, catalog, loaded_first):
+    if loaded_first:
+        catalog.products()
+    product_id = connection.execute("INSERT INTO Product (ProductName, QuantityInStock) VALUES ('Loose', 5)").lastrowid
+    connection.commit()
+
+    assert catalog.get(product_id) == {"ProductID": product_id, "ProductName": "Loose", "ReorderLevel": None,
+                                       "UnitPrice": None, "CostPerUnit": None}
+    assert catalog.products() == [(product_id, "Loose", None, None, None)]
+
+    inventory.modify_product(connection, product_id, reorder_level=0, unit_price=0.0)
+    assert catalog.get(product_id)["ReorderLevel"] == 0
+    assert catalog.get(product_id)["UnitPrice"] == 0.0
+
+
+def test_hits_and_misses_are_counted(connection, catalog):
+    product_id = inventory.create_product(connection, "Widget", 10, 2, 1.0, 2.0)
+
+    catalog.get(product_id)
+    assert counts(catalog) == (0, 1, 1, 0)
+    catalog.get(product_id)
+    catalog.get(product_id + 1)
+    catalog.get("not a number")
+    assert counts(catalog) == (2, 1, 1, 0)
+
+    inventory.modify_product(connection, product_id, unit_price=4.0)
+    catalog.get(product_id)
+    assert counts(catalog) == (2, 2, 1, 1)
+
+    catalog.invalidate(product_id)
+    catalog.get(product_id)
+    assert counts(catalog) == (2, 3, 1, 1)
+    assert catalog.stats()["products"] == 1
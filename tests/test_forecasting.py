@@ -0,0 +1,32 @@
+import datetime
+
+import inventory
+from forecasting import update_forecasts
+
+
+def forecasts(connection):
+    return connection.execute('''
+        SELECT ProductID, ROUND(DemandRate, 9), ROUND(DemandVariance, 9), SafetyStock, ReorderPoint, ReorderQuantity
+        FROM ProductForecast
+        ORDER BY ProductID
+    ''').fetchall()
+
+
+def test_archiving_leaves_a_full_refit_unchanged(connection, database_path, tmp_path):
+    product_ids = [inventory.create_product(connection, f"Product {number}", 100000, 0, 1.0, 2.0)
+                   for number in range(3)]
+    day = datetime.date(2023, 1, 1)
+    while day <= datetime.date(2024, 12, 31):
+        for product_id in product_ids:
+            if (day.toordinal() + product_id) % 3:
+                inventory.record_sale(connection, product_id, day.toordinal() % 5 + product_id, day.isoformat())
+        day += datetime.timedelta(days=7)
+
+    update_forecasts(connection, database_path, as_of="2024-12-31", workers=1, full=True)
+    before = forecasts(connection)
+
+    moved = inventory.archive_sales(connection, "2024-07-01", 'year', str(tmp_path))
+    assert moved > 0
+    update_forecasts(connection, database_path, as_of="2024-12-31", workers=1, full=True)
+
+    assert forecasts(connection) == before
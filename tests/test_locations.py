@@ -0,0 +1,71 @@
+import pytest
+
+import inventory
+
+
+# More locations than SQLite can attach to one connection at once (10 by default)
+LOCATION_COUNT = 12
+
+
+@pytest.fixture
+def locations(connection):
+    product_id = inventory.create_product(connection, "Widget", 100, 0, 1.5, 4.0)
+    location_ids = [inventory.add_location(connection, f"Shop {number}") for number in range(LOCATION_COUNT)]
+    for location_id in location_ids:
+        inventory.set_location_stock(connection, location_id, product_id, quantity_in_stock=100)
+    return product_id, location_ids
+
+
+def test_report_adds_up_every_location(connection, locations):
+    product_id, location_ids = locations
+    inventory.record_sale(connection, product_id, 2, "2024-03-01")
+    for number, location_id in enumerate(location_ids):
+        inventory.record_location_sale(connection, location_id, product_id, number + 1, "2024-04-01")
+    location_quantity = sum(range(1, LOCATION_COUNT + 1))
+
+    report = inventory.get_sales_report(connection)
+
+    assert report["products"] == [(product_id, "Widget", 2 + location_quantity)]
+    assert report["total_revenue"] == (2 + location_quantity) * 4.0
+    assert report["monthly_sales"] == [("2024-03", 2), ("2024-04", location_quantity)]
+    assert not connection.in_transaction
+    assert [name for _, name, _ in connection.execute("PRAGMA database_list")] == ["main", "temp"]
+
+    # A later report sees the sales committed since
+    inventory.record_location_sale(connection, location_ids[-1], product_id, 5, "2024-04-02")
+    assert inventory.get_sales_report(connection)["monthly_sales"][-1] == ("2024-04", location_quantity + 5)
+
+
+def test_data_version_changes_with_any_location(database_path, connection, locations):
+    product_id, location_ids = locations
+    data_version = inventory.DataVersion(database_path)
+    try:
+        for location_id in location_ids:
+            version = data_version.current()
+            assert data_version.current() == version
+            inventory.record_location_sale(connection, location_id, product_id, 1, "2024-04-01")
+            assert data_version.current() != version
+    finally:
+        data_version.close()
+
+
+def test_exports_read_every_location(connection, locations, tmp_path):
+    product_id, location_ids = locations
+    inventory.record_sale(connection, product_id, 2, "2024-03-01")
+    for number, location_id in enumerate(location_ids):
+        inventory.record_location_sale(connection, location_id, product_id, number + 1, "2024-04-01")
+    location_quantity = sum(range(1, LOCATION_COUNT + 1))
+
+    def export(kind, date_from=None, date_to=None, product_ids=None):
+        path = tmp_path / f"{kind}.csv"
+        inventory.export_data(connection, kind, str(path), 'csv', date_from, date_to, product_ids)
+        return [line.split(',') for line in path.read_text().splitlines()[1:]]
+
+    sales = export('sales')
+    assert [(int(row[4]), int(row[2])) for row in sales] == \
+        [(1, 2)] + [(location_id, number + 1) for number, location_id in enumerate(location_ids)]
+    assert export('report', "2024-03-15") == [[str(product_id), "Widget", str(location_quantity),
+                                              str(location_quantity * 4.0), str(location_quantity * 1.5)]]
+    assert export('monthly', "2024-01-01", "2024-12-31", [product_id]) == [
+        ["2024-03", "1", "2"], ["2024-04", str(LOCATION_COUNT), str(location_quantity)]]
+    assert [name for _, name, _ in connection.execute("PRAGMA database_list")] == ["main", "temp"]
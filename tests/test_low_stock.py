@@ -0,0 +1,102 @@
+import random
+import sqlite3
+import threading
+
+import pytest
+
+import inventory
+
+
+def product_ids(connection):
+    return [row[0] for row in connection.execute("SELECT ProductID FROM Product WHERE Deleted = 0")]
+
+
+# Apply one random change that can move a product into or out of the low-stock set
+def random_step(connection, generator):
+    ids = product_ids(connection)
+    action = generator.choice(["create", "create", "stock", "reorder", "sale", "sale", "sale", "delete", "purge"])
+
+    if action == "create" or not ids:
+        inventory.create_product(connection, "Product", generator.randint(0, 20), generator.randint(0, 20), 1.0, 2.0)
+    elif action == "stock":
+        inventory.modify_product(connection, generator.choice(ids), quantity_in_stock=generator.randint(0, 20))
+    elif action == "reorder":
+        inventory.modify_product(connection, generator.choice(ids), reorder_level=generator.randint(0, 20))
+    elif action == "sale":
+        try:
+            inventory.record_sale(connection, generator.choice(ids), generator.randint(1, 5), "2024-01-01")
+        except ValueError:
+            pass
+    elif action == "delete":
+        inventory.remove_product(connection, generator.choice(ids))
+    else:
+        inventory.purge_deleted_products(connection, generator.randint(1, 10))
+
+    return action
+
+
+def low_stock_scan(connection):
+    return sorted(row[0] for row in connection.execute('''
+        SELECT ProductID FROM Product WHERE QuantityInStock <= ReorderLevel AND Deleted = 0
+    '''))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_low_stock_matches_a_full_scan_after_every_step(connection, seed):
+    generator = random.Random(seed)
+
+    for step in range(300):
+        action = random_step(connection, generator)
+        assert inventory.check_low_stock(connection) == ([], []), f"step {step} ({action}), seed {seed}"
+
+    assert inventory.count_reorder_alerts(connection) == len(low_stock_scan(connection))
+    assert sorted(row[0] for row in inventory.get_reorder_alerts(connection)) == low_stock_scan(connection)
+
+
+def test_bulk_imports_keep_low_stock_in_step(connection, tmp_path):
+    products = tmp_path / "products.csv"
+    products.write_text("ProductName,QuantityInStock,ReorderLevel,CostPerUnit,UnitPrice\n"
+                        "Low,2,5,1,2\nHigh,9,5,1,2\nEdge,5,5,1,2\n")
+    inventory.import_products(connection, str(products), 'csv', str(tmp_path / "products.rejects.csv"))
+
+    high = connection.execute("SELECT ProductID FROM Product WHERE ProductName = 'High'").fetchone()[0]
+    sales = tmp_path / "sales.csv"
+    sales.write_text(f"ProductID,QuantitySold,SaleDate\n{high},4,2024-01-01\n")
+    inventory.import_sales(connection, str(sales), 'csv', str(tmp_path / "sales.rejects.csv"))
+
+    assert inventory.check_low_stock(connection) == ([], [])
+    assert inventory.count_reorder_alerts(connection) == 3
+
+
+def test_low_stock_survives_concurrent_writers(connection, database_path):
+    errors = []
+
+    def writer(seed):
+        writer_connection = inventory.connect(database_path)
+        generator = random.Random(seed)
+        for _ in range(100):
+            try:
+                random_step(writer_connection, generator)
+            except sqlite3.OperationalError as error:
+                errors.append(error)
+        writer_connection.close()
+
+    threads = [threading.Thread(target=writer, args=(seed,)) for seed in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert inventory.check_low_stock(connection) == ([], [])
+
+
+def test_rebuild_repairs_a_drifted_low_stock_set(connection):
+    for stock in range(10):
+        inventory.create_product(connection, "Product", stock, 5, 1.0, 2.0)
+    connection.execute("DELETE FROM LowStock")
+    connection.commit()
+    assert inventory.check_low_stock(connection) != ([], [])
+
+    inventory.rebuild_aggregates(connection)
+    assert inventory.check_low_stock(connection) == ([], [])
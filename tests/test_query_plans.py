@@ -0,0 +1,30 @@
+import pytest
+
+import inventory
+
+
+def test_migrations_reach_the_current_version(connection):
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == inventory.SCHEMA_VERSION
+
+
+def test_migrating_a_current_database_changes_nothing(connection):
+    schema = connection.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall()
+    inventory.migrate_schema(connection)
+    assert connection.execute("SELECT name, sql FROM sqlite_master ORDER BY name").fetchall() == schema
+
+
+@pytest.mark.parametrize("name, sql, params, index", inventory.HOT_QUERIES,
+                         ids=[query[0] for query in inventory.HOT_QUERIES])
+def test_hot_query_uses_its_index(connection, name, sql, params, index):
+    plan = inventory.query_plan(connection, sql, params)
+    assert any(index in detail for detail in plan), f"{name}: {'; '.join(plan)}"
+
+
+# The application never runs ANALYZE, so the plans are checked without statistics, as
+# they are chosen in the field
+def test_hot_queries_keep_their_indexes_with_data(connection):
+    for number in range(50):
+        product_id = inventory.create_product(connection, f"Product {number}", 100, number % 10, 1.0, 2.0)
+        inventory.record_sale(connection, product_id, 1, f"2024-{number % 12 + 1:02d}-01")
+
+    assert inventory.check_query_plans(connection) == []
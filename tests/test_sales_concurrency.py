@@ -0,0 +1,79 @@
+import sqlite3
+import threading
+
+import pytest
+
+import inventory
+
+
+def add_product(connection, stock):
+    return inventory.create_product(connection, "Contended Product", stock, 0, 1.0, 2.0)
+
+
+def sales_of(connection, product_id):
+    return connection.execute("SELECT COUNT(*), COALESCE(SUM(QuantitySold), 0) FROM Sales WHERE ProductID = ?",
+                              (product_id,)).fetchone()
+
+
+def test_sale_above_stock_is_refused_and_changes_nothing(connection):
+    product_id = add_product(connection, 3)
+
+    with pytest.raises(ValueError):
+        inventory.record_sale(connection, product_id, 4, "2024-01-01")
+
+    assert inventory.get_product(connection, product_id)["QuantityInStock"] == 3
+    assert sales_of(connection, product_id) == (0, 0)
+
+
+def test_sale_of_a_deleted_product_is_refused(connection):
+    product_id = add_product(connection, 3)
+    inventory.remove_product(connection, product_id)
+
+    with pytest.raises(ValueError):
+        inventory.record_sale(connection, product_id, 1, "2024-01-01")
+
+
+# Sellers on their own connections race for the same stock until it runs out
+@pytest.mark.parametrize("workers, quantity", [(8, 1), (4, 3)])
+def test_concurrent_sellers_never_oversell(connection, database_path, workers, quantity):
+    stock = 200
+    product_id = add_product(connection, stock)
+    sold = [0] * workers
+
+    def sell_until_empty(index):
+        seller = inventory.connect(database_path)
+        while True:
+            try:
+                inventory.record_sale(seller, product_id, quantity, "2024-01-01")
+                sold[index] += quantity
+            except ValueError:
+                break
+            except sqlite3.OperationalError:
+                continue
+        seller.close()
+
+    threads = [threading.Thread(target=sell_until_empty, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    remaining = inventory.get_product(connection, product_id)["QuantityInStock"]
+    sale_rows, recorded = sales_of(connection, product_id)
+    assert remaining == stock % quantity
+    assert sum(sold) == recorded == stock - remaining
+    assert sale_rows == recorded // quantity
+
+
+def test_group_committed_sales_never_oversell(database_path, connection):
+    product_id = add_product(connection, 10)
+    batcher = inventory.WriteBatcher(database_path)
+    try:
+        futures = [batcher.submit_sale(product_id, 1, "2024-01-01") for _ in range(15)]
+        refused = sum(1 for future in futures if isinstance(future.exception(timeout=10), ValueError))
+    finally:
+        batcher.close()
+
+    assert refused == 5
+    assert inventory.get_product(connection, product_id)["QuantityInStock"] == 0
+    assert sales_of(connection, product_id) == (10, 10)
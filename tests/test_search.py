@@ -0,0 +1,70 @@
+import pytest
+
+import inventory
+
+
+@pytest.fixture
+def products(connection):
+    names = ["Blue Widget", "Red Widget", "Widgetry Manual", "Hex bolt with washer and spring nut", "Bolt",
+             "Café au lait mug"]
+    return {name: inventory.create_product(connection, name, 10, 2, 1.0, 2.0) for name in names}
+
+
+def names(rows):
+    return [row[1] for row in rows]
+
+
+def test_words_match_as_prefixes(connection, products):
+    assert sorted(names(inventory.search_products(connection, "wid"))) == \
+        ["Blue Widget", "Red Widget", "Widgetry Manual"]
+    assert names(inventory.search_products(connection, "blu  WID")) == ["Blue Widget"]
+    assert names(inventory.search_products(connection, "cafe")) == ["Café au lait mug"]
+    assert inventory.search_products(connection, "widgets") == []
+
+
+def test_best_matches_come_first(connection, products, monkeypatch):
+    assert names(inventory.search_products(connection, "bolt")) == ["Bolt", "Hex bolt with washer and spring nut"]
+    assert len(inventory.search_products(connection, "wid", limit=2)) == 2
+
+    # Past the ranking limit, matches are listed in ProductID order
+    monkeypatch.setattr(inventory, "SEARCH_RANK_LIMIT", 1)
+    assert names(inventory.search_products(connection, "bolt")) == ["Hex bolt with washer and spring nut", "Bolt"]
+
+
+def test_number_finds_the_product_with_that_id(connection, products):
+    product_id = products["Red Widget"]
+    numbered_id = inventory.create_product(connection, f"Adapter {product_id}", 10, 2, 1.0, 2.0)
+
+    assert [row[0] for row in inventory.search_products(connection, f" {product_id} ")] == [product_id, numbered_id]
+    assert inventory.search_products(connection, str(product_id))[0] == \
+        tuple(inventory.get_product(connection, product_id).values())
+    assert [row[0] for row in inventory.search_products(connection, "999")] == []
+
+
+def test_rename_and_delete_keep_the_index_in_step(connection, products):
+    connection.execute("UPDATE Product SET ProductName = 'Green Gizmo' WHERE ProductID = ?", (products["Blue Widget"],))
+    connection.commit()
+    assert names(inventory.search_products(connection, "blue")) == []
+    assert names(inventory.search_products(connection, "gizmo")) == ["Green Gizmo"]
+
+    inventory.remove_product(connection, products["Red Widget"])
+    assert names(inventory.search_products(connection, "red")) == []
+    assert inventory.search_products(connection, str(products["Red Widget"])) == []
+    assert names(inventory.search_products(connection, "wid")) == ["Widgetry Manual"]
+
+    while inventory.purge_deleted_products(connection):
+        pass
+    added_id = inventory.create_product(connection, "Red Widget", 10, 2, 1.0, 2.0)
+    assert [row[0] for row in inventory.search_products(connection, "red")] == [added_id]
+
+
+@pytest.mark.parametrize("text", ['"', '', '   ', '*', '- ( )'])
+def test_text_without_words_finds_nothing(connection, products, text):
+    assert inventory.search_products(connection, text) == []
+
+
+# Quotes and operators are not full-text query syntax: operators are searched as words
+def test_query_syntax_in_the_text_is_ignored(connection, products):
+    assert names(inventory.search_products(connection, '"blue" (wid*')) == ["Blue Widget"]
+    assert names(inventory.search_products(connection, 'blue OR red')) == []
+    assert names(inventory.search_products(connection, 'with AND nut')) == ["Hex bolt with washer and spring nut"]
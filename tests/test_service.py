@@ -0,0 +1,68 @@
+import asyncio
+import json
+
+import pytest
+
+import inventory
+import service
+
+
+# Send raw request bytes to the service and return (status, JSON body) of the response
+def exchange(database_path, request):
+    async def run():
+        inventory_service = service.InventoryService(database_path, readers=1)
+        server = await asyncio.start_server(inventory_service.handle_client, '127.0.0.1', 0)
+        try:
+            reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+            writer.write(request)
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout=10)
+            writer.close()
+        finally:
+            server.close()
+            inventory_service.close()
+
+        head, _, body = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5", b"1.5"])
+def test_invalid_content_length_is_rejected(database_path, length):
+    status, payload = exchange(database_path, b"POST /sales HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+    assert status == 400
+    assert payload == {"error": "Invalid Content-Length"}
+
+
+def test_oversized_body_is_rejected_before_reading_it(database_path):
+    length = str(service.MAX_BODY_SIZE + 1).encode()
+    status, _ = exchange(database_path, b"POST /sales HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n")
+    assert status == 413
+
+
+def test_valid_request_is_answered(database_path):
+    status, payload = exchange(database_path, b"GET /products/1 HTTP/1.1\r\nConnection: close\r\n\r\n")
+    assert status == 404
+    assert "does not exist" in payload["error"]
+
+
+def test_location_sale_of_deleted_product_is_refused(database_path, connection):
+    product_id = inventory.create_product(connection, "Widget", 10, 0, 1.0, 2.0)
+    location_id = inventory.add_location(connection, "Warehouse")
+    inventory.set_location_stock(connection, location_id, product_id, quantity_in_stock=10)
+    inventory.remove_product(connection, product_id)
+
+    sales = [{"ProductID": product_id, "QuantitySold": 1, "LocationID": location_id},
+             {"ProductID": product_id + 1, "QuantitySold": 1, "LocationID": location_id}]
+    body = json.dumps({"sales": sales}).encode()
+    status, payload = exchange(database_path, b"POST /sales HTTP/1.1\r\nConnection: close\r\nContent-Length: "
+                               + str(len(body)).encode() + b"\r\n\r\n" + body)
+
+    assert status == 200
+    assert [result["Error"] for result in payload["results"]] == [
+        f"Product with Product ID {missing_id} does not exist. Please enter a valid Product ID."
+        for missing_id in (product_id, product_id + 1)]
+    assert inventory.get_location_stock(connection, location_id, product_id) is None
+    with inventory.location_connection(connection, location_id) as shard:
+        assert shard.execute("SELECT COUNT(*) FROM Sales").fetchone()[0] == 0
@@ -0,0 +1,30 @@
+import inventory
+
+
+def monthly_export(connection, tmp_path, date_from=None):
+    path = tmp_path / "monthly.csv"
+    inventory.export_data(connection, 'monthly', str(path), 'csv', date_from)
+    return path.read_text()
+
+
+def test_monthly_totals_agree_until_and_after_the_purge(connection, tmp_path):
+    product_ids = [inventory.create_product(connection, f"Product {number}", 10, 0, 1.0, 2.0) for number in range(10)]
+    for product_id in product_ids:
+        inventory.record_sale(connection, product_id, 1, "2024-03-01")
+    inventory.remove_product(connection, product_ids[0])
+
+    # The product leaves the per-product figures at once; its sales stay in the
+    # monthly totals, by either export path, until they are purged
+    report = inventory.get_sales_report(connection)
+    assert len(report["products"]) == 9
+    assert report["total_revenue"] == 18
+    assert report["monthly_sales"] == [("2024-03", 10)]
+    assert monthly_export(connection, tmp_path) == monthly_export(connection, tmp_path, "2024-01-01") == \
+        "SaleMonth,SaleCount,TotalSales\n2024-03,10,10\n"
+
+    while inventory.purge_deleted_products(connection):
+        pass
+
+    assert inventory.get_sales_report(connection)["monthly_sales"] == [("2024-03", 9)]
+    assert monthly_export(connection, tmp_path) == monthly_export(connection, tmp_path, "2024-01-01") == \
+        "SaleMonth,SaleCount,TotalSales\n2024-03,9,9\n"
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+import inventory
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def movements(connection, product_id):
+    return connection.execute('''
+        SELECT Kind, Change
+        FROM StockMovement
+        WHERE ProductID = ?
+        ORDER BY MovementID
+    ''', (product_id,)).fetchall()
+
+
+def test_purge_keeps_the_movements_of_the_product(connection):
+    product_id = inventory.create_product(connection, "Widget", 10, 0, 1.0, 2.0)
+    for _ in range(5):
+        inventory.record_sale(connection, product_id, 1, "2024-03-01")
+    inventory.remove_product(connection, product_id)
+    history = movements(connection, product_id)
+    last_movement_id = connection.execute("SELECT MAX(MovementID) FROM StockMovement").fetchone()[0]
+
+    while inventory.purge_deleted_products(connection, chunk_size=2):
+        pass
+
+    assert connection.execute("SELECT 1 FROM Product WHERE ProductID = ?", (product_id,)).fetchone() is None
+    assert history[0] == ('initial', 10) and history[-1] == ('delete', -5)
+    assert movements(connection, product_id) == history
+
+    # The ID is not reused, so the movements never become another product's
+    other_id = inventory.create_product(connection, "Gadget", 3, 0, 1.0, 2.0)
+    assert other_id > product_id
+    assert connection.execute("SELECT MIN(MovementID) FROM StockMovement WHERE ProductID = ?",
+                              (other_id,)).fetchone()[0] > last_movement_id
+
+
+def test_migration_converts_movement_times_to_utc(tmp_path, new_york):
+    connection = inventory.connect(str(tmp_path / "inventory.db"))
+    connection.execute("PRAGMA foreign_keys = OFF")
+    for number, migration in enumerate(inventory.SCHEMA_MIGRATIONS[:12], start=1):
+        connection.executescript(f"BEGIN; {migration} PRAGMA user_version = {number}; COMMIT;")
+    connection.execute("PRAGMA foreign_keys = ON")
+    product_id = inventory.create_product(connection, "Widget", 10, 0, 1.0, 2.0)
+    # 20:30 in New York on 1 July is 00:30 UTC on 2 July
+    connection.execute("INSERT INTO StockMovement (ProductID, Change, Kind, MovedAt) VALUES (?, 5, 'restock', ?)",
+                       (product_id, "2024-07-01 20:30:00"))
+    removed_id = connection.execute("INSERT INTO StockMovement (ProductID, Change, Kind) VALUES (?, 1, 'restock')",
+                                    (product_id,)).lastrowid
+    connection.execute("DELETE FROM StockMovement WHERE MovementID = ?", (removed_id,))
+    connection.commit()
+
+    inventory.migrate_schema(connection)
+
+    assert connection.execute("SELECT MovedAt FROM StockMovement WHERE Kind = 'restock'").fetchone()[0] == \
+        "2024-07-02 00:30:00"
+    assert connection.execute("PRAGMA foreign_key_list(StockMovement)").fetchall() == []
+    assert inventory.get_stock_at(connection, product_id, "2024-06-30") == 0
+    assert inventory.get_stock_at(connection, product_id, "2024-07-01") == 5
+
+    inventory.modify_product(connection, product_id, quantity_in_stock=20)
+    movement_id, age = connection.execute('''
+        SELECT MovementID, julianday('now') - julianday(MovedAt)
+        FROM StockMovement
+        ORDER BY MovementID DESC
+        LIMIT 1
+    ''').fetchone()
+    assert movement_id > removed_id
+    assert abs(age) < 1 / 24 / 60
+    connection.close()
+
+
+def test_snapshot_skips_purged_products(connection):
+    purged_id = inventory.create_product(connection, "Widget", 10, 0, 1.0, 2.0)
+    kept_id = inventory.create_product(connection, "Gadget", 4, 0, 1.0, 2.0)
+    inventory.remove_product(connection, purged_id)
+    while inventory.purge_deleted_products(connection):
+        pass
+
+    assert inventory.snapshot_stock(connection) == 1
+    assert connection.execute("SELECT ProductID FROM StockSnapshot").fetchall() == [(kept_id,)]
+
+
+def test_stock_at_a_past_date_outlives_the_purge(connection):
+    product_id = inventory.create_product(connection, "Widget", 0, 0, 1.0, 2.0)
+    connection.executemany("INSERT INTO StockMovement (ProductID, Change, Kind, MovedAt) VALUES (?, ?, ?, ?)",
+                           [(product_id, 10, 'restock', "2024-01-01 12:00:00"),
+                            (product_id, -3, 'sale', "2024-02-01 12:00:00"),
+                            (product_id, -7, 'adjustment', "2024-03-01 12:00:00")])
+    connection.commit()
+    days = ["2023-12-31", "2024-01-15", "2024-02-15", "2024-03-15"]
+    history = [inventory.get_stock_at(connection, product_id, day) for day in days]
+
+    inventory.remove_product(connection, product_id)
+    while inventory.purge_deleted_products(connection):
+        pass
+
+    assert history == [0, 10, 7, 0]
+    assert [inventory.get_stock_at(connection, product_id, day) for day in days] == history
+    assert inventory.get_stock_at(connection, product_id + 1, "2024-01-15") is None